@@ -0,0 +1,97 @@
+import operator
+import RBTree
+
+class AggregateNode(RBTree.Node):
+
+    ''' Node of Red-Black Tree with aggregate of values in its subtree '''
+
+    __slots__ = ('agg',)
+
+    def __init__(self, key, value, left=None, right=None, parent=None, red=True):
+        super().__init__(key, value, left, right, parent, red)
+        self.agg = value # Aggregate of subtree values
+
+
+class AggregateRBTree(RBTree.RBTree):
+
+    ''' Red-Black Tree that keeps aggregate of values in every subtree. combine must be associative, identity is its neutral element '''
+
+    node_type = AggregateNode
+
+    def __init__(self, combine=operator.add, identity=0, root=None):
+        self.combine = combine # Associative function of two aggregates
+        self.identity = identity # Aggregate of empty subtree
+        super().__init__(root)
+        self.nil.agg = identity
+        if self.root is not None: # If root is passed
+            self.update(self.root)
+
+    def update(self, node):
+
+        ''' Recompute subtree size and aggregate of node from its children '''
+
+        node.size = node.left.size + node.right.size + 1
+        node.agg = self.combine(self.combine(node.left.agg, node.value), node.right.agg)
+
+    def update_path(self, node, delta):
+
+        ''' Change subtree sizes by delta and recompute aggregates from node up to the root '''
+
+        combine = self.combine
+        while node is not None:
+            node.size += delta
+            node.agg = combine(combine(node.left.agg, node.value), node.right.agg)
+            node = node.parent
+
+    def set_value(self, node, value):
+
+        ''' Set value of node and repair aggregates of its ancestors '''
+
+        node.value = value
+        self.update_path(node, 0)
+
+    def reduce(self):
+
+        ''' Aggregate of all values '''
+
+        if self.empty(): # If tree is empty
+            return self.identity
+        return self.root.agg
+
+    def reduce_range(self, lo=None, hi=None, inclusive=(True, False)):
+
+        ''' Aggregate of values with keys between lo and hi in O(log n). None bound means unbounded '''
+
+        if self.empty(): # If tree is empty
+            return self.identity
+        combine = self.combine
+        nil = self.nil
+        above_lo = lambda node: lo is None or node.key > lo or inclusive[0] and node.key == lo # Key is not below lower bound
+        below_hi = lambda node: hi is None or node.key < hi or inclusive[1] and node.key == hi # Key is not above upper bound
+        node = self.root
+        while node != nil: # Find the highest node in range, bounds split there
+            if not above_lo(node):
+                node = node.right
+            elif not below_hi(node):
+                node = node.left
+            else:
+                break
+        if node == nil: # No keys in range
+            return self.identity
+        left = self.identity # Aggregate of left subtree keys in range
+        cur = node.left
+        while cur != nil:
+            if above_lo(cur): # Node and its right subtree are in range, they go after keys gathered below
+                left = combine(combine(cur.value, cur.right.agg), left)
+                cur = cur.left
+            else:
+                cur = cur.right
+        right = self.identity # Aggregate of right subtree keys in range
+        cur = node.right
+        while cur != nil:
+            if below_hi(cur): # Left subtree and node are in range, they go before keys gathered below
+                right = combine(right, combine(cur.left.agg, cur.value))
+                cur = cur.right
+            else:
+                cur = cur.left
+        return combine(combine(left, node.value), right)
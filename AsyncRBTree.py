@@ -0,0 +1,183 @@
+import asyncio
+import RBTree
+
+class AsyncRBTree:
+
+    ''' asyncio facade of Red-Black Tree. Writers are serialized by asyncio lock, long operations give control
+        back to the event loop every chunk nodes or run in executor, so other tasks don't stall '''
+
+    def __init__(self, tree=None, chunk=1000, executor=None):
+        self.tree = tree if tree is not None else RBTree.RBTree()
+        self.chunk = chunk # Number of nodes processed between yields to the event loop
+        self.executor = executor # Executor for offloaded work, None means the default executor of the loop
+        self.lock = asyncio.Lock() # Held by writers and by reads that must not see changes in the middle
+
+    async def offload(self, func, *args):
+
+        ''' Run func(*args) in executor '''
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def insert(self, key, value):
+
+        ''' Insertion of [key, value] pair '''
+
+        async with self.lock:
+            self.tree.insert(key, value)
+
+    async def upsert(self, key, value):
+
+        ''' Insert [key, value] pair or set value of existing key. Returns True if pair was inserted '''
+
+        async with self.lock:
+            return self.tree.upsert(key, value)
+
+    async def remove(self, key):
+
+        ''' Deleting pair by key '''
+
+        async with self.lock:
+            self.tree.remove(key)
+
+    async def set(self, key, value):
+
+        ''' Set value of existing key '''
+
+        async with self.lock:
+            self.tree[key] = value
+
+    async def clear(self):
+
+        ''' Clear tree. It's O(1), so it runs right in the event loop '''
+
+        async with self.lock:
+            self.tree.clear()
+
+    async def insert_many(self, keys, values=None):
+
+        ''' Insert pairs in chunks, yielding to the event loop between them. Readers may see a part of the pairs '''
+
+        pairs = self.tree.batch_pairs(keys, values)
+        async with self.lock:
+            for start in range(0, len(pairs), self.chunk):
+                self.tree.insert_many(pairs[start:start + self.chunk])
+                await asyncio.sleep(0)
+
+    async def remove_many(self, keys):
+
+        ''' Remove keys in chunks, yielding to the event loop between them '''
+
+        keys = self.tree.batch_keys(keys)
+        async with self.lock:
+            for start in range(0, len(keys), self.chunk):
+                self.tree.remove_many(keys[start:start + self.chunk])
+                await asyncio.sleep(0)
+
+    async def load(self, pairs):
+
+        ''' Replace contents with (key, value) pairs in any order. The new tree is built in executor '''
+
+        tree = await self.offload(type(self.tree).from_unsorted, pairs)
+        async with self.lock:
+            self.tree = tree
+
+    async def copy(self):
+
+        ''' Copy of the tree made in executor. Writers wait until it's done '''
+
+        async with self.lock:
+            return await self.offload(self.tree.copy)
+
+    def find(self, key):
+
+        ''' Find value by key. O(log n), so it doesn't need to yield '''
+
+        return self.tree.find(key)
+
+    def get(self, key, default=None):
+
+        ''' Find value by key or return default '''
+
+        node = self.tree.find_node(key)
+        return default if node == self.tree.nil else node.value
+
+    def __contains__(self, key):
+
+        ''' Check if tree has a pair with key using in operator '''
+
+        return key in self.tree
+
+    def __len__(self):
+
+        ''' Number of pairs in the tree '''
+
+        return len(self.tree)
+
+    async def items(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Async iterator over (key, value) pairs with keys between lo and hi.
+            Yields to the event loop every chunk pairs and continues after the last key, so pairs changed in between may be seen '''
+
+        while True:
+            part = [] # Pairs are taken before yielding, so changes made by consumer don't break traversal
+            for node in self.tree.range_nodes(lo, hi, inclusive, reverse):
+                part.append((node.key, node.value))
+                if len(part) == self.chunk:
+                    break
+            for pair in part:
+                yield pair
+            if len(part) < self.chunk: # Range is over
+                return
+            # Continue after the last key, tree may change while we are away
+            if reverse:
+                hi, inclusive = part[-1][0], (inclusive[0], False)
+            else:
+                lo, inclusive = part[-1][0], (False, inclusive[1])
+            await asyncio.sleep(0)
+
+    async def keys(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Async iterator over keys between lo and hi '''
+
+        async for key, value in self.items(lo, hi, inclusive, reverse):
+            yield key
+
+    async def values(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Async iterator over values with keys between lo and hi '''
+
+        async for key, value in self.items(lo, hi, inclusive, reverse):
+            yield value
+
+    def __aiter__(self):
+
+        ''' Iterate over keys in ascending order using async for '''
+
+        return self.keys()
+
+    async def traverse(self):
+
+        ''' Nodes in depth-first order. Holds the lock, so the tree doesn't change between chunks '''
+
+        nodes = []
+        async with self.lock:
+            if self.tree.empty(): # If tree is empty return empty list
+                return nodes
+            it = RBTree.DFT_Iterator(self.tree)
+            while it.has_next():
+                nodes.append(next(it))
+                if len(nodes) % self.chunk == 0:
+                    await asyncio.sleep(0)
+        return nodes
+
+    async def get_keys(self):
+
+        ''' Get keys of tree in the same order as RBTree.get_keys '''
+
+        return [node.key for node in await self.traverse()]
+
+    async def get_values(self):
+
+        ''' Get values of tree in the same order as RBTree.get_values '''
+
+        return [node.value for node in await self.traverse()]
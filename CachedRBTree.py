@@ -0,0 +1,327 @@
+import copy
+import itertools
+import RBTree
+
+POLICIES = ('lru', 'lfu', 'size')
+
+
+class CacheNode(RBTree.Node):
+
+    ''' Node of Red-Black Tree that is also an entry of the recency list of the cache '''
+
+    __slots__ = ('older', 'newer', 'hits', 'weight', 'rank')
+
+    def __init__(self, key, value, left=None, right=None, parent=None, red=True):
+        super().__init__(key, value, left, right, parent, red)
+        self.older = None # Less recently used node
+        self.newer = None # More recently used node
+        self.hits = 0 # Number of uses
+        self.weight = 0 # Part of capacity taken by the pair
+        self.rank = None # Key of node in eviction index
+
+
+class CachedRBTree(RBTree.RBTree):
+
+    ''' Red-Black Tree map with capacity. Pairs over capacity are evicted by policy:
+        lru evicts the least recently used pair, lfu the least frequently used one, size the heaviest one.
+        weight(key, value) gives part of capacity taken by pair, 1 by default.
+        Nodes are linked in recency order, so a use costs O(1) for lru. lfu and size keep eviction order in a second tree.
+        find, get and assignment count as uses, peek and iteration don't. Set operations, split and join are not supported '''
+
+    node_type = CacheNode
+
+    def __init__(self, capacity, policy='lru', weight=None):
+        if policy not in POLICIES:
+            raise Exception(f"Unknown policy {policy}")
+        super().__init__()
+        self.capacity = capacity
+        self.policy = policy
+        self.weight = weight
+        self.node_type = self.new_node # Every new node enters the recency list
+        self.oldest = None # Head of recency list
+        self.newest = None # Tail of recency list
+        self.total = 0 # Sum of weights of pairs
+        self.index = RBTree.RBTree() # Rank -> node, the smallest rank is evicted first. Unused by lru
+        self.tick = itertools.count() # Breaks ties between equal ranks by age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_sorted(cls, iterable, **kwargs):
+
+        ''' Build tree from (key, value) pairs sorted by key in O(n), then evict pairs over capacity. kwargs are passed to the constructor '''
+
+        tree = super().from_sorted(iterable, **kwargs)
+        tree.evict()
+        return tree
+
+    def weigh(self, key, value):
+
+        ''' Part of capacity taken by pair. Raises exception if the pair can't fit at all '''
+
+        weight = 1 if self.weight is None else self.weight(key, value)
+        if weight > self.capacity:
+            raise Exception(f"Pair with key={key} is bigger than capacity {self.capacity}")
+        return weight
+
+    def new_node(self, key, value, left=None, right=None, parent=None, red=True):
+
+        ''' Create node and add it to the recency list as the most recently used '''
+
+        weight = self.weigh(key, value)
+        node = CacheNode(key, value, left, right, parent, red)
+        node.weight = weight
+        self.total += weight
+        self.link(node)
+        self.rerank(node)
+        return node
+
+    def link(self, node):
+
+        ''' Put node to the end of recency list '''
+
+        node.older, node.newer = self.newest, None
+        if self.newest is None:
+            self.oldest = node
+        else:
+            self.newest.newer = node
+        self.newest = node
+
+    def unlink(self, node):
+
+        ''' Take node out of recency list '''
+
+        if node.older is None:
+            self.oldest = node.newer
+        else:
+            node.older.newer = node.newer
+        if node.newer is None:
+            self.newest = node.older
+        else:
+            node.newer.older = node.older
+        node.older = node.newer = None
+
+    def rerank(self, node):
+
+        ''' Move node to its place in eviction index '''
+
+        if self.policy == 'lru':
+            return
+        if node.rank is not None:
+            self.index.remove(node.rank)
+        node.rank = (node.hits if self.policy == 'lfu' else -node.weight, next(self.tick))
+        self.index.insert(node.rank, node)
+
+    def use(self, node):
+
+        ''' Count use of node '''
+
+        node.hits += 1
+        if node != self.newest: # O(1) move to the end of recency list
+            self.unlink(node)
+            self.link(node)
+        if self.policy == 'lfu':
+            self.rerank(node)
+
+    def forget(self, node):
+
+        ''' Drop cache data of node that is being deleted '''
+
+        self.unlink(node)
+        self.total -= node.weight
+        if node.rank is not None:
+            self.index.remove(node.rank)
+            node.rank = None
+
+    def move(self, source, target):
+
+        ''' Give cache data of source node to target node that took its pair '''
+
+        target.older, target.newer = source.older, source.newer
+        if source.older is None:
+            self.oldest = target
+        else:
+            source.older.newer = target
+        if source.newer is None:
+            self.newest = target
+        else:
+            source.newer.older = target
+        target.hits, target.weight, target.rank = source.hits, source.weight, source.rank
+        if target.rank is not None:
+            self.index.find_node(target.rank).value = target
+
+    def remove_node(self, node_to_delete):
+
+        ''' Deleting node of the tree and its cache data. Node that takes pair of another node takes its cache data too '''
+
+        if node_to_delete.left != self.nil and node_to_delete.right != self.nil: # Successor takes place of the node
+            spliced = self.minimum(node_to_delete.right)
+        elif node_to_delete == self.root and node_to_delete.left != self.nil: # Root takes pair of its only child
+            spliced = node_to_delete.left
+        elif node_to_delete == self.root and node_to_delete.right != self.nil:
+            spliced = node_to_delete.right
+        else:
+            spliced = node_to_delete
+        self.forget(node_to_delete)
+        super().remove_node(node_to_delete)
+        if spliced != node_to_delete:
+            self.move(spliced, node_to_delete)
+
+    def set_value(self, node, value):
+
+        ''' Set value of node. Counts as a use '''
+
+        weight = self.weigh(node.key, value)
+        super().set_value(node, value)
+        self.total += weight - node.weight
+        node.weight = weight
+        self.use(node)
+        if self.policy == 'size':
+            self.rerank(node)
+
+    def victim(self, keep=None):
+
+        ''' Node that is evicted next. Pair with key keep is skipped '''
+
+        if self.policy == 'lru':
+            node = self.oldest
+            return node.newer if keep is not None and node.key == keep else node
+        for rank, node in self.index.items(): # Usually the first node
+            if keep is None or node.key != keep:
+                return node
+
+    def evict(self, keep=None):
+
+        ''' Delete pairs by policy while total weight is over capacity. Pair with key keep stays '''
+
+        while self.total > self.capacity:
+            self.remove_node(self.victim(keep))
+            self.evictions += 1
+
+    def insert(self, key, value):
+
+        ''' Insertion of [key, value] pair. Evicts other pairs if cache is full '''
+
+        super().insert(key, value)
+        self.evict(key) # New pair has no uses yet, lfu would evict it first
+
+    def upsert(self, key, value):
+
+        ''' Insert [key, value] pair or set value of existing key. Evicts other pairs if cache is full. Returns True if pair was inserted '''
+
+        result = super().upsert(key, value)
+        self.evict(key)
+        return result
+
+    def insert_many(self, keys, values=None):
+
+        ''' Insert many pairs, then evict pairs over capacity. Returns list of flags: True if pair was inserted '''
+
+        result = super().insert_many(keys, values)
+        self.evict()
+        return result
+
+    def update_many(self, keys, values=None):
+
+        ''' Set values of many existing keys, then evict pairs over capacity. Returns list of flags: True if key was found '''
+
+        result = super().update_many(keys, values)
+        self.evict()
+        return result
+
+    def __setitem__(self, key, value):
+
+        ''' Set value of existing key using [] operator. Evicts pairs if cache grows over capacity '''
+
+        super().__setitem__(key, value)
+        self.evict()
+
+    def find(self, key):
+
+        ''' Find value by key and count the use. Returns None if key is absent '''
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        return self.get(key)
+
+    def get(self, key, default=None):
+
+        ''' Find value by key and count the use. Returns default if key is absent '''
+
+        node = self.find_node(key)
+        if node == self.nil:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.use(node)
+        return node.value
+
+    def peek(self, key, default=None):
+
+        ''' Find value by key without counting the use '''
+
+        node = self.find_node(key)
+        return default if node == self.nil else node.value
+
+    def recency(self, reverse=False):
+
+        ''' Iterate over (key, value) pairs from the least recently used one '''
+
+        node = self.newest if reverse else self.oldest
+        while node is not None:
+            yield node.key, node.value
+            node = node.older if reverse else node.newer
+
+    def set_operation(self, other, operation, *args):
+
+        ''' Set operations would move nodes between recency lists, so union, intersection and differences are not supported '''
+
+        raise Exception("Set operations are not supported by caches")
+
+    def split(self, key):
+
+        ''' Not supported, halves would share recency list and eviction index '''
+
+        raise Exception("Split is not supported by caches")
+
+    @classmethod
+    def join(cls, left, key, value, right):
+
+        ''' Not supported, trees have their own recency lists '''
+
+        raise Exception("Join is not supported by caches")
+
+    def clear(self):
+
+        ''' Clear tree and cache data '''
+
+        super().clear()
+        self.oldest = self.newest = None
+        self.total = 0
+        self.index.clear()
+
+    def copy(self):
+
+        ''' Copy of the cache with the same recency order. Use counts start over '''
+
+        tree = type(self)(self.capacity, self.policy, self.weight)
+        for key, value in self.recency():
+            tree.insert(key, value)
+        return tree
+
+    def __deepcopy__(self, memo):
+
+        ''' Copy of the cache with copied keys and values for copy.deepcopy '''
+
+        tree = type(self)(self.capacity, self.policy, self.weight)
+        memo[id(self)] = tree
+        for key, value in self.recency():
+            tree.insert(copy.deepcopy(key, memo), copy.deepcopy(value, memo))
+        return tree
+
+    def cache_stats(self):
+
+        ''' Counters of the cache '''
+
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self), 'weight': self.total, 'capacity': self.capacity}
@@ -0,0 +1,223 @@
+import contextlib
+import threading
+import PersistentRBTree
+import RBTree
+
+class RWLock:
+
+    ''' Readers-writer lock. Many readers or one writer hold it at a time. Waiting writer blocks new readers, so writers don't starve '''
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0 # Number of readers holding the lock
+        self.writer = False # Writer holds the lock
+        self.waiting = 0 # Number of writers waiting for the lock
+
+    def acquire_read(self):
+        with self.condition:
+            while self.writer or self.waiting:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        with self.condition:
+            self.waiting += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting -= 1
+            self.writer = True
+
+    def release_write(self):
+        with self.condition:
+            self.writer = False
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def read(self):
+
+        ''' Hold lock as a reader inside with block '''
+
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write(self):
+
+        ''' Hold lock as a writer inside with block '''
+
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class ConcurrentRBTree:
+
+    ''' Thread-safe Red-Black Tree map.
+        By default RBTree is guarded by readers-writer lock. With snapshot_reads=True writers change PersistentRBTree
+        and publish its snapshot on commit, readers use the last published snapshot and never wait for writers '''
+
+    def __init__(self, snapshot_reads=False):
+        self.snapshot_reads = snapshot_reads
+        self.lock = RWLock()
+        if snapshot_reads:
+            self.tree = PersistentRBTree.PersistentRBTree() # Version changed by writers
+            self.version = self.tree.snapshot() # Last committed version, used by readers
+        else:
+            self.tree = RBTree.RBTree()
+
+    @contextlib.contextmanager
+    def batch(self):
+
+        ''' Hold write lock and yield the tree to make several changes in one commit.
+            With snapshot reads the changes become visible to readers together and are dropped if the block raises '''
+
+        with self.lock.write():
+            if not self.snapshot_reads:
+                yield self.tree
+                return
+            try:
+                yield self.tree
+            except BaseException:
+                self.tree = self.version.snapshot() # Roll back to the last committed version
+                raise
+            self.version = self.tree.snapshot() # Commit, assignment is atomic for readers
+
+    @contextlib.contextmanager
+    def read(self):
+
+        ''' Yield consistent tree for several reads. With snapshot reads it's the last committed version and no lock is held '''
+
+        if self.snapshot_reads:
+            yield self.version
+        else:
+            with self.lock.read():
+                yield self.tree
+
+    def snapshot(self):
+
+        ''' Last committed version of PersistentRBTree. Available only with snapshot reads '''
+
+        if not self.snapshot_reads:
+            raise Exception("Snapshots need snapshot_reads=True")
+        return self.version
+
+    def insert(self, key, value):
+
+        ''' Insertion of [key, value] pair '''
+
+        with self.batch() as tree:
+            tree.insert(key, value)
+
+    def upsert(self, key, value):
+
+        ''' Insert [key, value] pair or set value of existing key. Returns True if pair was inserted '''
+
+        with self.batch() as tree:
+            return tree.upsert(key, value)
+
+    def remove(self, key):
+
+        ''' Deleting pair by key '''
+
+        with self.batch() as tree:
+            tree.remove(key)
+
+    def update(self, pairs):
+
+        ''' Insert or assign (key, value) pairs in one commit '''
+
+        with self.batch() as tree:
+            for key, value in pairs:
+                tree.upsert(key, value)
+
+    def discard(self, keys):
+
+        ''' Remove existing keys of keys in one commit '''
+
+        with self.batch() as tree:
+            for key in keys:
+                if key in tree:
+                    tree.remove(key)
+
+    def find(self, key):
+
+        ''' Find value by key. Returns None if key is absent in both modes '''
+
+        with self.read() as tree:
+            return tree.find(key) # Both trees raise exception if they are empty
+
+    def get(self, key, default=None):
+
+        ''' Find value by key or return default '''
+
+        with self.read() as tree:
+            node = tree.find_node(key)
+            if node is None or node is getattr(tree, 'nil', None): # PersistentRBTree returns None, RBTree returns nil
+                return default
+            return node.value
+
+    def items(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterator over (key, value) pairs with keys between lo and hi.
+            With snapshot reads it's lazy over the committed version, otherwise pairs are collected under read lock '''
+
+        if self.snapshot_reads:
+            return self.version.irange_items(lo, hi, inclusive, reverse)
+        with self.lock.read():
+            return iter(list(self.tree.irange_items(lo, hi, inclusive, reverse)))
+
+    def irange(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterator over keys between lo and hi '''
+
+        return (key for key, value in self.items(lo, hi, inclusive, reverse))
+
+    def __getitem__(self, key):
+
+        ''' Get value by key using [] operator '''
+
+        return self.find(key)
+
+    def __setitem__(self, key, value):
+
+        ''' Set value of existing key using [] operator '''
+
+        with self.batch() as tree:
+            tree[key] = value
+
+    def __delitem__(self, key):
+
+        ''' Delete pair by key using del operator '''
+
+        self.remove(key)
+
+    def __contains__(self, key):
+
+        ''' Check if tree has a pair with key using in operator '''
+
+        with self.read() as tree:
+            return key in tree
+
+    def __len__(self):
+
+        ''' Number of pairs in the tree '''
+
+        with self.read() as tree:
+            return len(tree)
+
+    def __iter__(self):
+
+        ''' Iterate over keys in ascending order '''
+
+        return self.irange()
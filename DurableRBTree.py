@@ -0,0 +1,276 @@
+import os
+import pickle
+import re
+import struct
+import threading
+import zlib
+import RBTree
+import RBTreeFile
+
+# Directory of durable tree holds generations of snapshots and logs:
+#   snapshot-N.rbt   RBTreeFile dump of the tree at the start of wal-N.log. There is no snapshot-0, generation 0 starts empty
+#   wal-N.log        records of changes made after snapshot-N, replayed in order on recovery
+# Record is its length and CRC32 followed by pickled (operation, key, value). A torn record at the end of the log is dropped
+
+RECORD = struct.Struct('<II')
+FILE = re.compile(r'(snapshot|wal)-(\d+)\.(rbt|log)$')
+
+
+class DurableRBTree:
+
+    ''' Red-Black Tree whose changes are appended to a write-ahead log in directory.
+        Log is fsynced after sync_every records and every sync_interval seconds if it's set.
+        compact() starts a new log and writes a snapshot in background, it starts by itself when log grows over compact_bytes.
+        Snapshot is built from the previous snapshot and logs, so writers are blocked only while the log is switched '''
+
+    def __init__(self, directory, sync_every=1, sync_interval=None, compact_bytes=None, tree_type=RBTree.RBTree):
+        self.directory = directory
+        self.sync_every = sync_every # Number of records written before fsync, 1 makes every change durable at once
+        self.compact_bytes = compact_bytes # Log size that starts background compaction, None disables it
+        self.tree_type = tree_type
+        self.lock = threading.RLock() # Guards tree, log and generation
+        self.pending = 0 # Records written after the last fsync
+        self.compaction = None # Thread of running compaction
+        os.makedirs(directory, exist_ok=True)
+        self.recover()
+        self.closed = threading.Event()
+        self.syncer = None
+        if sync_interval is not None: # Group commit by time
+            self.syncer = threading.Thread(target=self.sync_loop, args=(sync_interval,), daemon=True)
+            self.syncer.start()
+
+    def path(self, kind, generation):
+        return os.path.join(self.directory, f"{kind}-{generation}.{'rbt' if kind == 'snapshot' else 'log'}")
+
+    def generations(self, kind):
+
+        ''' Sorted generations of files of kind in directory '''
+
+        result = []
+        for name in os.listdir(self.directory):
+            match = FILE.match(name)
+            if match and match.group(1) == kind:
+                result.append(int(match.group(2)))
+        return sorted(result)
+
+    def recover(self):
+
+        ''' Load the newest snapshot and replay logs written after it '''
+
+        self.tree = self.load_generation()
+        self.generation = max(self.generations('snapshot') + self.generations('wal') + [0])
+        self.log = open(self.path('wal', self.generation), 'ab')
+
+    def load_generation(self, generation=None):
+
+        ''' Tree as it was at the start of log of generation, the latest state if generation is None '''
+
+        snapshots = [old for old in self.generations('snapshot') if generation is None or old <= generation]
+        base = snapshots[-1] if snapshots else 0
+        tree = self.tree_type.load(self.path('snapshot', base)) if snapshots else self.tree_type()
+        for old in self.generations('wal'):
+            if old >= base and (generation is None or old < generation):
+                self.replay(self.path('wal', old), tree)
+        return tree
+
+    def replay(self, path, tree):
+
+        ''' Apply records of log to tree. Log is cut at the first damaged record '''
+
+        with open(path, 'rb') as file:
+            data = file.read()
+        offset = 0
+        while offset + RECORD.size <= len(data):
+            length, crc = RECORD.unpack_from(data, offset)
+            payload = data[offset + RECORD.size:offset + RECORD.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc: # Torn write of the last record
+                break
+            self.apply(tree, *pickle.loads(payload))
+            offset += RECORD.size + length
+        if offset < len(data):
+            with open(path, 'r+b') as file:
+                file.truncate(offset)
+
+    def apply(self, tree, operation, key=None, value=None):
+
+        ''' Make logged change of tree '''
+
+        if operation == 'insert':
+            tree.insert(key, value)
+        elif operation == 'upsert':
+            return tree.upsert(key, value)
+        elif operation == 'set':
+            tree[key] = value
+        elif operation == 'remove':
+            tree.remove(key)
+        elif operation == 'clear':
+            tree.clear()
+        else:
+            raise Exception(f"Unknown operation {operation}")
+
+    def write(self, operation, key=None, value=None):
+
+        ''' Append record of the change to the log, then change the tree. Record of a failed change is cut off the log '''
+
+        payload = pickle.dumps((operation, key, value)) # Pairs that can't be logged don't change the tree
+        with self.lock:
+            offset = self.log.tell()
+            self.log.write(RECORD.pack(len(payload), zlib.crc32(payload)) + payload) # Tree is unchanged if the log can't be written
+            try:
+                result = self.apply(self.tree, operation, key, value)
+            except Exception:
+                self.log.truncate(offset) # Duplicate or missing key, recovery must not replay it
+                raise
+            self.pending += 1
+            if self.pending >= self.sync_every:
+                self.sync()
+            if self.compact_bytes is not None and self.log.tell() >= self.compact_bytes and self.compaction is None:
+                self.compact()
+            return result
+
+    def sync(self):
+
+        ''' Make all written records durable '''
+
+        with self.lock:
+            if self.pending:
+                self.log.flush()
+                os.fsync(self.log.fileno())
+                self.pending = 0
+
+    def sync_loop(self, interval):
+        while not self.closed.wait(interval):
+            self.sync()
+
+    def compact(self, background=True):
+
+        ''' Start new log and write snapshot of the tree as it was at its start. Old snapshot and logs are deleted after that.
+            Only the log switch holds the lock, snapshot is rebuilt from closed files without touching the tree '''
+
+        with self.lock:
+            if self.compaction is not None: # Only one compaction at a time
+                self.compaction.join()
+            self.sync()
+            self.log.close()
+            self.generation += 1
+            generation = self.generation
+            self.log = open(self.path('wal', generation), 'ab')
+            if background:
+                self.compaction = threading.Thread(target=self.write_snapshot, args=(generation,))
+                self.compaction.start()
+        if not background:
+            self.write_snapshot(generation)
+
+    def write_snapshot(self, generation):
+
+        ''' Write snapshot of generation atomically and delete files it replaces '''
+
+        path = self.path('snapshot', generation)
+        RBTreeFile.dump(self.load_generation(generation).items(), path + '.tmp') # Contents at the start of the new log
+        with open(path + '.tmp', 'rb+') as file:
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)
+        if hasattr(os, 'O_DIRECTORY'): # Make rename durable
+            directory = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        for kind in ('snapshot', 'wal'):
+            for old in self.generations(kind):
+                if old < generation:
+                    os.remove(self.path(kind, old))
+        if self.compaction is threading.current_thread(): # Writer may wait for this thread holding the lock
+            self.compaction = None
+
+    def close(self):
+
+        ''' Wait for compaction, sync the log and close it '''
+
+        self.closed.set()
+        if self.syncer is not None:
+            self.syncer.join()
+        compaction = self.compaction
+        if compaction is not None:
+            compaction.join()
+        with self.lock:
+            self.sync()
+            self.log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def insert(self, key, value):
+
+        ''' Insertion of [key, value] pair '''
+
+        self.write('insert', key, value)
+
+    def upsert(self, key, value):
+
+        ''' Insert [key, value] pair or set value of existing key. Returns True if pair was inserted '''
+
+        return self.write('upsert', key, value)
+
+    def remove(self, key):
+
+        ''' Deleting pair by key '''
+
+        self.write('remove', key)
+
+    def clear(self):
+
+        ''' Clear tree '''
+
+        self.write('clear')
+
+    def __setitem__(self, key, value):
+
+        ''' Set value of existing key using [] operator '''
+
+        self.write('set', key, value)
+
+    def __delitem__(self, key):
+
+        ''' Delete pair by key using del operator '''
+
+        self.remove(key)
+
+    def find(self, key):
+
+        ''' Find value by key '''
+
+        return self.tree.find(key)
+
+    def __getitem__(self, key):
+
+        ''' Get value by key using [] operator '''
+
+        return self.tree.find(key)
+
+    def __contains__(self, key):
+
+        ''' Check if tree has a pair with key using in operator '''
+
+        return key in self.tree
+
+    def __len__(self):
+
+        ''' Number of pairs in the tree '''
+
+        return len(self.tree)
+
+    def __iter__(self):
+
+        ''' Iterate over keys in ascending order '''
+
+        return iter(self.tree)
+
+    def items(self, reverse=False):
+
+        ''' Iterate over (key, value) pairs in key order '''
+
+        return self.tree.items(reverse)
@@ -0,0 +1,215 @@
+import itertools
+import threading
+import time
+import RBTree
+
+class ExpiringRBTree:
+
+    ''' Red-Black Tree map whose pairs expire ttl seconds after they are set.
+        Second tree orders pairs by deadline, so expire(now) splits expired pairs off in O(log n) and deletes them from the map with
+        one difference in O(k log(n/k + 1)) instead of k removals. Expired pairs stay in the map until expire runs.
+        on_expire(key, value) is called for every expired pair, sweep_interval starts a thread that calls expire periodically '''
+
+    def __init__(self, ttl=None, clock=time.monotonic, on_expire=None, sweep_interval=None):
+        self.ttl = ttl # Default time to live, None means pairs don't expire
+        self.clock = clock
+        self.on_expire = on_expire
+        self.tree = RBTree.RBTree() # Key -> (value, deadline key or None)
+        self.deadlines = RBTree.RBTree() # (deadline, sequence number) -> (key, value)
+        self.sequence = itertools.count() # Orders pairs with equal deadlines and keeps deadline keys unique
+        self.lock = threading.RLock() # Guards both trees
+        self.closed = threading.Event()
+        self.sweeper = None
+        if sweep_interval is not None:
+            self.sweeper = threading.Thread(target=self.sweep_loop, args=(sweep_interval,), daemon=True)
+            self.sweeper.start()
+
+    def deadline_key(self, key, value, ttl):
+
+        ''' Add pair to deadline tree and return its deadline key. None if pair doesn't expire '''
+
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is None:
+            return None
+        deadline_key = (self.clock() + ttl, next(self.sequence))
+        self.deadlines.insert(deadline_key, (key, value))
+        return deadline_key
+
+    def insert(self, key, value, ttl=None):
+
+        ''' Insertion of [key, value] pair that expires after ttl seconds, default ttl if it's None '''
+
+        with self.lock:
+            if key in self.tree:
+                raise Exception(f"Pair with key={key} already exists")
+            self.tree.insert(key, (value, self.deadline_key(key, value, ttl)))
+
+    def upsert(self, key, value, ttl=None):
+
+        ''' Insert [key, value] pair or set value of existing key. Deadline starts over. Returns True if pair was inserted '''
+
+        with self.lock:
+            node = self.tree.find_node(key)
+            if node != self.tree.nil:
+                if node.value[1] is not None:
+                    self.deadlines.remove(node.value[1])
+                self.tree.set_value(node, (value, self.deadline_key(key, value, ttl)))
+                return False
+            self.tree.insert(key, (value, self.deadline_key(key, value, ttl)))
+            return True
+
+    def touch(self, key, ttl=None):
+
+        ''' Start deadline of existing key over '''
+
+        with self.lock:
+            node = self.tree.find_node(key)
+            if node == self.tree.nil: # If element is not found
+                raise Exception(f"Map doesn't have a pair with key={key}")
+            value, deadline_key = node.value
+            if deadline_key is not None:
+                self.deadlines.remove(deadline_key)
+            self.tree.set_value(node, (value, self.deadline_key(key, value, ttl)))
+
+    def remove(self, key):
+
+        ''' Deleting pair by key '''
+
+        with self.lock:
+            node = self.tree.find_node(key)
+            if node == self.tree.nil: # If node is not found
+                raise Exception(f"Pair with key={key} doesn't exist")
+            deadline_key = node.value[1]
+            self.tree.remove_node(node)
+            if deadline_key is not None:
+                self.deadlines.remove(deadline_key)
+
+    def expire(self, now=None):
+
+        ''' Delete pairs with deadlines not later than now, current time by default. Returns list of deleted (key, value) pairs '''
+
+        with self.lock:
+            now = self.clock() if now is None else now
+            expired, self.deadlines = self.deadlines.split((now, float('inf'))) # Deadline keys up to now go left
+            pairs = list(expired.values())
+            if pairs:
+                # Deleting all expired keys at once shares rebalancing between them
+                self.tree.difference(RBTree.RBTree.from_sorted(sorted((key, None) for key, value in pairs)))
+        if self.on_expire is not None: # Callbacks can use the tree
+            for key, value in pairs:
+                self.on_expire(key, value)
+        return pairs
+
+    def sweep_loop(self, interval):
+        while not self.closed.wait(interval):
+            self.expire()
+
+    def close(self):
+
+        ''' Stop the sweeper '''
+
+        self.closed.set()
+        if self.sweeper is not None:
+            self.sweeper.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def deadline(self, key):
+
+        ''' Deadline of key or None if it doesn't expire '''
+
+        with self.lock:
+            node = self.tree.find_node(key)
+            if node == self.tree.nil: # If element is not found
+                raise Exception(f"Map doesn't have a pair with key={key}")
+            return None if node.value[1] is None else node.value[1][0]
+
+    def next_deadline(self):
+
+        ''' The earliest deadline or None if no pair expires '''
+
+        with self.lock:
+            return None if self.deadlines.empty() else self.deadlines.min()[0][0]
+
+    def find(self, key):
+
+        ''' Find value by key. Returns None if key is absent '''
+
+        with self.lock:
+            if self.tree.empty(): # If tree is empty
+                raise Exception("Map is empty")
+            node = self.tree.find_node(key)
+            return None if node == self.tree.nil else node.value[0]
+
+    def get(self, key, default=None):
+
+        ''' Find value by key or return default '''
+
+        with self.lock:
+            node = self.tree.find_node(key)
+            return default if node == self.tree.nil else node.value[0]
+
+    def clear(self):
+
+        ''' Clear tree '''
+
+        with self.lock:
+            self.tree.clear()
+            self.deadlines.clear()
+
+    def __getitem__(self, key):
+
+        ''' Get value by key using [] operator '''
+
+        return self.find(key)
+
+    def __setitem__(self, key, value):
+
+        ''' Set value of existing key using [] operator. Deadline is kept '''
+
+        with self.lock:
+            node = self.tree.find_node(key)
+            if node == self.tree.nil: # Is element is not found
+                raise Exception(f"Map doesn't have a pair with key={key}")
+            deadline_key = node.value[1]
+            self.tree.set_value(node, (value, deadline_key))
+            if deadline_key is not None:
+                self.deadlines[deadline_key] = (key, value)
+
+    def __delitem__(self, key):
+
+        ''' Delete pair by key using del operator '''
+
+        self.remove(key)
+
+    def __contains__(self, key):
+
+        ''' Check if tree has a pair with key using in operator '''
+
+        with self.lock:
+            return key in self.tree
+
+    def __len__(self):
+
+        ''' Number of pairs in the tree '''
+
+        with self.lock:
+            return len(self.tree)
+
+    def __iter__(self):
+
+        ''' Iterate over keys in ascending order. Keys are collected under lock, so the sweeper can't change the tree during iteration '''
+
+        with self.lock:
+            return iter(list(self.tree))
+
+    def items(self, reverse=False):
+
+        ''' Iterate over (key, value) pairs in key order. Pairs are collected under lock '''
+
+        with self.lock:
+            return iter([(key, value) for key, (value, deadline_key) in self.tree.items(reverse)])
@@ -0,0 +1,221 @@
+import RBTree
+
+class HashedRBTree(RBTree.RBTree):
+
+    ''' Red-Black Tree with a hash index from key to node. Keys must be hashable.
+        Exact lookups, membership, assignment and finding the node to delete take O(1), ordered operations use the tree.
+        split and join rebuild the index in O(n), set operations only index nodes taken from the other tree and drop deleted keys '''
+
+    def __init__(self, root=None):
+        super().__init__(root)
+        self.index = {} if root is None else {root.key: root} # Key -> node
+
+    @classmethod
+    def from_sorted(cls, iterable, **kwargs):
+
+        ''' Build tree from (key, value) pairs sorted by key in O(n). kwargs are passed to the constructor '''
+
+        tree = super().from_sorted(iterable, **kwargs)
+        tree.reindex()
+        return tree
+
+    def reindex(self):
+
+        ''' Build index of all nodes in O(n) '''
+
+        self.index = {node.key: node for node in self.nodes()}
+
+    def find_node(self, key):
+
+        ''' Find node by key in O(1). Returns nil if node is not found '''
+
+        return self.index.get(key, self.nil)
+
+    def attach(self, parent, key, value):
+
+        ''' Insert new node as a child of parent node, balance the tree and index the node '''
+
+        node = super().attach(parent, key, value)
+        self.index[key] = node
+        return node
+
+    def insert(self, key, value):
+
+        ''' Insertion of [key, value] pair '''
+
+        if key in self.index: # Duplicate is found without descending
+            raise Exception(f"Pair with key={key} already exists")
+        super().insert(key, value)
+        if key not in self.index: # Root is created without attach
+            self.index[key] = self.root
+
+    def upsert(self, key, value):
+
+        ''' Insert [key, value] pair or set value of existing key. Returns True if pair was inserted '''
+
+        node = self.index.get(key)
+        if node is not None: # Existing key is set without descending
+            self.set_value(node, value)
+            return False
+        self.insert(key, value)
+        return True
+
+    def remove_node(self, node_to_delete):
+
+        ''' Deleting node of the tree. Node that takes pair of another node takes its index entry too '''
+
+        if node_to_delete.left != self.nil and node_to_delete.right != self.nil: # Successor takes place of the node
+            spliced = self.minimum(node_to_delete.right)
+        elif node_to_delete == self.root and node_to_delete.left != self.nil: # Root takes pair of its only child
+            spliced = node_to_delete.left
+        elif node_to_delete == self.root and node_to_delete.right != self.nil:
+            spliced = node_to_delete.right
+        else:
+            spliced = node_to_delete
+        key = node_to_delete.key
+        super().remove_node(node_to_delete)
+        self.index.pop(key, None)
+        if spliced != node_to_delete: # Pair of spliced node lives in node_to_delete now
+            self.index[node_to_delete.key] = node_to_delete
+
+    def find_many(self, keys, default=None):
+
+        ''' Find values of many keys in O(1) each. Missing keys get default value '''
+
+        nil = self.nil
+        return [node.value if node != nil else default for node in map(self.find_node, self.batch_keys(keys))]
+
+    def update_many(self, keys, values=None):
+
+        ''' Set values of many existing keys. Returns list of flags: True if key was found '''
+
+        result = []
+        for key, value in self.batch_pairs(keys, values):
+            node = self.index.get(key)
+            if node is not None:
+                self.set_value(node, value)
+            result.append(node is not None)
+        return result
+
+    def remove_many(self, keys):
+
+        ''' Delete many pairs by keys. Returns list of flags: True if key was found and deleted '''
+
+        result = []
+        for key in self.batch_keys(keys):
+            node = self.index.get(key)
+            if node is not None:
+                self.remove_node(node)
+            result.append(node is not None)
+        return result
+
+    def split(self, key):
+
+        ''' Split tree into trees with keys less than key and keys greater than or equal to key. Tree is emptied '''
+
+        left, right = super().split(key)
+        left.reindex() # Both halves share the old index
+        right.reindex()
+        self.index = {}
+        return left, right
+
+    @classmethod
+    def join(cls, left, key, value, right):
+
+        ''' Tree with pairs of left tree, [key, value] pair and pairs of right tree. Trees are emptied '''
+
+        tree = super().join(left, key, value, right)
+        tree.reindex()
+        left.index = {}
+        right.index = {}
+        return tree
+
+    def index_subtree(self, node):
+
+        ''' Index all nodes of subtree taken from the other tree '''
+
+        if node != self.nil:
+            self.index.update((node.key, node) for node in self.subtree(node).nodes())
+
+    def unindex_subtree(self, node):
+
+        ''' Drop index entries of all nodes of deleted subtree '''
+
+        if node != self.nil:
+            for node in self.subtree(node).nodes():
+                del self.index[node.key]
+
+    def join_pair(self, left, left_bh, right, right_bh):
+
+        ''' Join subtrees without a middle node. New node that takes the smallest pair of right subtree is indexed '''
+
+        if left == self.nil or right == self.nil:
+            return super().join_pair(left, left_bh, right, right_bh)
+        key = self.minimum(right).key
+        root, bh = super().join_pair(left, left_bh, right, right_bh)
+        node = root
+        while node.key != key: # O(log n) like the join itself
+            node = node.left if node.key > key else node.right
+        self.index[key] = node
+        return root, bh
+
+    # In set operations a and b cover the same key range, so b's key is in the index only if it's in a.
+    # Every call indexes b's root if it's kept and drops keys of a's nodes that are deleted
+
+    def union_nodes(self, a, a_bh, b, b_bh, merge):
+        if a == self.nil:
+            self.index_subtree(b)
+        elif b != self.nil: # b's root replaces node with the same key
+            self.index[b.key] = b
+        return super().union_nodes(a, a_bh, b, b_bh, merge)
+
+    def intersection_nodes(self, a, a_bh, b, b_bh, merge):
+        if b == self.nil:
+            self.unindex_subtree(a)
+        elif a != self.nil and b.key in self.index: # b's root replaces node with the same key
+            self.index[b.key] = b
+        return super().intersection_nodes(a, a_bh, b, b_bh, merge)
+
+    def difference_nodes(self, a, a_bh, b, b_bh):
+        if a != self.nil and b != self.nil:
+            self.index.pop(b.key, None)
+        return super().difference_nodes(a, a_bh, b, b_bh)
+
+    def symmetric_difference_nodes(self, a, a_bh, b, b_bh):
+        if a == self.nil:
+            self.index_subtree(b)
+        elif b != self.nil:
+            if self.index.pop(b.key, None) is None: # Key is only in b
+                self.index[b.key] = b
+        return super().symmetric_difference_nodes(a, a_bh, b, b_bh)
+
+    def set_operation(self, other, operation, *args):
+
+        ''' Replace pairs of tree with result of operation on both trees. Index is updated by operation, other tree is emptied '''
+
+        super().set_operation(other, operation, *args)
+        other.index = {}
+
+    def clear(self):
+
+        ''' Clear tree and index '''
+
+        super().clear()
+        self.index = {}
+
+    def copy(self):
+
+        ''' Shallow copy of the tree with its own index '''
+
+        tree = super().copy()
+        tree.reindex()
+        return tree
+
+    def __deepcopy__(self, memo):
+
+        ''' Copy of the tree with copied keys and values for copy.deepcopy '''
+
+        memo[id(self.index)] = {} # Index is rebuilt instead of copied
+        tree = super().__deepcopy__(memo)
+        tree.reindex()
+        return tree
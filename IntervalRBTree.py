@@ -0,0 +1,97 @@
+import RBTree
+
+class IntervalNode(RBTree.Node):
+
+    ''' Node of Red-Black Tree with the biggest interval end in its subtree '''
+
+    __slots__ = ('high',)
+
+    def __init__(self, key, value, left=None, right=None, parent=None, red=True):
+        super().__init__(key, value, left, right, parent, red)
+        if key is not None and key[1] < key[0]:
+            raise Exception(f"Interval {key} ends before it starts")
+        self.high = None if key is None else key[1] # Biggest end in subtree, None for nil
+
+
+class IntervalRBTree(RBTree.RBTree):
+
+    ''' Red-Black Tree of closed intervals. Keys are (start, end) pairs ordered by start, then by end.
+        Every node keeps the biggest end in its subtree, so overlap queries skip subtrees that end too early '''
+
+    node_type = IntervalNode
+
+    def update(self, node):
+
+        ''' Recompute subtree size and the biggest end of node from its children '''
+
+        node.size = node.left.size + node.right.size + 1
+        high = node.key[1]
+        if node.left.high is not None and node.left.high > high:
+            high = node.left.high
+        if node.right.high is not None and node.right.high > high:
+            high = node.right.high
+        node.high = high
+
+    def update_path(self, node, delta):
+
+        ''' Change subtree sizes by delta and recompute the biggest ends from node up to the root '''
+
+        while node is not None:
+            self.update(node)
+            node = node.parent
+
+    def max_end(self):
+
+        ''' The biggest end of all intervals '''
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        return self.root.high
+
+    def overlap_nodes(self, lo, hi):
+
+        ''' Lazy traversal of nodes with intervals that overlap [lo, hi] in key order '''
+
+        if self.empty(): # Nothing to traverse in empty tree
+            return
+        stack = []
+        node = self.root
+        nil = self.nil
+        while True:
+            while node != nil and node.high >= lo: # Subtrees that end before lo have no overlaps
+                stack.append(node)
+                node = node.left
+            if not stack:
+                return
+            node = stack.pop()
+            if node.key[0] > hi: # This and all next intervals start after hi
+                return
+            if node.key[1] >= lo:
+                yield node
+            node = node.right
+
+    def overlap(self, lo, hi):
+
+        ''' Iterate over intervals that overlap [lo, hi] '''
+
+        for node in self.overlap_nodes(lo, hi):
+            yield node.key
+
+    def overlap_items(self, lo, hi):
+
+        ''' Iterate over (interval, value) pairs with intervals that overlap [lo, hi] '''
+
+        for node in self.overlap_nodes(lo, hi):
+            yield node.key, node.value
+
+    def stab(self, point):
+
+        ''' Iterate over intervals that contain point '''
+
+        return self.overlap(point, point)
+
+    def stab_items(self, point):
+
+        ''' Iterate over (interval, value) pairs with intervals that contain point '''
+
+        return self.overlap_items(point, point)
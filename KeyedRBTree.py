@@ -0,0 +1,243 @@
+import functools
+import operator
+import RBTree
+
+class KeyedRBTree:
+
+    ''' Red-Black Tree map ordered by key(user_key), or by cmp(a, b) like sorted, optionally in reverse order.
+        The sort key is computed once per pair and kept as the node key, pairs are kept as node values.
+        Keys with equal sort keys are the same key of the map '''
+
+    def __init__(self, key=None, cmp=None, reverse=False, tree=None):
+        if key is not None and cmp is not None:
+            raise Exception("Pass either key or cmp")
+        if cmp is not None:
+            key = functools.cmp_to_key(cmp)
+        self.key = key # Function of user key that gives sort key, None means user key itself
+        self.reverse = reverse # Order of iteration and of min/max/floor/ceiling
+        self.tree = tree if tree is not None else RBTree.RBTree() # Sort key -> (user key, value)
+
+    @classmethod
+    def from_unsorted(cls, iterable, key=None, cmp=None, reverse=False):
+
+        ''' Build tree from (key, value) pairs in any order in O(n log n). Last pair wins for equal keys '''
+
+        tree = cls(key, cmp, reverse)
+        tree.tree = RBTree.RBTree.from_unsorted((tree.sort_key(pair[0]), tuple(pair)) for pair in iterable)
+        return tree
+
+    def sort_key(self, key):
+
+        ''' Key of inner tree for user key '''
+
+        return key if self.key is None else self.key(key)
+
+    def insert(self, key, value):
+
+        ''' Insertion of [key, value] pair '''
+
+        sort_key = self.sort_key(key)
+        if sort_key in self.tree:
+            raise Exception(f"Pair with key={key} already exists")
+        self.tree.insert(sort_key, (key, value))
+
+    def upsert(self, key, value):
+
+        ''' Insert [key, value] pair or set value of existing key. Returns True if pair was inserted '''
+
+        return self.tree.upsert(self.sort_key(key), (key, value))
+
+    def remove(self, key):
+
+        ''' Deleting pair by key '''
+
+        sort_key = self.sort_key(key)
+        if not self.tree.empty() and sort_key not in self.tree:
+            raise Exception(f"Pair with key={key} doesn't exist")
+        self.tree.remove(sort_key)
+
+    def find(self, key):
+
+        ''' Find value by key. Returns None if key is absent '''
+
+        if self.tree.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        node = self.tree.find_node(self.sort_key(key))
+        if node == self.tree.nil: # If element is not found return None
+            return None
+        return node.value[1]
+
+    def get(self, key, default=None):
+
+        ''' Find value by key or return default '''
+
+        node = self.tree.find_node(self.sort_key(key))
+        return default if node == self.tree.nil else node.value[1]
+
+    def insert_many(self, keys, values=None):
+
+        ''' Insert many pairs. Returns list of flags: True if pair was inserted, False if key already exists '''
+
+        pairs = self.tree.batch_pairs(keys, values)
+        return self.tree.insert_many([(self.sort_key(key), (key, value)) for key, value in pairs])
+
+    def pair(self, node):
+
+        ''' User (key, value) pair of inner node or None for nil '''
+
+        return None if node == self.tree.nil else node.value
+
+    def floor(self, key):
+
+        ''' (key, value) pair with the biggest key <= key in map order or None '''
+
+        if self.tree.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        sort_key = self.sort_key(key)
+        return self.pair(self.tree.ceiling_node(sort_key) if self.reverse else self.tree.floor_node(sort_key))
+
+    def ceiling(self, key):
+
+        ''' (key, value) pair with the smallest key >= key in map order or None '''
+
+        if self.tree.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        sort_key = self.sort_key(key)
+        return self.pair(self.tree.floor_node(sort_key) if self.reverse else self.tree.ceiling_node(sort_key))
+
+    def lower(self, key):
+
+        ''' (key, value) pair with the biggest key < key in map order or None '''
+
+        if self.tree.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        sort_key = self.sort_key(key)
+        return self.pair(self.tree.ceiling_node(sort_key, False) if self.reverse else self.tree.floor_node(sort_key, False))
+
+    def higher(self, key):
+
+        ''' (key, value) pair with the smallest key > key in map order or None '''
+
+        if self.tree.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        sort_key = self.sort_key(key)
+        return self.pair(self.tree.floor_node(sort_key, False) if self.reverse else self.tree.ceiling_node(sort_key, False))
+
+    def min(self):
+
+        ''' (key, value) pair that is first in map order '''
+
+        return (self.tree.max() if self.reverse else self.tree.min())[1]
+
+    def max(self):
+
+        ''' (key, value) pair that is last in map order '''
+
+        return (self.tree.min() if self.reverse else self.tree.max())[1]
+
+    def pop_min(self):
+
+        ''' Remove and return (key, value) pair that is first in map order '''
+
+        return (self.tree.pop_max() if self.reverse else self.tree.pop_min())[1]
+
+    def pop_max(self):
+
+        ''' Remove and return (key, value) pair that is last in map order '''
+
+        return (self.tree.pop_min() if self.reverse else self.tree.pop_max())[1]
+
+    def irange_items(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterate over (key, value) pairs with keys from lo to hi in map order. None bound means unbounded '''
+
+        lo = None if lo is None else self.sort_key(lo)
+        hi = None if hi is None else self.sort_key(hi)
+        if self.reverse: # Map order is opposite to order of sort keys
+            lo, hi, inclusive = hi, lo, inclusive[::-1]
+        for node in self.tree.range_nodes(lo, hi, inclusive, reverse != self.reverse):
+            yield node.value
+
+    def irange(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterate over keys from lo to hi in map order '''
+
+        for key, value in self.irange_items(lo, hi, inclusive, reverse):
+            yield key
+
+    def items(self, reverse=False):
+
+        ''' Iterate over (key, value) pairs in map order '''
+
+        return self.tree.values(reverse != self.reverse)
+
+    def keys(self, reverse=False):
+
+        ''' Iterate over keys in map order '''
+
+        return map(operator.itemgetter(0), self.items(reverse))
+
+    def values(self, reverse=False):
+
+        ''' Iterate over values in map order '''
+
+        return map(operator.itemgetter(1), self.items(reverse))
+
+    def clear(self):
+
+        ''' Clear tree '''
+
+        self.tree.clear()
+
+    def empty(self):
+
+        ''' Check if tree is empty '''
+
+        return self.tree.empty()
+
+    def __getitem__(self, key):
+
+        ''' Get value by key using [] operator '''
+
+        return self.find(key)
+
+    def __setitem__(self, key, value):
+
+        ''' Set value of existing key using [] operator '''
+
+        if self.tree.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        node = self.tree.find_node(self.sort_key(key))
+        if node == self.tree.nil: # Is element is not found
+            raise Exception(f"Map doesn't have a pair with key={key}")
+        self.tree.set_value(node, (key, value))
+
+    def __delitem__(self, key):
+
+        ''' Delete pair by key using del operator '''
+
+        self.remove(key)
+
+    def __contains__(self, key):
+
+        ''' Check if tree has a pair with key using in operator '''
+
+        return self.sort_key(key) in self.tree
+
+    def __len__(self):
+
+        ''' Number of pairs in the tree '''
+
+        return len(self.tree)
+
+    def __iter__(self):
+
+        ''' Iterate over keys in map order '''
+
+        return self.keys()
+
+    def __reversed__(self):
+
+        ''' Iterate over keys in opposite order '''
+
+        return self.keys(reverse=True)
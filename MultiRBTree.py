@@ -0,0 +1,303 @@
+import operator
+import RBTree
+
+class MultiRBTree(RBTree.RBTree):
+
+    ''' Red-Black Tree that keeps many values per key. Every node holds a list of values of its key in insertion order.
+        Subtree size counts values, so len, rank and select count duplicates. Assignment replaces all values of the key '''
+
+    def update(self, node):
+
+        ''' Recompute number of values in subtree of node '''
+
+        node.size = node.left.size + node.right.size + len(node.value)
+
+    def update_path(self, node, delta):
+
+        ''' Recompute number of values in subtrees from node up to the root. Removed node can carry many values, so delta isn't used '''
+
+        while node is not None:
+            node.size = node.left.size + node.right.size + len(node.value)
+            node = node.parent
+
+    def set_value(self, node, value):
+
+        ''' Replace all values of node with value '''
+
+        node.value = [value]
+        self.update_path(node, 0)
+
+    @classmethod
+    def from_sorted(cls, iterable, **kwargs):
+
+        ''' Build tree from (key, value) pairs sorted by key in O(n). Equal keys keep order of their values '''
+
+        buckets = []
+        for key, value in iterable:
+            if buckets and buckets[-1][0] == key:
+                buckets[-1][1].append(value)
+            else:
+                buckets.append((key, [value]))
+        return super().from_sorted(buckets, **kwargs)
+
+    @classmethod
+    def from_unsorted(cls, iterable, **kwargs):
+
+        ''' Build tree from (key, value) pairs in any order. Equal keys keep order of their values '''
+
+        return cls.from_sorted(sorted(iterable, key=operator.itemgetter(0)), **kwargs) # Sort is stable
+
+    def insert(self, key, value):
+
+        ''' Add value to values of key '''
+
+        if self.empty(): # If tree is empty
+            self.root = self.node_type(key, [value], self.nil, self.nil, red=False) # Insert node as a root
+            return
+        parent = None
+        cur = self.root
+        while cur != self.nil: # Find bucket or place to insert
+            if cur.key == key: # Key exists, append to its bucket
+                cur.value.append(value)
+                self.update_path(cur, 1)
+                return
+            parent = cur
+            cur = cur.left if cur.key > key else cur.right
+        self.attach(parent, key, [value])
+
+    def upsert(self, key, value):
+
+        ''' Add key with single value or replace all values of existing key. Returns True if key was inserted '''
+
+        node = self.find_node(key)
+        if node != self.nil:
+            self.set_value(node, value)
+            return False
+        self.insert(key, value)
+        return True
+
+    def insert_many(self, keys, values=None):
+
+        ''' Add many pairs. Returns list of flags, all True because duplicates are kept '''
+
+        pairs = self.batch_pairs(keys, values)
+        for key, value in pairs:
+            self.insert(key, value)
+        return [True] * len(pairs)
+
+    def count(self, key):
+
+        ''' Number of values of key '''
+
+        node = self.find_node(key)
+        return 0 if node == self.nil else len(node.value)
+
+    def get_all(self, key):
+
+        ''' List of values of key in insertion order. Empty list if key is absent '''
+
+        node = self.find_node(key)
+        return [] if node == self.nil else list(node.value)
+
+    def find(self, key):
+
+        ''' First inserted value of key. Returns None if key is absent '''
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        node = self.find_node(key)
+        return None if node == self.nil else node.value[0]
+
+    def find_many(self, keys, default=None):
+
+        ''' First inserted values of many keys. Missing keys get default value '''
+
+        return [default if bucket is None else bucket[0] for bucket in super().find_many(keys)]
+
+    def node_pair(self, node):
+
+        ''' (key, first value) pair of node or None for nil. floor, ceiling, lower and higher return such pairs '''
+
+        pair = super().node_pair(node)
+        return None if pair is None else (pair[0], pair[1][0])
+
+    def min(self):
+
+        ''' The first (key, value) pair in key order '''
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        node = self.minimum(self.root)
+        return node.key, node.value[0]
+
+    def max(self):
+
+        ''' The last (key, value) pair in key order '''
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        node = self.maximum(self.root)
+        return node.key, node.value[-1]
+
+    def pop_value(self, node, position):
+
+        ''' Remove value at position of bucket of node and return (key, value) pair. Key is deleted with its last value '''
+
+        pair = node.key, node.value[position]
+        if len(node.value) == 1:
+            self.remove_node(node)
+        else:
+            del node.value[position]
+            self.update_path(node, -1)
+        return pair
+
+    def pop_min(self):
+
+        ''' Remove and return the first (key, value) pair in key order '''
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        return self.pop_value(self.minimum(self.root), 0)
+
+    def pop_max(self):
+
+        ''' Remove and return the last (key, value) pair in key order '''
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        return self.pop_value(self.maximum(self.root), -1)
+
+    def remove_one(self, key):
+
+        ''' Remove and return the first inserted value of key. Key is deleted with its last value '''
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        node = self.find_node(key)
+        if node == self.nil: # If node is not found
+            raise Exception(f"Pair with key={key} doesn't exist")
+        return self.pop_value(node, 0)[1]
+
+    def remove_all(self, key):
+
+        ''' Delete key and return list of all its values '''
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        node = self.find_node(key)
+        if node == self.nil: # If node is not found
+            raise Exception(f"Pair with key={key} doesn't exist")
+        values = node.value # Save values before deleting, because remove_node can move pairs between nodes
+        self.remove_node(node)
+        return values
+
+    def rank(self, key, inclusive=False):
+
+        ''' Number of values with keys less than (or equal to) key '''
+
+        result = 0
+        if self.empty(): # If tree is empty
+            return result
+        cur = self.root
+        while cur != self.nil:
+            if cur.key < key or inclusive and cur.key == key: # Node and its left subtree are counted
+                result += cur.left.size + len(cur.value)
+                cur = cur.right
+            else:
+                cur = cur.left
+        return result
+
+    def select_node(self, index):
+
+        ''' Node with index-th value in key order. Negative index counts from the end '''
+
+        return self.select_value(index)[0]
+
+    def select_value(self, index):
+
+        ''' Node with index-th value in key order and position of the value in its bucket '''
+
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size: # If index is out of range
+            raise Exception(f"Index {index} is out of range")
+        cur = self.root
+        while True:
+            if index < cur.left.size: # Go to the left subtree
+                cur = cur.left
+            elif index < cur.left.size + len(cur.value): # Value is in the bucket of node
+                return cur, index - cur.left.size
+            else: # Skip left subtree and node, go to the right subtree
+                index -= cur.left.size + len(cur.value)
+                cur = cur.right
+
+    def select(self, index):
+
+        ''' (key, value) pair by position in key order. Slice returns list of pairs '''
+
+        if isinstance(index, slice):
+            return [self.select(i) for i in range(*index.indices(len(self)))]
+        node, position = self.select_value(index)
+        return node.key, node.value[position]
+
+    def get_values(self):
+
+        ''' Get copies of value lists of tree '''
+
+        return [list(values) for values in super().get_values()]
+
+    def copy(self):
+
+        ''' Shallow copy of the tree with own buckets '''
+
+        tree = super().copy()
+        for node in tree.nodes():
+            node.value = list(node.value)
+        return tree
+
+    def irange_items(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterate over (key, value) pairs with keys between lo and hi. Values of a key go in insertion order, reversed if reverse is set '''
+
+        for node in self.range_nodes(lo, hi, inclusive, reverse):
+            for value in (reversed(node.value) if reverse else node.value):
+                yield node.key, value
+
+    def irange(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterate over keys between lo and hi, once per value '''
+
+        for key, value in self.irange_items(lo, hi, inclusive, reverse):
+            yield key
+
+    def items(self, reverse=False):
+
+        ''' Iterate over all (key, value) pairs in key order '''
+
+        return self.irange_items(reverse=reverse)
+
+    def keys(self, reverse=False):
+
+        ''' Iterate over keys in key order, once per value '''
+
+        return self.irange(reverse=reverse)
+
+    def values(self, reverse=False):
+
+        ''' Iterate over all values in key order '''
+
+        for key, value in self.irange_items(reverse=reverse):
+            yield value
+
+    def __iter__(self):
+
+        ''' Iterate over keys in ascending order, once per value '''
+
+        return self.irange()
+
+    def __reversed__(self):
+
+        ''' Iterate over keys in descending order, once per value '''
+
+        return self.irange(reverse=True)
@@ -0,0 +1,298 @@
+import collections
+import os
+import pickle
+import struct
+import RBTree
+
+# Page 0 of the file is the header, every other page holds one node:
+#   header   magic, format version, page size, root page, nil page, head of free page list, number of pages
+#   node     color, subtree size, left, right and parent pages (-1 for None), length of pickled (key, value) and the pickle
+# Free pages are linked through their left page field
+
+MAGIC = b'RBTP'
+VERSION = 1
+HEADER = struct.Struct('<4sIIqqqq')
+NODE = struct.Struct('<?Qqqqi')
+RED, SIZE, LEFT, RIGHT, PARENT, KEY, VALUE = range(7) # Fields of page record
+
+
+class BufferPool:
+
+    ''' LRU cache of decoded pages of file. Changed pages are written back when they are evicted or flushed '''
+
+    def __init__(self, file, page_size, capacity):
+        self.file = file
+        self.page_size = page_size
+        self.capacity = capacity # Maximum number of cached pages
+        self.pages = collections.OrderedDict() # Page -> record, least recently used first
+        self.dirty = set() # Cached pages that differ from the file
+        self.count = 1 # Number of pages in the file including header
+        self.free_head = -1 # First page of free page list
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+
+    def encode(self, record):
+
+        ''' Bytes of page with record '''
+
+        data = pickle.dumps((record[KEY], record[VALUE]))
+        if NODE.size + len(data) > self.page_size:
+            raise Exception(f"Pair with key={record[KEY]} doesn't fit in page of {self.page_size} bytes")
+        return NODE.pack(record[RED], record[SIZE], record[LEFT], record[RIGHT], record[PARENT], len(data)) + data
+
+    def read(self, page):
+
+        ''' Record of page from the file '''
+
+        self.file.seek(page * self.page_size)
+        data = self.file.read(self.page_size)
+        red, size, left, right, parent, length = NODE.unpack_from(data)
+        key, value = pickle.loads(data[NODE.size:NODE.size + length])
+        return [red, size, left, right, parent, key, value]
+
+    def write(self, page, record):
+
+        ''' Write record of page to the file '''
+
+        self.file.seek(page * self.page_size)
+        self.file.write(self.encode(record).ljust(self.page_size, b'\0'))
+        self.writes += 1
+
+    def get(self, page):
+
+        ''' Record of page. Changes of the record must be reported with mark '''
+
+        record = self.pages.get(page)
+        if record is None:
+            self.misses += 1
+            record = self.read(page)
+            self.add(page, record)
+        else:
+            self.hits += 1
+            self.pages.move_to_end(page)
+        return record
+
+    def add(self, page, record):
+
+        ''' Put record of page to the cache and evict the least recently used page if cache is full '''
+
+        self.pages[page] = record
+        if len(self.pages) > self.capacity:
+            old, old_record = self.pages.popitem(last=False)
+            self.evictions += 1
+            if old in self.dirty: # Write back before dropping
+                self.write(old, old_record)
+                self.dirty.discard(old)
+
+    def mark(self, page):
+
+        ''' Remember that record of page was changed '''
+
+        self.dirty.add(page)
+
+    def allocate(self, record):
+
+        ''' Page for new record. Free pages are reused first '''
+
+        self.encode(record) # Check that the record fits in page
+        if self.free_head >= 0:
+            page = self.free_head
+            self.free_head = self.get(page)[LEFT]
+        else:
+            page = self.count
+            self.count += 1
+        self.add(page, record)
+        self.mark(page)
+        return page
+
+    def free(self, page):
+
+        ''' Put page to the free page list '''
+
+        self.add(page, [False, 0, self.free_head, -1, -1, None, None])
+        self.mark(page)
+        self.free_head = page
+
+    def flush(self):
+
+        ''' Write all changed pages to the file '''
+
+        for page in sorted(self.dirty):
+            self.write(page, self.pages[page])
+        self.dirty.clear()
+
+
+def link_field(index):
+
+    ''' Property of node that links to another node by its page '''
+
+    def get(node):
+        page = node.pool.get(node.page)[index]
+        return None if page < 0 else PageNode(node.pool, page)
+
+    def set(node, other):
+        node.pool.get(node.page)[index] = -1 if other is None else other.page
+        node.pool.mark(node.page)
+
+    return property(get, set)
+
+
+def data_field(index):
+
+    ''' Property of node that is stored in its page '''
+
+    def get(node):
+        return node.pool.get(node.page)[index]
+
+    def set(node, value):
+        node.pool.get(node.page)[index] = value
+        node.pool.mark(node.page)
+
+    return property(get, set)
+
+
+class PageNode:
+
+    ''' Proxy of node stored in page. Proxies of the same page are equal, so tree algorithms work with them as with nodes '''
+
+    __slots__ = ('pool', 'page')
+
+    def __init__(self, pool, page):
+        self.pool = pool
+        self.page = page
+
+    def __eq__(self, other):
+        return isinstance(other, PageNode) and self.page == other.page and self.pool is other.pool
+
+    def __hash__(self):
+        return hash(self.page)
+
+    red = data_field(RED)
+    size = data_field(SIZE)
+    key = data_field(KEY)
+    value = data_field(VALUE)
+    left = link_field(LEFT)
+    right = link_field(RIGHT)
+    parent = link_field(PARENT)
+
+
+class PagedRBTree(RBTree.RBTree):
+
+    ''' Red-Black Tree with nodes in fixed-size pages of a file and an LRU buffer pool of capacity pages.
+        RBTree algorithms run unchanged on page proxies. Call flush or close to make the file consistent.
+        Set operations, split, join and copies are not supported '''
+
+    def __init__(self, path, page_size=256, capacity=1024):
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        if exists:
+            magic, version, page_size, root, nil, free_head, count = HEADER.unpack(self.file.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise Exception(f"File {path} is not a paged tree of version {VERSION}")
+        self.pool = BufferPool(self.file, page_size, capacity)
+        self.node_type = self.new_node # Nodes are allocated in pages
+        if exists:
+            self.pool.count, self.pool.free_head = count, free_head
+            self.nil = PageNode(self.pool, nil)
+            self.root = None if root < 0 else PageNode(self.pool, root)
+        else:
+            super().__init__()
+            self.flush()
+
+    def new_node(self, key, value, left=None, right=None, parent=None, red=True):
+
+        ''' Allocate page for new node and return its proxy '''
+
+        links = [-1 if node is None else node.page for node in (left, right, parent)]
+        return PageNode(self.pool, self.pool.allocate([red, 1] + links + [key, value]))
+
+    def set_value(self, node, value):
+
+        ''' Set value of node. Raises exception if the pair doesn't fit in page '''
+
+        self.pool.encode([node.red, node.size, -1, -1, -1, node.key, value])
+        super().set_value(node, value)
+
+    def remove_node(self, node_to_delete):
+
+        ''' Deleting node of the tree and freeing the page that is unlinked '''
+
+        if node_to_delete.left != self.nil and node_to_delete.right != self.nil: # Successor takes place of the node
+            spliced = self.minimum(node_to_delete.right)
+        elif node_to_delete == self.root and node_to_delete.left != self.nil: # Root takes pair of its only child
+            spliced = node_to_delete.left
+        elif node_to_delete == self.root and node_to_delete.right != self.nil:
+            spliced = node_to_delete.right
+        else:
+            spliced = node_to_delete
+        super().remove_node(node_to_delete)
+        self.pool.free(spliced.page)
+
+    def clear(self):
+
+        ''' Clear tree and free pages of all nodes in O(n) '''
+
+        pages = [node.page for node in self.nodes()]
+        super().clear()
+        for page in pages:
+            self.pool.free(page)
+
+    def set_operation(self, other, operation, *args):
+
+        ''' Set operations would link pages of different files, so union, intersection and differences are not supported '''
+
+        raise Exception("Set operations are not supported by paged trees")
+
+    def split(self, key):
+
+        ''' Not supported, halves would share the file that has one root '''
+
+        raise Exception("Split is not supported by paged trees")
+
+    @classmethod
+    def join(cls, left, key, value, right):
+
+        ''' Not supported, trees live in different files '''
+
+        raise Exception("Join is not supported by paged trees")
+
+    def copy(self):
+
+        ''' Not supported, copy would need its own file. Use dump and load '''
+
+        raise Exception("Copy is not supported by paged trees")
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def flush(self):
+
+        ''' Write changed pages and header to the file '''
+
+        self.pool.flush()
+        root = -1 if self.root is None else self.root.page
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.pool.page_size, root, self.nil.page, self.pool.free_head, self.pool.count))
+        self.file.flush()
+
+    def close(self):
+
+        ''' Flush and close the file '''
+
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def cache_stats(self):
+
+        ''' Counters of the buffer pool '''
+
+        pool = self.pool
+        return {'hits': pool.hits, 'misses': pool.misses, 'evictions': pool.evictions, 'writes': pool.writes, 'cached': len(pool.pages), 'pages': pool.count}
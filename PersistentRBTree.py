@@ -0,0 +1,496 @@
+import operator
+
+class PersistentNode:
+
+    ''' Node of persistent Red-Black Tree. Nodes may be shared between versions, so a node is never changed after an operation that created it is finished '''
+
+    __slots__ = ('key', 'value', 'left', 'right', 'red', 'size') # No parent pointer, a node can have parents in many versions
+
+    def __init__(self, key, value, left=None, right=None, red=True, size=1):
+        self.key = key # Key
+        self.value = value # Value
+        self.left = left # Left child, None for empty subtree
+        self.right = right # Right child, None for empty subtree
+        self.red = red # Color (True=Red, False=Black)
+        self.size = size # Number of nodes in subtree
+
+    def copy(self):
+
+        ''' Copy of node that the current operation may change '''
+
+        return PersistentNode(self.key, self.value, self.left, self.right, self.red, self.size)
+
+
+def is_red(node):
+    return node is not None and node.red
+
+
+def size(node):
+    return 0 if node is None else node.size
+
+
+def left_rotate(node):
+
+    ''' Rotate subtree to the left and return its new root. node and its right child must be copies owned by the current operation '''
+
+    child = node.right
+    node.right = child.left
+    child.left = node
+    node.size = size(node.left) + size(node.right) + 1
+    child.size = node.size + size(child.right) + 1
+    return child
+
+
+def right_rotate(node):
+
+    ''' Rotate subtree to the right and return its new root. node and its left child must be copies owned by the current operation '''
+
+    child = node.left
+    node.left = child.right
+    child.right = node
+    node.size = size(node.left) + size(node.right) + 1
+    child.size = size(child.left) + node.size + 1
+    return child
+
+
+def traverse(node, reverse):
+
+    ''' Lazy in-order traversal of subtree. Keeps only the path to the current node on a stack '''
+
+    stack = []
+    while stack or node is not None:
+        if node is not None: # Go down to the smallest (biggest) node of subtree
+            stack.append(node)
+            node = node.right if reverse else node.left
+        else: # Visit node and traverse its other subtree
+            node = stack.pop()
+            yield node
+            node = node.left if reverse else node.right
+
+
+def traverse_range(node, lo, hi, inclusive, reverse):
+
+    ''' Lazy in-order traversal of subtree nodes with keys between lo and hi '''
+
+    above_lo = lambda node: lo is None or node.key > lo or inclusive[0] and node.key == lo # Key is not below lower bound
+    below_hi = lambda node: hi is None or node.key < hi or inclusive[1] and node.key == hi # Key is not above upper bound
+    start, stop = (below_hi, above_lo) if reverse else (above_lo, below_hi)
+    stack = []
+    while node is not None: # Stack holds ancestors in range that are visited after the first node
+        if start(node):
+            stack.append(node)
+            node = node.right if reverse else node.left
+        else:
+            node = node.left if reverse else node.right
+    while stack:
+        node = stack.pop()
+        if not stop(node): # Out of range
+            return
+        yield node
+        node = node.left if reverse else node.right
+        while node is not None: # Go down to the next node
+            stack.append(node)
+            node = node.right if reverse else node.left
+
+
+class PersistentRBTree:
+
+    ''' Red-Black Tree that copies O(log n) nodes on every change instead of changing nodes in place.
+        Old versions stay valid, so snapshot() is O(1) and iterators are not affected by later changes '''
+
+    def __init__(self, root=None):
+        self.root = root # Root of the current version, None for empty tree
+
+    @classmethod
+    def from_sorted(cls, iterable):
+
+        ''' Build tree from (key, value) pairs sorted by key in O(n) '''
+
+        pairs = list(iterable)
+        for i in range(1, len(pairs)): # Keys must be strictly increasing
+            if not pairs[i - 1][0] < pairs[i][0]:
+                raise Exception(f"Keys are not sorted: key={pairs[i][0]} after key={pairs[i - 1][0]}")
+
+        def build(lo, hi, depth):
+            if lo == hi:
+                return None
+            mid = (lo + hi) // 2
+            left = build(lo, mid, depth + 1)
+            right = build(mid + 1, hi, depth + 1)
+            return PersistentNode(pairs[mid][0], pairs[mid][1], left, right, depth == red_depth, hi - lo)
+
+        # Every level above the deepest one is full, so only nodes on the deepest level are red
+        red_depth = len(pairs).bit_length() - 1
+        root = build(0, len(pairs), 0)
+        if root is not None:
+            root.red = False
+        return cls(root)
+
+    @classmethod
+    def from_unsorted(cls, iterable):
+
+        ''' Build tree from (key, value) pairs in any order. Last pair wins for equal keys '''
+
+        pairs = []
+        for pair in sorted(iterable, key=operator.itemgetter(0)): # Stable sort keeps pairs with equal keys in input order
+            if pairs and pairs[-1][0] == pair[0]:
+                pairs[-1] = pair # Replace previous pair with equal key
+            else:
+                pairs.append(pair)
+        return cls.from_sorted(pairs)
+
+    def snapshot(self):
+
+        ''' Independent tree with the current contents in O(1). Changes of either tree are not visible in the other '''
+
+        return type(self)(self.root)
+
+    def copy_path(self, key, grow):
+
+        ''' Copy nodes from the root to the node with key, or to the place of key if it's absent.
+            Sizes of copies are changed by grow. Returns list of copies, the new root is its first element '''
+
+        path = []
+        node = self.root
+        while node is not None:
+            new = node.copy()
+            new.size += grow
+            if path: # Link copy to the copy of its parent
+                if path[-1].key > new.key:
+                    path[-1].left = new
+                else:
+                    path[-1].right = new
+            path.append(new)
+            if node.key == key:
+                break
+            node = node.left if node.key > key else node.right
+        return path
+
+    def replace_child(self, root, parent, old, new):
+
+        ''' Put new subtree in place of child old of parent. Returns new root of the tree '''
+
+        if parent is None:
+            return new
+        if parent.left is old:
+            parent.left = new
+        else:
+            parent.right = new
+        return root
+
+    def insert_balance(self, path):
+
+        ''' Balance tree after insertion. path holds copies from the root to the new node. Returns new root '''
+
+        root = path[0]
+        i = len(path) - 1
+        while i >= 2 and path[i - 1].red: # While parent of node is red
+            node, p, gp = path[i], path[i - 1], path[i - 2] # Node, parent and grand parent
+            if gp.left is p: # If parent is left child
+                if is_red(gp.right): # If 'uncle' is red
+                    # Make gp's children black, gp red. Node is gp now
+                    gp.right = gp.right.copy()
+                    gp.right.red = False
+                    p.red = False
+                    gp.red = True
+                    i -= 2
+                    continue
+                if p.right is node: # If node is right child, rotate parent to the left
+                    gp.left = left_rotate(p)
+                    p = node
+                # Make parent black, gp red. Rotate gp to the right
+                p.red = False
+                gp.red = True
+                root = self.replace_child(root, path[i - 3] if i >= 3 else None, gp, right_rotate(gp))
+            else: # If parent is right child
+                if is_red(gp.left): # If 'uncle' is red
+                    # Make gp's children black, gp red. Node is gp now
+                    gp.left = gp.left.copy()
+                    gp.left.red = False
+                    p.red = False
+                    gp.red = True
+                    i -= 2
+                    continue
+                if p.left is node: # If node is left child, rotate parent to the right
+                    gp.right = right_rotate(p)
+                    p = node
+                # Make parent black, gp red. Rotate gp to the left
+                p.red = False
+                gp.red = True
+                root = self.replace_child(root, path[i - 3] if i >= 3 else None, gp, left_rotate(gp))
+            break
+        root.red = False # Root is always a copy, so it can be recolored
+        return root
+
+    def insert(self, key, value):
+
+        ''' Insertion of [key, value] pair '''
+
+        if key in self:
+            raise Exception(f"Pair with key={key} already exists")
+        self.upsert(key, value)
+
+    def upsert(self, key, value):
+
+        ''' Insert [key, value] pair or set value of existing key. Returns True if pair was inserted '''
+
+        if self.root is None: # If tree is empty
+            self.root = PersistentNode(key, value, red=False)
+            return True
+        path = self.copy_path(key, 0)
+        if path[-1].key == key: # Only the value changes
+            path[-1].value = value
+            self.root = path[0]
+            return False
+        for node in path: # Ancestors have one more node in their subtrees
+            node.size += 1
+        node = PersistentNode(key, value)
+        if path[-1].key > key: # New node is left child
+            path[-1].left = node
+        else: # New node is right child
+            path[-1].right = node
+        path.append(node)
+        self.root = self.insert_balance(path)
+        return True
+
+    def remove_balance(self, root, path, node):
+
+        ''' Balance tree after deleting black node. node took place of deleted node, path holds copies from the root to its parent. Returns new root '''
+
+        while path and not is_red(node): # While node is not root of the tree and node's color is black
+            parent = path.pop()
+            grand = path[-1] if path else None
+            # Node may be None, then it is the child of parent which is None too
+            if parent.left is node and (node is not None or parent.right is not None): # If node is left child
+                w = parent.right = parent.right.copy() # Brother of node
+                if w.red: # If brother is red
+                    # Make brother black, parent red. Rotate parent to the left and get new brother of node
+                    w.red = False
+                    parent.red = True
+                    root = self.replace_child(root, grand, parent, left_rotate(parent))
+                    grand = w
+                    path.append(w)
+                    w = parent.right = parent.right.copy()
+                if not is_red(w.left) and not is_red(w.right): # If brother's children are black
+                    # Make brother red. Change current node to its parent
+                    w.red = True
+                    node = parent
+                    continue
+                if not is_red(w.right): # If brother's right child is black
+                    # Make brother's left child black, brother red. Rotate brother to the right and get new brother of node
+                    w.left = w.left.copy()
+                    w.left.red = False
+                    w.red = True
+                    w = parent.right = right_rotate(w)
+                # Make brother's color same as parent's color. Make parent and brother's right child black. Rotate parent to the left
+                w.red = parent.red
+                parent.red = False
+                w.right = w.right.copy()
+                w.right.red = False
+                root = self.replace_child(root, grand, parent, left_rotate(parent))
+            else: # If node is right child
+                w = parent.left = parent.left.copy() # Brother of node
+                if w.red: # If brother is red
+                    # Make brother black, parent red. Rotate parent to the right and get new brother of node
+                    w.red = False
+                    parent.red = True
+                    root = self.replace_child(root, grand, parent, right_rotate(parent))
+                    grand = w
+                    path.append(w)
+                    w = parent.left = parent.left.copy()
+                if not is_red(w.left) and not is_red(w.right): # If brother's children are black
+                    # Make brother red. Change current node to its parent
+                    w.red = True
+                    node = parent
+                    continue
+                if not is_red(w.left): # If brother's left child is black
+                    # Make brother's right child black, brother red. Rotate brother to the left and get new brother of node
+                    w.right = w.right.copy()
+                    w.right.red = False
+                    w.red = True
+                    w = parent.left = left_rotate(w)
+                # Make brother's color same as parent's color. Make parent and brother's left child black. Rotate parent to the right
+                w.red = parent.red
+                parent.red = False
+                w.left = w.left.copy()
+                w.left.red = False
+                root = self.replace_child(root, grand, parent, right_rotate(parent))
+            return root
+        if node is not None: # Node is red or the root, it's a copy
+            node.red = False
+        return root
+
+    def remove(self, key):
+
+        ''' Deleting pair by key '''
+
+        if self.root is None: # If tree is empty
+            raise Exception("Map is empty")
+        if key not in self:
+            raise Exception(f"Pair with key={key} doesn't exist")
+        path = self.copy_path(key, -1)
+        target = path[-1]
+        if target.left is not None and target.right is not None: # Node with two children takes key and value of its successor
+            node = target.right
+            while node is not None: # Copy path to the successor
+                new = node.copy()
+                new.size -= 1
+                if path[-1] is target:
+                    path[-1].right = new
+                else:
+                    path[-1].left = new
+                path.append(new)
+                node = new.left
+            target.key, target.value = path[-1].key, path[-1].value
+        spliced = path.pop() # Node to unlink, it has at most one child
+        child = spliced.left if spliced.left is not None else spliced.right
+        balance = not spliced.red and not is_red(child) # Black node without red child removed, black height of the path decreased
+        if is_red(child): # Red child takes place and color of black node
+            child = child.copy()
+            child.red = False
+        root = self.replace_child(path[0] if path else None, path[-1] if path else None, spliced, child)
+        if balance and path:
+            root = self.remove_balance(root, path, child)
+        self.root = root
+
+    def find_node(self, key):
+
+        ''' Find node by key. Returns None if key is absent '''
+
+        node = self.root
+        while node is not None and node.key != key:
+            node = node.left if node.key > key else node.right
+        return node
+
+    def find(self, key):
+
+        ''' Find value by key. Returns None if key is absent '''
+
+        if self.root is None: # If tree is empty
+            raise Exception("Map is empty")
+        node = self.find_node(key)
+        if node is None: # If element is not found return None
+            return None
+        return node.value
+
+    def nodes(self, reverse=False):
+
+        ''' Lazy in-order traversal of nodes of the current version. Later changes of the tree don't affect it '''
+
+        return traverse(self.root, reverse)
+
+    def range_nodes(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Lazy traversal of nodes of the current version with keys between lo and hi. None bound means unbounded '''
+
+        return traverse_range(self.root, lo, hi, inclusive, reverse)
+
+    def irange(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterate over keys between lo and hi '''
+
+        return (node.key for node in self.range_nodes(lo, hi, inclusive, reverse))
+
+    def irange_items(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterate over (key, value) pairs with keys between lo and hi '''
+
+        return ((node.key, node.value) for node in self.range_nodes(lo, hi, inclusive, reverse))
+
+    def min(self):
+
+        ''' Pair with the smallest key '''
+
+        if self.root is None: # If tree is empty
+            raise Exception("Map is empty")
+        node = self.root
+        while node.left is not None:
+            node = node.left
+        return node.key, node.value
+
+    def max(self):
+
+        ''' Pair with the biggest key '''
+
+        if self.root is None: # If tree is empty
+            raise Exception("Map is empty")
+        node = self.root
+        while node.right is not None:
+            node = node.right
+        return node.key, node.value
+
+    def clear(self):
+
+        ''' Clear tree in O(1). Snapshots keep their nodes '''
+
+        self.root = None
+
+    def __getitem__(self, key):
+
+        ''' Get value by key using [] operator '''
+
+        return self.find(key)
+
+    def __setitem__(self, key, value):
+
+        ''' Set value of existing key using [] operator '''
+
+        if self.root is None: # If tree is empty
+            raise Exception("Map is empty")
+        if key not in self:
+            raise Exception(f"Map doesn't have a pair with key={key}")
+        self.upsert(key, value)
+
+    def __delitem__(self, key):
+
+        ''' Delete pair by key using del operator '''
+
+        self.remove(key)
+
+    def __contains__(self, key):
+
+        ''' Check if tree has a pair with key using in operator '''
+
+        return self.find_node(key) is not None
+
+    def __len__(self):
+
+        ''' Number of pairs in the tree '''
+
+        return size(self.root)
+
+    def __iter__(self):
+
+        ''' Iterate over keys in ascending order '''
+
+        return (node.key for node in self.nodes())
+
+    def __reversed__(self):
+
+        ''' Iterate over keys in descending order '''
+
+        return (node.key for node in self.nodes(reverse=True))
+
+    def keys(self, reverse=False):
+
+        ''' Iterate over keys in key order '''
+
+        return (node.key for node in self.nodes(reverse))
+
+    def values(self, reverse=False):
+
+        ''' Iterate over values in key order '''
+
+        return (node.value for node in self.nodes(reverse))
+
+    def items(self, reverse=False):
+
+        ''' Iterate over (key, value) pairs in key order '''
+
+        return ((node.key, node.value) for node in self.nodes(reverse))
+
+    def empty(self):
+
+        ''' Check if tree is empty '''
+
+        return self.root is None
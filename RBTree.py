@@ -1,9 +1,15 @@
+import copy
+import operator
+import RBTreeFile
+import RBTreeStats
 import Stack
 
 class Node:
 
     ''' Node of Red-Black Tree '''
 
+    __slots__ = ('key', 'value', 'left', 'right', 'parent', 'red', 'size') # No per-instance __dict__
+
     def __init__(self, key, value, left=None, right=None, parent=None, red=True):
         self.key = key # Key
         self.value = value # Value
@@ -11,19 +17,78 @@ class Node:
         self.right = right # Right child
         self.parent = parent # Parent
         self.red = red # Color (True=Red, False=Black)
+        self.size = 1 # Number of nodes in subtree
 
 
 class RBTree:
 
     ''' Red-Black Tree '''
 
+    node_type = Node # Class of tree nodes. Subclasses may store extra data in nodes
+
     def __init__(self, root=None): 
         self.root = root
-        self.nil = Node(None, None, parent=root, red=False)
+        self.nil = self.node_type(None, None, parent=root, red=False)
+        self.nil.size = 0 # Nil is an empty subtree
         if self.root is not None: # If root is passed
             self.root.left = self.nil
             self.root.right = self.nil
 
+    @classmethod
+    def from_sorted(cls, iterable, **kwargs):
+
+        ''' Build tree from (key, value) pairs sorted by key in O(n). kwargs are passed to the constructor '''
+
+        pairs = list(iterable)
+        for i in range(1, len(pairs)): # Keys must be strictly increasing
+            if not pairs[i - 1][0] < pairs[i][0]:
+                raise Exception(f"Keys are not sorted: key={pairs[i][0]} after key={pairs[i - 1][0]}")
+        tree = cls(**kwargs)
+        if pairs:
+            # Every level above the deepest one is full, so only nodes on the deepest level are red
+            tree.root = tree.build(pairs, 0, len(pairs), None, 0, len(pairs).bit_length() - 1)
+        return tree
+
+    @classmethod
+    def from_unsorted(cls, iterable, **kwargs):
+
+        ''' Build tree from (key, value) pairs in any order. Last pair wins for equal keys '''
+
+        pairs = []
+        for pair in sorted(iterable, key=operator.itemgetter(0)): # Stable sort keeps pairs with equal keys in input order
+            if pairs and pairs[-1][0] == pair[0]:
+                pairs[-1] = pair # Replace previous pair with equal key
+            else:
+                pairs.append(pair)
+        return cls.from_sorted(pairs, **kwargs)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+
+        ''' Build tree from file written by dump in O(n). kwargs are passed to the constructor '''
+
+        return cls.from_sorted(RBTreeFile.load_pairs(path), **kwargs)
+
+    def dump(self, path):
+
+        ''' Write pairs to binary file in key order. RBTreeFile.MappedRBTree can search the file without loading it '''
+
+        RBTreeFile.dump(self.items(), path)
+
+    def build(self, pairs, lo, hi, parent, depth, red_depth):
+
+        ''' Build balanced subtree from sorted pairs[lo:hi] without rotations '''
+
+        if lo >= hi: # Empty subtree
+            return self.nil
+        mid = (lo + hi) // 2
+        key, value = pairs[mid]
+        node = self.node_type(key, value, parent=parent, red=depth == red_depth and depth > 0) # Root is always black
+        node.left = self.build(pairs, lo, mid, node, depth + 1, red_depth) # Build left subtree from smaller keys
+        node.right = self.build(pairs, mid + 1, hi, node, depth + 1, red_depth) # Build right subtree from bigger keys
+        self.update(node)
+        return node
+
     def left_rotate(self, node):
         
         ''' Left rotate the node '''
@@ -48,6 +113,10 @@ class RBTree:
             child.left = node # Child's left child is node
             node.right = temp # Node right is prev child's left child
             node.parent = child # Parent of node is child
+        if temp != self.nil: # Moved subtree gets node as parent
+            temp.parent = node
+        self.update(node) # Node is child's child now, so update it first
+        self.update(child)
             
 
     def right_rotate(self, node):
@@ -72,6 +141,24 @@ class RBTree:
             child.right = node # Child's right child is node
             node.left = temp # Node left is prev child's right child
             node.parent = child # Parent of node is child
+        if temp != self.nil: # Moved subtree gets node as parent
+            temp.parent = node
+        self.update(node) # Node is child's child now, so update it first
+        self.update(child)
+
+    def update(self, node):
+
+        ''' Recompute subtree size of node from its children '''
+
+        node.size = node.left.size + node.right.size + 1
+
+    def update_path(self, node, delta):
+
+        ''' Change subtree sizes by delta from node up to the root '''
+
+        while node is not None:
+            node.size += delta
+            node = node.parent
 
     def insert_balance(self, node):
 
@@ -113,33 +200,75 @@ class RBTree:
                     self.left_rotate(gp)
             else: # If gp is None
                 break
+        grew = self.root.red # Red root is recolored, so black height of the tree grows
         self.root.red = False # Set root color to black
+        return grew
 
-    def insert(self, key, value, root=None):
+    def insert(self, key, value):
 
         ''' Insertion of [key, value] pair '''
 
         if self.empty(): # If tree is empty
-            self.root = Node(key, value, self.nil, self.nil, red=False) # Insert node as a root
-        else:
-            if root is None: # Pass root only inside insert method. Set to tree root by default
-                root = self.root
-            if root.key == key: # If pair with passed key already exists
+            self.root = self.node_type(key, value, self.nil, self.nil, red=False) # Insert node as a root
+            return
+        parent = None
+        cur = self.root
+        while cur != self.nil: # Find place to insert
+            if cur.key == key: # If pair with passed key already exists
                 raise Exception(f"Pair with key={key} already exists")
-            if root.key > key: # Go to the left subtree
-                if root.left == self.nil: # Found place to insert
-                    root.left = Node(key, value, self.nil, self.nil, parent=root) # Insert the new node
-                    if root != self.root: # If new node's parent is not root
-                        self.insert_balance(root.left) # Balance the tree
-                else:
-                    self.insert(key, value, root.left) # Insert to the left subtree
+            parent = cur
+            if cur.key > key: # Go to the left subtree
+                cur = cur.left
             else: # Go to the right subtree
-                if root.right == self.nil: # Found place to insert
-                    root.right = Node(key, value, self.nil, self.nil, parent=root) # Insert the new node
-                    if root != self.root: # If new node's parent is not root
-                        self.insert_balance(root.right) # Balance the tree
-                else:
-                    self.insert(key, value, root.right) # Insert to the right subtree
+                cur = cur.right
+        self.attach(parent, key, value)
+
+    def upsert(self, key, value):
+
+        ''' Insert [key, value] pair or set value of existing key. Returns True if pair was inserted '''
+
+        if self.empty(): # If tree is empty
+            self.root = self.node_type(key, value, self.nil, self.nil, red=False) # Insert node as a root
+            return True
+        parent = None
+        cur = self.root
+        while cur != self.nil: # Find element or place to insert
+            if cur.key == key: # If pair with passed key already exists
+                self.set_value(cur, value) # Set new value to the element
+                return False
+            parent = cur
+            if cur.key > key: # Go to the left subtree
+                cur = cur.left
+            else: # Go to the right subtree
+                cur = cur.right
+        self.attach(parent, key, value)
+        return True
+
+    def insert_or_assign(self, key, value):
+
+        ''' Same as upsert '''
+
+        return self.upsert(key, value)
+
+    def set_value(self, node, value):
+
+        ''' Set value of node '''
+
+        node.value = value
+
+    def attach(self, parent, key, value):
+
+        ''' Insert new node as a child of parent node and balance the tree '''
+
+        node = self.node_type(key, value, self.nil, self.nil, parent=parent)
+        if parent.key > key: # New node is left child
+            parent.left = node
+        else: # New node is right child
+            parent.right = node
+        self.update_path(parent, 1) # Ancestors have one more node in their subtrees
+        if parent != self.root: # If new node's parent is not root
+            self.insert_balance(node) # Balance the tree
+        return node
 
     def remove_balance(self, node, parent=None):
 
@@ -208,89 +337,812 @@ class RBTree:
 
         if self.empty(): # If tree is empty
             raise Exception("Map is empty")
+        node_to_delete = self.find_node(key)
+        if node_to_delete == self.nil: # If node is not found
+            raise Exception(f"Pair with key={key} doesn't exist")
+        self.remove_node(node_to_delete)
+
+    def remove_node(self, node_to_delete):
+
+        ''' Deleting node of the tree '''
+
+        cur = node_to_delete
+        if node_to_delete.left == self.nil and node_to_delete.right == self.nil: # If node to delete has no children
+            if node_to_delete != self.root: 
+                if node_to_delete.parent.left == node_to_delete: # If node to delete is left child
+                    node_to_delete.parent.left = self.nil
+                else: # If node to delete is right child
+                    node_to_delete.parent.right = self.nil 
+                self.update_path(node_to_delete.parent, -1)
+                if not node_to_delete.red: # If deleted node was black
+                    self.remove_balance(self.nil, node_to_delete.parent) # Balance tree
+            else: # If node to delete is tree root
+                self.root = self.nil # If node to delete is root of the tree
+        elif node_to_delete.left != self.nil and node_to_delete.right == self.nil: # If node to delete has only left child
+            if node_to_delete != self.root:
+                if node_to_delete.parent.left == node_to_delete: # If node to delete is left child
+                    node_to_delete.parent.left = node_to_delete.left
+                else: # If node to delete is right child
+                    node_to_delete.parent.right = node_to_delete.left
+                node_to_delete.left.parent = node_to_delete.parent
+                self.update_path(node_to_delete.parent, -1)
+                if not node_to_delete.red: # If deleted node was black
+                    self.remove_balance(node_to_delete.left) # Balance tree
+            else: # If node to delete is tree root
+                # Copy left child's [key, value] to tree root and delete left child of tree root
+                self.root.key, self.root.value = self.root.left.key, self.root.left.value
+                self.root.left = self.nil
+                self.update(self.root)
+        elif node_to_delete.right != self.nil and node_to_delete.left == self.nil: # If node to delete has only right child
+            if node_to_delete != self.root:
+                if node_to_delete.parent.left == node_to_delete: # If node to delete is left child
+                    node_to_delete.parent.left = node_to_delete.right
+                else: # If node to delete is right child
+                    node_to_delete.parent.right = node_to_delete.right
+                node_to_delete.right.parent = node_to_delete.parent
+                self.update_path(node_to_delete.parent, -1)
+                if not node_to_delete.red: # If deleted node was black
+                    self.remove_balance(node_to_delete.right) # Balance tree
+            else: # If node to delete is tree root
+                # Copy right child's [key, value] to tree root and delete right child of tree root
+                self.root.key, self.root.value = self.root.right.key, self.root.right.value
+                self.root.right = self.nil
+                self.update(self.root)
+        else: # If node to delete has both children
+            node_to_delete = self.minimum(node_to_delete.right) # Find smallest element is right subtree
+            cur.key, cur.value = node_to_delete.key,  node_to_delete.value # Copy smallest element's [key, value] to node to delete and delete smallest element
+            child = node_to_delete.right # Smallest element can only have right child
+            if cur.right != node_to_delete: # If smallest is not node to delete right child
+                node_to_delete.parent.left = child
+            else:
+                cur.right = child
+            if child != self.nil:
+                child.parent = node_to_delete.parent
+            self.update_path(node_to_delete.parent, -1)
+            if not node_to_delete.red: # If deleted node was black
+                self.remove_balance(child, node_to_delete.parent) # Balance tree
+
+    def find_node(self, key):
+
+        ''' Find node by key. Returns nil if node is not found '''
+
+        if self.empty(): # If tree is empty
+            return self.nil
+        cur = self.root
+        while cur != self.nil and cur.key != key: # Find element
+            if cur.key > key:
+                cur = cur.left # Go to the left subtree
+            else:
+                cur = cur.right # Go to the right subtree
+        return cur
+
+    def minimum(self, node):
+
+        ''' Node with the smallest key in subtree '''
+
+        while node.left != self.nil:
+            node = node.left
+        return node
+
+    def maximum(self, node):
+
+        ''' Node with the biggest key in subtree '''
+
+        while node.right != self.nil:
+            node = node.right
+        return node
+
+    def successor(self, node):
+
+        ''' Next node in key order. Returns nil for the last node '''
+
+        if node.right != self.nil: # Smallest node of right subtree
+            return self.minimum(node.right)
+        while node.parent is not None and node.parent.right == node: # Go up while node is right child
+            node = node.parent
+        return self.nil if node.parent is None else node.parent
+
+    def predecessor(self, node):
+
+        ''' Previous node in key order. Returns nil for the first node '''
+
+        if node.left != self.nil: # Biggest node of left subtree
+            return self.maximum(node.left)
+        while node.parent is not None and node.parent.left == node: # Go up while node is left child
+            node = node.parent
+        return self.nil if node.parent is None else node.parent
+
+    def floor_node(self, key, inclusive=True):
+
+        ''' Node with the biggest key less than (or equal to) key. Returns nil if there is no such node '''
+
+        result = self.nil
+        if self.empty(): # If tree is empty
+            return result
+        cur = self.root
+        if inclusive:
+            while cur != self.nil:
+                if cur.key <= key: # Node fits, look for a bigger one in the right subtree
+                    result = cur
+                    cur = cur.right
+                else:
+                    cur = cur.left
         else:
-            node_to_delete = None
-            cur = self.root
-            while cur != self.nil and cur.key != key: # Find node to delete
-                if cur.key > key: # Go to the left subtree
+            while cur != self.nil:
+                if cur.key < key: # Node fits, look for a bigger one in the right subtree
+                    result = cur
+                    cur = cur.right
+                else:
+                    cur = cur.left
+        return result
+
+    def ceiling_node(self, key, inclusive=True):
+
+        ''' Node with the smallest key greater than (or equal to) key. Returns nil if there is no such node '''
+
+        result = self.nil
+        if self.empty(): # If tree is empty
+            return result
+        cur = self.root
+        if inclusive:
+            while cur != self.nil:
+                if cur.key >= key: # Node fits, look for a smaller one in the left subtree
+                    result = cur
                     cur = cur.left
-                else: # Go to the right subtree
+                else:
                     cur = cur.right
-            if cur == self.nil: # If node is not found
-                raise Exception(f"Pair with key={key} doesn't exist")
-            node_to_delete = cur
-            if node_to_delete.left == self.nil and node_to_delete.right == self.nil: # If node to delete has no children
-                if node_to_delete != self.root: 
-                    if node_to_delete.parent.left == node_to_delete: # If node to delete is left child
-                        node_to_delete.parent.left = self.nil
-                    else: # If node to delete is right child
-                        node_to_delete.parent.right = self.nil 
-                    if not node_to_delete.red: # If deleted node was black
-                        self.remove_balance(self.nil, node_to_delete.parent) # Balance tree
-                else: # If node to delete is tree root
-                    self.root = self.nil # If node to delete is root of the tree
-            elif node_to_delete.left != self.nil and node_to_delete.right == self.nil: # If node to delete has only left child
-                if node_to_delete != self.root:
-                    if node_to_delete.parent.left == node_to_delete: # If node to delete is left child
-                        node_to_delete.parent.left = node_to_delete.left
-                    else: # If node to delete is right child
-                        node_to_delete.parent.right = node_to_delete.left
-                    if not node_to_delete.red: # If deleted node was black
-                        self.remove_balance(node_to_delete.left) # Balance tree
-                else: # If node to delete is tree root
-                    # Copy left child's [key, value] to tree root and delete left child of tree root
-                    self.root.key, self.root.value = self.root.left.key, self.root.left.value
-                    self.root.left = self.nil
-            elif node_to_delete.right != self.nil and node_to_delete.left == self.nil: # If node to delete has only right child
-                if node_to_delete != self.root:
-                    if node_to_delete.parent.left == node_to_delete: # If node to delete is left child
-                        node_to_delete.parent.left = node_to_delete.right
-                    else: # If node to delete is right child
-                        node_to_delete.parent.right = node_to_delete.right
-                    if not node_to_delete.red: # If deleted node was black
-                        self.remove_balance(node_to_delete.right) # Balance tree
-                else: # If node to delete is tree root
-                    # Copy right child's [key, value] to tree root and delete right child of tree root
-                    self.root.key, self.root.value = self.root.right.key, self.root.right.value
-                    self.root.right = self.nil
-            else: # If node to delete has both children
-                node_to_delete = node_to_delete.right
-                while  node_to_delete.left != self.nil: # Find smallest element is right subtree
-                     node_to_delete = node_to_delete.left
-                cur.key, cur.value = node_to_delete.key,  node_to_delete.value # Copy smallest element's [key, value] to node to delete and delete smallest element
-                if cur.right != node_to_delete: # If smallest is node to delete right children
-                    node_to_delete.parent.left = self.nil
-                    if not node_to_delete.red: # If deleted node was black
-                        self.remove_balance(self.nil, node_to_delete.parent) # Balance tree
+        else:
+            while cur != self.nil:
+                if cur.key > key: # Node fits, look for a smaller one in the left subtree
+                    result = cur
+                    cur = cur.left
                 else:
-                    cur.right = node_to_delete.right
-                    cur.right.parent = cur
-                    if not node_to_delete.red: # If deleted node was black
-                        self.remove_balance(cur.right) # Balance tree
+                    cur = cur.right
+        return result
 
-    def find(self, key):
+    def node_pair(self, node):
 
-        ''' Find element by key ''' 
+        ''' (key, value) pair of node or None for nil. Raises exception in empty tree '''
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        if node == self.nil: # If there is no such pair
+            return None
+        return node.key, node.value
+
+    def floor(self, key):
+
+        ''' (key, value) pair with the biggest key <= key or None '''
+
+        return self.node_pair(self.floor_node(key))
+
+    def ceiling(self, key):
+
+        ''' (key, value) pair with the smallest key >= key or None '''
+
+        return self.node_pair(self.ceiling_node(key))
+
+    def lower(self, key):
+
+        ''' (key, value) pair with the biggest key < key or None '''
+
+        return self.node_pair(self.floor_node(key, inclusive=False))
+
+    def higher(self, key):
+
+        ''' (key, value) pair with the smallest key > key or None '''
+
+        return self.node_pair(self.ceiling_node(key, inclusive=False))
+
+    def min(self):
+
+        ''' (key, value) pair with the smallest key '''
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        node = self.minimum(self.root)
+        return node.key, node.value
+
+    def max(self):
+
+        ''' (key, value) pair with the biggest key '''
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        node = self.maximum(self.root)
+        return node.key, node.value
+
+    def pop_min(self):
+
+        ''' Remove and return (key, value) pair with the smallest key '''
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        node = self.minimum(self.root)
+        pair = node.key, node.value # Save pair before deleting, because remove_node can move pairs between nodes
+        self.remove_node(node)
+        return pair
+
+    def pop_max(self):
+
+        ''' Remove and return (key, value) pair with the biggest key '''
 
         if self.empty(): # If tree is empty
             raise Exception("Map is empty")
+        node = self.maximum(self.root)
+        pair = node.key, node.value # Save pair before deleting, because remove_node can move pairs between nodes
+        self.remove_node(node)
+        return pair
+
+    def range_nodes(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Lazy traversal of nodes with keys between lo and hi. None bound means unbounded '''
+
+        if self.empty(): # Nothing to traverse in empty tree
+            return
+        if reverse: # Seek the biggest node in range and go to predecessors
+            node = self.maximum(self.root) if hi is None else self.floor_node(hi, inclusive[1])
+            while node != self.nil:
+                if lo is not None and (node.key < lo or not inclusive[0] and node.key == lo): # Out of range
+                    return
+                yield node
+                node = self.predecessor(node)
+        else: # Seek the smallest node in range and go to successors
+            node = self.minimum(self.root) if lo is None else self.ceiling_node(lo, inclusive[0])
+            while node != self.nil:
+                if hi is not None and (node.key > hi or not inclusive[1] and node.key == hi): # Out of range
+                    return
+                yield node
+                node = self.successor(node)
+
+    def irange(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterate over keys between lo and hi '''
+
+        for node in self.range_nodes(lo, hi, inclusive, reverse):
+            yield node.key
+
+    def irange_items(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterate over (key, value) pairs with keys between lo and hi '''
+
+        for node in self.range_nodes(lo, hi, inclusive, reverse):
+            yield node.key, node.value
+
+    def rank(self, key, inclusive=False):
+
+        ''' Number of keys less than (or equal to) key '''
+
+        result = 0
+        if self.empty(): # If tree is empty
+            return result
         cur = self.root
-        while cur != self.nil and cur.key != key: # Find element
-            if cur.key > key:
-                cur = cur.left
+        while cur != self.nil:
+            if cur.key < key or inclusive and cur.key == key: # Node and its left subtree are counted
+                result += cur.left.size + 1
+                cur = cur.right
             else:
+                cur = cur.left
+        return result
+
+    def bisect_left(self, key):
+
+        ''' Index where key would be inserted before equal key '''
+
+        return self.rank(key)
+
+    def bisect_right(self, key):
+
+        ''' Index where key would be inserted after equal key '''
+
+        return self.rank(key, inclusive=True)
+
+    def count_range(self, lo=None, hi=None, inclusive=(True, False)):
+
+        ''' Number of keys between lo and hi in O(log n). None bound means unbounded '''
+
+        count = len(self) if hi is None else self.rank(hi, inclusive[1])
+        if lo is not None:
+            count -= self.rank(lo, not inclusive[0])
+        return max(count, 0)
+
+    def select_node(self, index):
+
+        ''' Node with index-th smallest key. Negative index counts from the end '''
+
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size: # If index is out of range
+            raise Exception(f"Index {index} is out of range")
+        cur = self.root
+        while cur.left.size != index: # Number of smaller keys in subtree is left subtree size
+            if index < cur.left.size: # Go to the left subtree
+                cur = cur.left
+            else: # Skip left subtree and node, go to the right subtree
+                index -= cur.left.size + 1
                 cur = cur.right
+        return cur
+
+    def select(self, index):
+
+        ''' (key, value) pair by position in key order. Slice returns list of pairs '''
+
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            count = len(range(start, stop, step))
+            result = []
+            if count == 0: # Empty slice
+                return result
+            node = self.select_node(start) # Seek the first node, then walk neighbours
+            move = self.successor if step > 0 else self.predecessor
+            while True:
+                result.append((node.key, node.value))
+                if len(result) == count:
+                    return result
+                for _ in range(abs(step)):
+                    node = move(node)
+        node = self.select_node(index)
+        return node.key, node.value
+
+    def seek(self, key, finger=None):
+
+        ''' Find node by key starting from finger node instead of the root. Returns (node, parent): node is nil if key is not found, parent is the last visited node '''
+
+        if self.empty(): # If tree is empty
+            return self.nil, None
+        cur = self.root
+        if finger is not None and finger != self.nil:
+            # Climb while ancestors are on the same side of key as finger. Subtree of the first ancestor on the other side contains key
+            cur = finger
+            if cur.key < key:
+                while cur.parent is not None and cur.parent.key < key:
+                    cur = cur.parent
+                if cur.parent is not None and cur.parent.key == key:
+                    cur = cur.parent
+            elif cur.key > key:
+                while cur.parent is not None and cur.parent.key > key:
+                    cur = cur.parent
+                if cur.parent is not None and cur.parent.key == key:
+                    cur = cur.parent
+        parent = cur.parent
+        while cur != self.nil and cur.key != key: # Descend from found subtree
+            parent = cur
+            if cur.key > key:
+                cur = cur.left # Go to the left subtree
+            else:
+                cur = cur.right # Go to the right subtree
+        return cur, parent
+
+    @staticmethod
+    def batch_pairs(keys, values=None):
+
+        ''' List of (key, value) pairs from iterable of pairs or from keys and values. Accepts NumPy arrays '''
+
+        if hasattr(keys, 'tolist'): # NumPy array. Convert to Python scalars once instead of per comparison
+            keys = keys.tolist()
+        if values is None:
+            return [tuple(pair) for pair in keys]
+        if hasattr(values, 'tolist'):
+            values = values.tolist()
+        return list(zip(keys, values))
+
+    @staticmethod
+    def batch_keys(keys):
+
+        ''' List of keys. Accepts NumPy arrays '''
+
+        if hasattr(keys, 'tolist'): # NumPy array. Convert to Python scalars once instead of per comparison
+            return keys.tolist()
+        return list(keys)
+
+    @staticmethod
+    def is_sorted(keys):
+
+        ''' Check if keys are in ascending or descending order '''
+
+        return all(a <= b for a, b in zip(keys, keys[1:])) or all(a >= b for a, b in zip(keys, keys[1:]))
+
+    def insert_many(self, keys, values=None):
+
+        ''' Insert many pairs. Returns list of flags: True if pair was inserted, False if key already exists '''
+
+        pairs = self.batch_pairs(keys, values)
+        keys = [pair[0] for pair in pairs]
+        use_finger = self.is_sorted(keys) # Sorted batch continues search from previous node
+        ascending = not keys or keys[0] <= keys[-1]
+        result = []
+        finger = None
+        edge = None # Biggest node for ascending batch, smallest for descending. Keys beyond it are attached without search
+        for key, value in pairs:
+            if self.empty(): # If tree is empty
+                self.insert(key, value)
+                finger = self.root
+                result.append(True)
+                continue
+            if use_finger and edge is None:
+                edge = self.maximum(self.root) if ascending else self.minimum(self.root)
+            beyond = use_finger and (key > edge.key if ascending else key < edge.key)
+            if beyond: # Appending to the end doesn't need climbing from finger
+                node, parent = self.nil, edge
+            else:
+                node, parent = self.seek(key, finger if use_finger else None)
+            if node != self.nil: # If pair with passed key already exists
+                finger = node
+                result.append(False)
+            else:
+                finger = self.attach(parent, key, value)
+                if beyond:
+                    edge = finger
+                result.append(True)
+        return result
+
+    def update_many(self, keys, values=None):
+
+        ''' Set values of many existing keys. Returns list of flags: True if key was found '''
+
+        pairs = self.batch_pairs(keys, values)
+        use_finger = self.is_sorted([pair[0] for pair in pairs]) # Sorted batch continues search from previous node
+        result = []
+        finger = None
+        for key, value in pairs:
+            node, _ = self.seek(key, finger if use_finger else None)
+            if node != self.nil:
+                self.set_value(node, value)
+                finger = node
+            result.append(node != self.nil)
+        return result
+
+    def remove_many(self, keys):
+
+        ''' Delete many pairs by keys. Returns list of flags: True if key was found and deleted '''
+
+        keys = self.batch_keys(keys)
+        use_finger = self.is_sorted(keys) # Sorted batch continues search from previous node
+        result = []
+        finger = None
+        for key in keys:
+            node, _ = self.seek(key, finger if use_finger else None)
+            if node == self.nil: # If node is not found
+                result.append(False)
+                continue
+            # Next search starts from a node that stays in the tree
+            if node.left != self.nil and node.right != self.nil: # Node gets its successor's pair
+                finger = node
+            else:
+                finger = node.parent
+            self.remove_node(node)
+            result.append(True)
+        return result
+
+    def find_many(self, keys, default=None):
+
+        ''' Find values of many keys. Missing keys get default value '''
+
+        keys = self.batch_keys(keys)
+        use_finger = self.is_sorted(keys) # Sorted batch continues search from previous node
+        result = []
+        finger = None
+        for key in keys:
+            node, parent = self.seek(key, finger if use_finger else None)
+            if node != self.nil:
+                finger = node
+                result.append(node.value)
+            else:
+                finger = parent
+                result.append(default)
+        return result
+
+    def find(self, key):
+
+        ''' Find element by key ''' 
+
+        if self.empty(): # If tree is empty
+            raise Exception("Map is empty")
+        cur = self.find_node(key)
         if cur == self.nil: # If element is not found return None
             return None
         else: # Return element's value
             return cur.value
 
+    def subtree(self, root):
+
+        ''' Tree with the same nil and settings as self, rooted at root '''
+
+        tree = object.__new__(type(self))
+        tree.__dict__.update(self.__dict__)
+        tree.root = root
+        if root != self.nil:
+            root.parent = None
+        return tree
+
+    def black_height(self, node):
+
+        ''' Number of black nodes on path from node down to nil '''
+
+        height = 0
+        while node != self.nil:
+            if not node.red:
+                height += 1
+            node = node.left
+        return height
+
+    def share_nil(self, other):
+
+        ''' Make both trees use the same nil. Nodes of the smaller tree are rewired in O(min(n, m)) '''
+
+        if self.nil == other.nil:
+            return
+        small, big = (other, self) if len(other) <= len(self) else (self, other)
+        for node in list(small.nodes()):
+            if node.left == small.nil:
+                node.left = big.nil
+            if node.right == small.nil:
+                node.right = big.nil
+        if small.empty():
+            small.root = big.nil
+        small.nil = big.nil
+
+    def join_nodes(self, left, left_bh, mid, right, right_bh):
+
+        ''' Join subtrees with node mid between them in O(|left_bh - right_bh| + 1). Returns (root, black height) '''
+
+        nil = self.nil
+        if left.red: # Roots of joined subtrees must be black
+            left.red = False
+            left_bh += 1
+        if right.red:
+            right.red = False
+            right_bh += 1
+        mid.parent = None
+        if left_bh == right_bh: # Mid becomes black root
+            mid.left, mid.right, mid.red = left, right, False
+            if left != nil:
+                left.parent = mid
+            if right != nil:
+                right.parent = mid
+            self.update(mid)
+            return mid, left_bh + 1
+        mid.red = True
+        if left_bh > right_bh: # Attach mid with right subtree to the right spine of left subtree
+            tree = self.subtree(left)
+            parent, cur, height = None, left, left_bh
+            while cur.red or height != right_bh: # Find black node with the same black height as right subtree
+                if not cur.red:
+                    height -= 1
+                parent, cur = cur, cur.right
+            parent.right = mid
+            mid.left, mid.right = cur, right
+        else: # Attach left subtree with mid to the left spine of right subtree
+            tree = self.subtree(right)
+            parent, cur, height = None, right, right_bh
+            while cur.red or height != left_bh: # Find black node with the same black height as left subtree
+                if not cur.red:
+                    height -= 1
+                parent, cur = cur, cur.left
+            parent.left = mid
+            mid.left, mid.right = left, cur
+        mid.parent = parent
+        if mid.left != nil:
+            mid.left.parent = mid
+        if mid.right != nil:
+            mid.right.parent = mid
+        old_size = cur.size
+        self.update(mid)
+        tree.update_path(parent, mid.size - old_size) # Ancestors got mid and the other subtree
+        grew = tree.insert_balance(mid) # Mid can be red child of red node
+        return tree.root, max(left_bh, right_bh) + grew
+
+    def join_pair(self, left, left_bh, right, right_bh):
+
+        ''' Join subtrees without a middle node. Returns (root, black height) '''
+
+        if left == self.nil:
+            return right, right_bh
+        if right == self.nil:
+            return left, left_bh
+        tree = self.subtree(right) # Take the smallest pair of right subtree as the middle
+        node = tree.minimum(right)
+        mid = self.node_type(node.key, node.value)
+        tree.remove_node(node)
+        return self.join_nodes(left, left_bh, mid, tree.root, tree.black_height(tree.root))
+
+    def split_nodes(self, node, bh, key):
+
+        ''' Split subtree by key. Returns (left root, left black height, node with key or None, right root, right black height) '''
+
+        if node == self.nil:
+            return self.nil, 0, None, self.nil, 0
+        child_bh = bh - (0 if node.red else 1)
+        left, right = node.left, node.right
+        if left != self.nil:
+            left.parent = None
+        if right != self.nil:
+            right.parent = None
+        if node.key == key:
+            return left, child_bh, node, right, child_bh
+        if node.key > key: # Key splits left subtree, node and right subtree go right
+            left, left_bh, found, mid, mid_bh = self.split_nodes(left, child_bh, key)
+            right, right_bh = self.join_nodes(mid, mid_bh, node, right, child_bh)
+        else: # Key splits right subtree, left subtree and node go left
+            mid, mid_bh, found, right, right_bh = self.split_nodes(right, child_bh, key)
+            left, left_bh = self.join_nodes(left, child_bh, node, mid, mid_bh)
+        return left, left_bh, found, right, right_bh
+
+    def split(self, key):
+
+        ''' Split tree into trees with keys less than key and keys greater than or equal to key in O(log n). Tree is emptied '''
+
+        root = self.nil if self.empty() else self.root
+        left, _, found, right, right_bh = self.split_nodes(root, self.black_height(root), key)
+        if found is not None: # Pair with key goes to the right tree
+            right, right_bh = self.join_nodes(self.nil, 0, found, right, right_bh)
+        left.red = right.red = False # Halves can have red roots. Nil stays black
+        self.root = self.nil
+        return self.subtree(left), self.subtree(right)
+
+    @classmethod
+    def join(cls, left, key, value, right):
+
+        ''' Tree with pairs of left tree, [key, value] pair and pairs of right tree in O(log n). All keys of left must be less than key and all keys of right greater. Trees are emptied '''
+
+        if not left.empty() and not left.max()[0] < key or not right.empty() and not right.min()[0] > key:
+            raise Exception(f"Keys of left tree must be less than key={key} and keys of right tree greater")
+        left.share_nil(right)
+        left_root = left.nil if left.empty() else left.root
+        right_root = right.nil if right.empty() else right.root
+        root, _ = left.join_nodes(left_root, left.black_height(left_root), left.node_type(key, value), right_root, right.black_height(right_root))
+        tree = left.subtree(root)
+        left.root = left.nil
+        right.root = right.nil
+        return tree
+
+    def union_nodes(self, a, a_bh, b, b_bh, merge):
+
+        ''' Union of subtrees. b's root splits a, halves are merged recursively '''
+
+        if a == self.nil:
+            return b, b_bh
+        if b == self.nil:
+            return a, a_bh
+        child_bh = b_bh - (0 if b.red else 1)
+        b_left, b_right = b.left, b.right
+        a_left, a_left_bh, found, a_right, a_right_bh = self.split_nodes(a, a_bh, b.key)
+        if found is not None: # Key is in both trees
+            b.value = merge(found.value, b.value)
+        left, left_bh = self.union_nodes(a_left, a_left_bh, b_left, child_bh, merge)
+        right, right_bh = self.union_nodes(a_right, a_right_bh, b_right, child_bh, merge)
+        return self.join_nodes(left, left_bh, b, right, right_bh)
+
+    def intersection_nodes(self, a, a_bh, b, b_bh, merge):
+
+        ''' Intersection of subtrees. b's root splits a, halves are intersected recursively '''
+
+        if a == self.nil or b == self.nil:
+            return self.nil, 0
+        child_bh = b_bh - (0 if b.red else 1)
+        b_left, b_right = b.left, b.right
+        a_left, a_left_bh, found, a_right, a_right_bh = self.split_nodes(a, a_bh, b.key)
+        left, left_bh = self.intersection_nodes(a_left, a_left_bh, b_left, child_bh, merge)
+        right, right_bh = self.intersection_nodes(a_right, a_right_bh, b_right, child_bh, merge)
+        if found is None: # Key is only in b
+            return self.join_pair(left, left_bh, right, right_bh)
+        b.value = merge(found.value, b.value)
+        return self.join_nodes(left, left_bh, b, right, right_bh)
+
+    def difference_nodes(self, a, a_bh, b, b_bh):
+
+        ''' Pairs of a subtree with keys that are not in b subtree '''
+
+        if a == self.nil or b == self.nil:
+            return a, a_bh
+        child_bh = b_bh - (0 if b.red else 1)
+        b_left, b_right = b.left, b.right
+        a_left, a_left_bh, _, a_right, a_right_bh = self.split_nodes(a, a_bh, b.key)
+        left, left_bh = self.difference_nodes(a_left, a_left_bh, b_left, child_bh)
+        right, right_bh = self.difference_nodes(a_right, a_right_bh, b_right, child_bh)
+        return self.join_pair(left, left_bh, right, right_bh)
+
+    def symmetric_difference_nodes(self, a, a_bh, b, b_bh):
+
+        ''' Pairs with keys that are in exactly one of subtrees '''
+
+        if a == self.nil:
+            return b, b_bh
+        if b == self.nil:
+            return a, a_bh
+        child_bh = b_bh - (0 if b.red else 1)
+        b_left, b_right = b.left, b.right
+        a_left, a_left_bh, found, a_right, a_right_bh = self.split_nodes(a, a_bh, b.key)
+        left, left_bh = self.symmetric_difference_nodes(a_left, a_left_bh, b_left, child_bh)
+        right, right_bh = self.symmetric_difference_nodes(a_right, a_right_bh, b_right, child_bh)
+        if found is None: # Key is only in b
+            return self.join_nodes(left, left_bh, b, right, right_bh)
+        return self.join_pair(left, left_bh, right, right_bh)
+
+    def set_operation(self, other, operation, *args):
+
+        ''' Replace pairs of tree with result of operation on both trees. Other tree is emptied '''
+
+        self.share_nil(other)
+        a = self.nil if self.empty() else self.root
+        b = self.nil if other.empty() else other.root
+        root, _ = operation(a, self.black_height(a), b, self.black_height(b), *args)
+        if root != self.nil:
+            root.parent = None
+            root.red = False # Operation can return red subtree as it is
+        self.root = root
+        other.root = other.nil
+
+    def union(self, other, merge=None):
+
+        ''' Add pairs of other tree in O(m log(n/m + 1)). merge(value, other_value) gives value of keys in both trees, other value by default. Other tree is emptied '''
+
+        self.set_operation(other, self.union_nodes, merge or (lambda value, other_value: other_value))
+
+    def intersection(self, other, merge=None):
+
+        ''' Keep pairs with keys that are in other tree. merge(value, other_value) gives new value, own value by default. Other tree is emptied '''
+
+        self.set_operation(other, self.intersection_nodes, merge or (lambda value, other_value: value))
+
+    def difference(self, other):
+
+        ''' Delete pairs with keys that are in other tree. Other tree is emptied '''
+
+        self.set_operation(other, self.difference_nodes)
+
+    def symmetric_difference(self, other):
+
+        ''' Keep pairs with keys that are in exactly one of trees. Other tree is emptied '''
+
+        self.set_operation(other, self.symmetric_difference_nodes)
+
     def clear(self):
 
-        ''' Clear tree '''
+        ''' Clear tree in O(1). Nodes are dropped at once instead of being removed one by one '''
+
+        self.root = self.nil
+
+    def clone(self, node, parent, copy_item):
+
+        ''' Copy of subtree with the same shape and colors. copy_item copies keys and values '''
+
+        if node == self.nil: # Empty subtree
+            return self.nil
+        new = self.node_type(copy_item(node.key), copy_item(node.value), parent=parent, red=node.red)
+        new.left = self.clone(node.left, new, copy_item)
+        new.right = self.clone(node.right, new, copy_item)
+        self.update(new)
+        return new
+
+    def copy(self):
 
-        while not self.empty(): # Remove tree root while tree is not empty
-            self.remove(self.root.key)
+        ''' Shallow copy of the tree in O(n) without rebalancing '''
+
+        tree = self.subtree(self.nil)
+        if not self.empty():
+            tree.root = self.clone(self.root, None, lambda item: item)
+        return tree
+
+    def __copy__(self):
+
+        ''' Shallow copy for copy.copy '''
+
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+
+        ''' Copy of the tree with copied keys and values for copy.deepcopy '''
+
+        tree = self.subtree(self.nil)
+        memo[id(self)] = tree
+        for name, value in self.__dict__.items(): # Copy settings, nodes are cloned below
+            if name not in ('root', 'nil'):
+                setattr(tree, name, copy.deepcopy(value, memo))
+        if not self.empty():
+            tree.root = self.clone(self.root, None, lambda item: copy.deepcopy(item, memo))
+        return tree
     
     def get_keys(self):
 
@@ -341,16 +1193,113 @@ class RBTree:
 
         if self.empty(): # If tree is empty
             raise Exception("Map is empty")
-        cur = self.root
-        while cur != self.nil and cur.key != key: # Find element
-            if cur.key > key:
-                cur = cur.left # Go to the left subtree
-            else:
-                cur = cur.right # Go to the right subtree
+        cur = self.find_node(key)
         if cur == self.nil: # Is element is not found
             raise Exception(f"Map doesn't have a pair with key={key}")
         else:
-            cur.value = value # Set new value to the element
+            self.set_value(cur, value) # Set new value to the element
+
+    def __delitem__(self, key):
+
+        ''' Delete pair by key using del operator '''
+
+        self.remove(key)
+
+    def __contains__(self, key):
+
+        ''' Check if tree has a pair with key using in operator '''
+
+        return self.find_node(key) != self.nil
+
+    def __len__(self):
+
+        ''' Number of pairs in the tree '''
+
+        if self.empty(): # If tree is empty
+            return 0
+        return self.root.size
+
+    def nodes(self, reverse=False):
+
+        ''' Lazy in-order traversal of nodes. Keeps only the path to the current node on a stack '''
+
+        if self.empty(): # Nothing to traverse in empty tree
+            return
+        stack = []
+        node = self.root
+        nil = self.nil
+        if reverse: # Right subtree, node, left subtree
+            while stack or node != nil:
+                if node != nil: # Go down to the biggest node of subtree
+                    stack.append(node)
+                    node = node.right
+                else: # Visit node and traverse its left subtree
+                    node = stack.pop()
+                    yield node
+                    node = node.left
+        else: # Left subtree, node, right subtree
+            while stack or node != nil:
+                if node != nil: # Go down to the smallest node of subtree
+                    stack.append(node)
+                    node = node.left
+                else: # Visit node and traverse its right subtree
+                    node = stack.pop()
+                    yield node
+                    node = node.right
+
+    def __iter__(self):
+
+        ''' Iterate over keys in ascending order '''
+
+        for node in self.nodes():
+            yield node.key
+
+    def __reversed__(self):
+
+        ''' Iterate over keys in descending order '''
+
+        for node in self.nodes(reverse=True):
+            yield node.key
+
+    def keys(self, reverse=False):
+
+        ''' Iterate over keys in key order '''
+
+        for node in self.nodes(reverse):
+            yield node.key
+
+    def values(self, reverse=False):
+
+        ''' Iterate over values in key order '''
+
+        for node in self.nodes(reverse):
+            yield node.value
+
+    def items(self, reverse=False):
+
+        ''' Iterate over (key, value) pairs in key order '''
+
+        for node in self.nodes(reverse):
+            yield node.key, node.value
+
+    def enable_stats(self, hook=None):
+
+        ''' Count rotations, recolors, rebalance iterations and search path lengths. hook(op, record) is called after every operation '''
+
+        RBTreeStats.enable(self, hook) # Counting methods are swapped in, so disabled stats cost nothing
+
+    def disable_stats(self):
+
+        ''' Stop counting and drop collected stats '''
+
+        RBTreeStats.disable(self)
+
+    def stats(self):
+
+        ''' Snapshot of counters and per-operation histograms. None if stats are disabled '''
+
+        tree_stats = self.__dict__.get('tree_stats')
+        return tree_stats.snapshot() if tree_stats is not None else None
 
     def empty(self):
 
@@ -0,0 +1,312 @@
+import array
+import bisect
+import mmap
+import pickle
+import struct
+import sys
+
+# File layout, all numbers are little-endian:
+#   header   magic, format version, key codec, value codec, number of pairs, offsets of key and value columns
+#   keys     column of keys in ascending order
+#   values   column of values in the same order
+# Fixed-width column is an array of numbers. Variable-width column is an array of count + 1 end offsets
+# relative to the column data followed by the data, so item i is data[offsets[i]:offsets[i + 1]]
+
+MAGIC = b'RBTF'
+VERSION = 1
+HEADER = struct.Struct('<4sHccQQQ')
+OFFSET = struct.Struct('<Q')
+FIXED = {b'q': 8, b'd': 8} # Codec -> item width. q is int64, d is float64
+VARIABLE = {
+    b's': (lambda item: item.encode('utf-8'), lambda data: str(data, 'utf-8')), # str
+    b'b': (bytes, bytes), # bytes
+    b'p': (pickle.dumps, pickle.loads), # Any other picklable object
+}
+
+
+def detect_codec(items):
+
+    ''' Most compact codec that can store all items '''
+
+    if all(type(item) is int and -2 ** 63 <= item < 2 ** 63 for item in items):
+        return b'q'
+    if all(type(item) is float for item in items):
+        return b'd'
+    if all(type(item) is str for item in items):
+        return b's'
+    if all(type(item) is bytes for item in items):
+        return b'b'
+    return b'p'
+
+
+def encode_column(items, codec):
+
+    ''' Bytes of column with items '''
+
+    if codec in FIXED:
+        column = array.array(codec.decode(), items)
+        if sys.byteorder == 'big':
+            column.byteswap()
+        return column.tobytes()
+    encode = VARIABLE[codec][0]
+    data = [encode(item) for item in items]
+    offsets = array.array('Q', [0])
+    for item in data:
+        offsets.append(offsets[-1] + len(item))
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    return offsets.tobytes() + b''.join(data)
+
+
+def dump(pairs, path):
+
+    ''' Write (key, value) pairs sorted by key to file '''
+
+    pairs = list(pairs)
+    keys = [key for key, value in pairs]
+    values = [value for key, value in pairs]
+    key_codec, value_codec = detect_codec(keys), detect_codec(values)
+    key_column = encode_column(keys, key_codec)
+    value_column = encode_column(values, value_codec)
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, key_codec, value_codec, len(pairs), HEADER.size, HEADER.size + len(key_column)))
+        file.write(key_column)
+        file.write(value_column)
+
+
+class Column:
+
+    ''' Read-only sequence of column items decoded on access '''
+
+    def __init__(self, buffer, offset, codec, count):
+        self.buffer = buffer
+        self.offset = offset
+        self.codec = codec
+        self.count = count
+        if codec in FIXED:
+            self.item = struct.Struct('<' + codec.decode())
+        elif codec in VARIABLE:
+            self.decode = VARIABLE[codec][1]
+            self.data = offset + (count + 1) * OFFSET.size # Start of item data
+        else:
+            raise Exception(f"Unknown codec {codec}")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if self.codec in FIXED:
+            return self.item.unpack_from(self.buffer, self.offset + index * self.item.size)[0]
+        start = OFFSET.unpack_from(self.buffer, self.offset + index * OFFSET.size)[0]
+        end = OFFSET.unpack_from(self.buffer, self.offset + (index + 1) * OFFSET.size)[0]
+        return self.decode(self.buffer[self.data + start:self.data + end])
+
+    def tolist(self):
+
+        ''' All items. Fixed-width items are decoded at once '''
+
+        if self.codec in FIXED:
+            column = array.array(self.codec.decode())
+            column.frombytes(self.buffer[self.offset:self.offset + self.count * self.item.size])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            return column.tolist()
+        return [self[index] for index in range(self.count)]
+
+
+def open_columns(buffer):
+
+    ''' Key and value columns of file contents '''
+
+    if len(buffer) < HEADER.size:
+        raise Exception("File is too short for a header")
+    magic, version, key_codec, value_codec, count, keys_offset, values_offset = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise Exception("File is not a dumped tree")
+    if version != VERSION:
+        raise Exception(f"Unsupported format version {version}")
+    return Column(buffer, keys_offset, key_codec, count), Column(buffer, values_offset, value_codec, count)
+
+
+def load_pairs(path):
+
+    ''' (key, value) pairs of file sorted by key '''
+
+    with open(path, 'rb') as file:
+        buffer = file.read()
+    keys, values = open_columns(buffer)
+    return list(zip(keys.tolist(), values.tolist()))
+
+
+class MappedRBTree:
+
+    ''' Read-only map over dumped tree file. The file is memory-mapped and searched by binary search, nothing is loaded up front '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.keys_column, self.values_column = open_columns(self.mmap)
+
+    def close(self):
+
+        ''' Unmap the file '''
+
+        self.keys_column = self.values_column = None
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def empty(self):
+
+        ''' Check if map is empty '''
+
+        return len(self.keys_column) == 0
+
+    def index(self, key):
+
+        ''' Index of key or -1 if it's absent '''
+
+        index = bisect.bisect_left(self.keys_column, key)
+        if index < len(self.keys_column) and self.keys_column[index] == key:
+            return index
+        return -1
+
+    def pair(self, index):
+
+        ''' (key, value) pair by index or None if index is out of range. Raises exception in empty map '''
+
+        if self.empty():
+            raise Exception("Map is empty")
+        if 0 <= index < len(self.keys_column):
+            return self.keys_column[index], self.values_column[index]
+        return None
+
+    def find(self, key):
+
+        ''' Find value by key. Returns None if key is absent '''
+
+        if self.empty():
+            raise Exception("Map is empty")
+        index = self.index(key)
+        if index < 0: # If element is not found return None
+            return None
+        return self.values_column[index]
+
+    def get(self, key, default=None):
+
+        ''' Find value by key or return default '''
+
+        index = self.index(key)
+        return default if index < 0 else self.values_column[index]
+
+    def floor(self, key):
+
+        ''' (key, value) pair with the biggest key <= key or None '''
+
+        return self.pair(bisect.bisect_right(self.keys_column, key) - 1)
+
+    def ceiling(self, key):
+
+        ''' (key, value) pair with the smallest key >= key or None '''
+
+        return self.pair(bisect.bisect_left(self.keys_column, key))
+
+    def lower(self, key):
+
+        ''' (key, value) pair with the biggest key < key or None '''
+
+        return self.pair(bisect.bisect_left(self.keys_column, key) - 1)
+
+    def higher(self, key):
+
+        ''' (key, value) pair with the smallest key > key or None '''
+
+        return self.pair(bisect.bisect_right(self.keys_column, key))
+
+    def min(self):
+
+        ''' (key, value) pair with the smallest key '''
+
+        return self.pair(0)
+
+    def max(self):
+
+        ''' (key, value) pair with the biggest key '''
+
+        return self.pair(len(self.keys_column) - 1)
+
+    def range_indexes(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Indexes of keys between lo and hi. None bound means unbounded '''
+
+        keys = self.keys_column
+        start = 0 if lo is None else (bisect.bisect_left if inclusive[0] else bisect.bisect_right)(keys, lo)
+        stop = len(keys) if hi is None else (bisect.bisect_right if inclusive[1] else bisect.bisect_left)(keys, hi)
+        return range(stop - 1, start - 1, -1) if reverse else range(start, stop)
+
+    def irange(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterate over keys between lo and hi '''
+
+        for index in self.range_indexes(lo, hi, inclusive, reverse):
+            yield self.keys_column[index]
+
+    def irange_items(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterate over (key, value) pairs with keys between lo and hi '''
+
+        for index in self.range_indexes(lo, hi, inclusive, reverse):
+            yield self.keys_column[index], self.values_column[index]
+
+    def keys(self, reverse=False):
+
+        ''' Iterate over keys in key order '''
+
+        return self.irange(reverse=reverse)
+
+    def values(self, reverse=False):
+
+        ''' Iterate over values in key order '''
+
+        for index in self.range_indexes(reverse=reverse):
+            yield self.values_column[index]
+
+    def items(self, reverse=False):
+
+        ''' Iterate over (key, value) pairs in key order '''
+
+        return self.irange_items(reverse=reverse)
+
+    def __getitem__(self, key):
+
+        ''' Get value by key using [] operator '''
+
+        return self.find(key)
+
+    def __contains__(self, key):
+
+        ''' Check if map has a pair with key using in operator '''
+
+        return self.index(key) >= 0
+
+    def __len__(self):
+
+        ''' Number of pairs in the map '''
+
+        return len(self.keys_column)
+
+    def __iter__(self):
+
+        ''' Iterate over keys in ascending order '''
+
+        return self.irange()
+
+    def __reversed__(self):
+
+        ''' Iterate over keys in descending order '''
+
+        return self.irange(reverse=True)
@@ -0,0 +1,307 @@
+from collections import Counter
+import RBTree
+
+class TreeStats:
+
+    ''' Counters and per-operation histograms of tree work '''
+
+    def __init__(self, hook=None):
+        self.hook = hook # Called as hook(op, record) after every operation
+        self.rotations = 0 # Left and right rotations
+        self.recolors = 0 # Nodes that changed color while balancing
+        self.iterations = 0 # Iterations of insert_balance and remove_balance loops
+        self.path = 0 # Nodes visited by search of the current operation
+        self.depth = 0 # Nesting of recorded operations, only the outermost one is recorded
+        self.ops = Counter() # Number of operations by name
+        self.histograms = {} # Operation name -> metric name -> Counter of values
+
+    def record(self, op, record):
+
+        ''' Add record of finished operation to histograms and pass it to hook '''
+
+        self.ops[op] += 1
+        histograms = self.histograms.setdefault(op, {})
+        for metric, value in record.items():
+            histograms.setdefault(metric, Counter())[value] += 1
+        if self.hook is not None:
+            self.hook(op, record)
+
+    def snapshot(self):
+
+        ''' Copy of counters and histograms '''
+
+        return {
+            'rotations': self.rotations,
+            'recolors': self.recolors,
+            'iterations': self.iterations,
+            'ops': dict(self.ops),
+            'histograms': {op: {metric: dict(counter) for metric, counter in metrics.items()} for op, metrics in self.histograms.items()},
+        }
+
+
+def recorded(op):
+
+    ''' Decorator of tree method that records work done by one call as operation op '''
+
+    def decorator(method):
+        def wrapper(self, *args, **kwargs):
+            stats = self.tree_stats
+            if stats.depth: # Nested call is a part of outer operation
+                return method(self, *args, **kwargs)
+            rotations, recolors, iterations = stats.rotations, stats.recolors, stats.iterations
+            stats.path = 0
+            stats.depth += 1
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                stats.depth -= 1
+                stats.record(op, {
+                    'rotations': stats.rotations - rotations,
+                    'recolors': stats.recolors - recolors,
+                    'iterations': stats.iterations - iterations,
+                    'path': stats.path,
+                })
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+    return decorator
+
+
+class StatsMixin:
+
+    ''' Counting versions of tree methods. Mixed into tree class only while stats are enabled.
+        Searching and balancing of RBTree are mirrored line for line with counters, subclasses that override them keep their own methods '''
+
+    own_find = False # Class has its own find_node, set by enable
+    own_balance = False # Class has its own insert_balance or remove_balance, set by enable
+
+    def paint(self, node, red):
+
+        ''' Set color of node and count the change '''
+
+        if node.red != red:
+            self.tree_stats.recolors += 1
+            node.red = red
+
+    def left_rotate(self, node):
+        self.tree_stats.rotations += 1
+        super().left_rotate(node)
+
+    def right_rotate(self, node):
+        self.tree_stats.rotations += 1
+        super().right_rotate(node)
+
+    def find_node(self, key):
+
+        ''' Find node by key and count visited nodes '''
+
+        if self.own_find: # Lookup of subclass, like hash index, is one probe
+            self.tree_stats.path = 1
+            return super().find_node(key)
+        if self.empty(): # If tree is empty
+            return self.nil
+        cur = self.root
+        path = 1
+        while cur != self.nil and cur.key != key: # Find element
+            if cur.key > key:
+                cur = cur.left # Go to the left subtree
+            else:
+                cur = cur.right # Go to the right subtree
+            path += 1
+        self.tree_stats.path = path
+        return cur
+
+    def attach(self, parent, key, value):
+
+        ''' Insert new node and count nodes on path to it '''
+
+        path = 1
+        node = parent
+        while node is not None:
+            path += 1
+            node = node.parent
+        self.tree_stats.path = path
+        return super().attach(parent, key, value)
+
+    def insert_balance(self, node):
+
+        ''' Balance tree after insertion, counting loop iterations and recolors '''
+
+        if self.own_balance:
+            return super().insert_balance(node)
+        stats = self.tree_stats
+        balanceNode = node
+        while balanceNode.parent is not None and balanceNode.parent.red == True: # While balanceNode is not root and balanceNode's parent color is red
+            stats.iterations += 1
+            gp = balanceNode.parent.parent # Grand parent of balanceNode
+            p = balanceNode.parent # Parent of balanceNode
+            if gp is not None and gp.left == p: # If parent is left child
+                if gp.right.red: # If 'uncle' is red
+                    # Make gp's children black, gp red. balanceNode is gp now
+                    self.paint(gp.left, False)
+                    self.paint(gp.right, False)
+                    self.paint(gp, True)
+                    balanceNode = gp
+                elif p.right == balanceNode: # If balanceNode is right child
+                    balanceNode = p # balanceNode is p now
+                    self.left_rotate(balanceNode) # Rotate balanceNode to the left
+                else:
+                    # Make parent black, gp red. Rotate gp to the right
+                    self.paint(p, False)
+                    self.paint(gp, True)
+                    self.right_rotate(gp)
+            elif gp is not None: # If parent is right child
+                if gp.left.red: # If 'uncle' is red
+                    # Make gp's children black, gp red. balanceNode is gp now
+                    self.paint(gp.left, False)
+                    self.paint(gp.right, False)
+                    self.paint(gp, True)
+                    balanceNode = gp
+                elif p.left == balanceNode: # If balanceNode is left child
+                    balanceNode = p # balanceNode is p now
+                    self.right_rotate(balanceNode) # Rotate balanceNode to the right
+                else:
+                    # Make parent black, gp red. Rotate gp to the left
+                    self.paint(p, False)
+                    self.paint(gp, True)
+                    self.left_rotate(gp)
+            else: # If gp is None
+                break
+        grew = self.root.red # Red root is recolored, so black height of the tree grows
+        self.paint(self.root, False) # Set root color to black
+        return grew
+
+    def remove_balance(self, node, parent=None):
+
+        ''' Balance tree after deleting an element with color black, counting loop iterations and recolors '''
+
+        if self.own_balance:
+            return super().remove_balance(node, parent)
+        stats = self.tree_stats
+        if parent is None: # Pass parent only if node is nil, because we can't get parent of nil
+            parent = node.parent
+        while node != self.root and not node.red: # While node is not root of the tree and node's color is black
+            stats.iterations += 1
+            if node != self.nil:
+                parent = node.parent # Get parent
+            if node == parent.left: # If node is left child
+                w = parent.right # Brother of node
+                if w.red: # If brother is red
+                    # Make brother black, parent red. Rotate parent to the left and get new brother of node
+                    self.paint(w, False)
+                    self.paint(parent, True)
+                    self.left_rotate(parent)
+                    w = parent.right
+                if not w.left.red and not w.right.red: # If brother's children are black
+                    # Make brother red. Change current node to it's parent
+                    self.paint(w, True)
+                    node = parent
+                else:
+                    if not w.right.red: # If brother's right child is black
+                        # Make brother's left child black, brother red. Rotate brother to the right and get new brother of node
+                        self.paint(w.left, False)
+                        self.paint(w, True)
+                        self.right_rotate(w)
+                        w = parent.right
+                    # Make brother's color same as parent's color. Make parent and brother's right child black. Rotate parent to the left and change current node to tree root
+                    self.paint(w, parent.red)
+                    self.paint(parent, False)
+                    self.paint(w.right, False)
+                    self.left_rotate(parent)
+                    node = self.root
+            else:  # If node is right child
+                w = parent.left # Brother of node
+                if w.red: # If brother is red
+                    # Make brother black, parent red. Rotate parent to the right and get new brother of node
+                    self.paint(w, False)
+                    self.paint(parent, True)
+                    self.right_rotate(parent)
+                    w = parent.left
+                if not w.left.red and not w.right.red: # If brother's children are black
+                    # Make brother red. Change current node to it's parent
+                    self.paint(w, True)
+                    node = parent
+                else:
+                    if not w.left.red: # If brother's left child is black
+                        # Make brother's right child black, brother red. Rotate brother to the left and get new brother of node
+                        self.paint(w.right, False)
+                        self.paint(w, True)
+                        self.left_rotate(w)
+                        w = parent.left
+                    # Make brother's color same as parent's color. Make parent and brother's left child black. Rotate parent to the right and change current node to tree root
+                    self.paint(w, parent.red)
+                    self.paint(parent, False)
+                    self.paint(w.left, False)
+                    self.right_rotate(parent)
+                    node = self.root
+        self.paint(node, False) # Change current node color to black
+
+    def copy(self):
+
+        ''' Copy of the tree with its own stats '''
+
+        tree = super().copy()
+        tree.tree_stats = TreeStats(self.tree_stats.hook)
+        return tree
+
+    def split(self, key):
+
+        ''' Split tree into halves with their own stats '''
+
+        left, right = super().split(key)
+        left.tree_stats = TreeStats(self.tree_stats.hook)
+        right.tree_stats = TreeStats(self.tree_stats.hook)
+        return left, right
+
+    @recorded('insert')
+    def insert(self, key, value):
+        return super().insert(key, value)
+
+    @recorded('upsert')
+    def upsert(self, key, value):
+        return super().upsert(key, value)
+
+    @recorded('remove')
+    def remove(self, key):
+        return super().remove(key)
+
+    @recorded('find')
+    def find(self, key):
+        return super().find(key)
+
+    @recorded('setitem')
+    def __setitem__(self, key, value):
+        return super().__setitem__(key, value)
+
+    @recorded('contains')
+    def __contains__(self, key):
+        return super().__contains__(key)
+
+
+stats_classes = {} # Tree class -> class with counting methods
+
+def enable(tree, hook=None):
+
+    ''' Switch tree to counting methods '''
+
+    cls = type(tree)
+    if issubclass(cls, StatsMixin): # Already enabled, only replace the hook
+        tree.tree_stats.hook = hook
+        return
+    if cls not in stats_classes:
+        stats_classes[cls] = type('Stats' + cls.__name__, (StatsMixin, cls), {
+            'own_find': cls.find_node is not RBTree.RBTree.find_node,
+            'own_balance': cls.insert_balance is not RBTree.RBTree.insert_balance or cls.remove_balance is not RBTree.RBTree.remove_balance,
+        })
+    tree.tree_stats = TreeStats(hook)
+    tree.__class__ = stats_classes[cls]
+
+
+def disable(tree):
+
+    ''' Switch tree back to its own methods '''
+
+    cls = type(tree)
+    if issubclass(cls, StatsMixin):
+        tree.__class__ = cls.__mro__[2] # Class after StatsMixin
+        del tree.tree_stats
@@ -0,0 +1,595 @@
+import array
+
+try: # NumPy is optional, it speeds up bulk operations and array exports
+    import numpy
+except ImportError:
+    numpy = None
+
+TYPECODES = {'int64': 'q', 'float64': 'd', 'int32': 'i', 'float32': 'f'} # dtype -> array typecode
+
+
+class TypedRBTree:
+
+    ''' Red-Black Tree with numeric keys. Nodes are indexes into parallel arrays: keys and, if value_dtype is set, values
+        are stored unboxed, links are 32-bit indexes. Index 0 is nil. Python lists of values are used without value_dtype '''
+
+    def __init__(self, dtype='int64', value_dtype=None):
+        if dtype not in TYPECODES:
+            raise Exception(f"Unsupported dtype {dtype}")
+        if value_dtype is not None and value_dtype not in TYPECODES:
+            raise Exception(f"Unsupported dtype {value_dtype}")
+        self.dtype = dtype
+        self.value_dtype = value_dtype
+        self.reset()
+
+    def reset(self):
+
+        ''' Drop all nodes and keep only nil '''
+
+        self.key_pool = array.array(TYPECODES[self.dtype], [0]) # Key of node
+        self.value_pool = array.array(TYPECODES[self.value_dtype], [0]) if self.value_dtype else [None] # Value of node
+        self.left = array.array('i', [0]) # Left child
+        self.right = array.array('i', [0]) # Right child
+        self.parent = array.array('i', [0]) # Parent, 0 for root
+        self.red = bytearray(1) # Color (1=Red, 0=Black)
+        self.free = [] # Indexes of deleted nodes that can be reused
+        self.root = 0
+        self.count = 0
+
+    def new_node(self, key, value, parent):
+
+        ''' Index of new red node '''
+
+        if self.free:
+            node = self.free[-1]
+            self.key_pool[node] = key
+            self.value_pool[node] = value
+            self.free.pop() # Slot is taken only when key and value fit
+            self.left[node] = self.right[node] = 0
+            self.parent[node] = parent
+            self.red[node] = 1
+            return node
+        self.key_pool.append(key)
+        try:
+            self.value_pool.append(value)
+        except Exception:
+            self.key_pool.pop() # Keep arrays of the same length
+            raise
+        self.left.append(0)
+        self.right.append(0)
+        self.parent.append(parent)
+        self.red.append(1)
+        return len(self.key_pool) - 1
+
+    def left_rotate(self, node):
+
+        ''' Left rotate the node '''
+
+        left, right, parent = self.left, self.right, self.parent
+        child = right[node]
+        right[node] = left[child]
+        if left[child]:
+            parent[left[child]] = node
+        parent[child] = parent[node]
+        if not parent[node]:
+            self.root = child
+        elif left[parent[node]] == node:
+            left[parent[node]] = child
+        else:
+            right[parent[node]] = child
+        left[child] = node
+        parent[node] = child
+
+    def right_rotate(self, node):
+
+        ''' Right rotate the node '''
+
+        left, right, parent = self.left, self.right, self.parent
+        child = left[node]
+        left[node] = right[child]
+        if right[child]:
+            parent[right[child]] = node
+        parent[child] = parent[node]
+        if not parent[node]:
+            self.root = child
+        elif right[parent[node]] == node:
+            right[parent[node]] = child
+        else:
+            left[parent[node]] = child
+        right[child] = node
+        parent[node] = child
+
+    def insert_balance(self, node):
+
+        ''' Balance tree after insertion '''
+
+        left, right, parent, red = self.left, self.right, self.parent, self.red
+        while red[parent[node]]: # While parent of node is red. Nil is black, so root stops the loop
+            p = parent[node]
+            gp = parent[p]
+            if left[gp] == p: # If parent is left child
+                uncle = right[gp]
+                if red[uncle]: # Make gp's children black, gp red. Node is gp now
+                    red[p] = red[uncle] = 0
+                    red[gp] = 1
+                    node = gp
+                    continue
+                if right[p] == node: # Node is p now. Rotate it to the left
+                    node = p
+                    self.left_rotate(node)
+                    p = parent[node]
+                # Make parent black, gp red. Rotate gp to the right
+                red[p] = 0
+                red[gp] = 1
+                self.right_rotate(gp)
+            else: # If parent is right child
+                uncle = left[gp]
+                if red[uncle]: # Make gp's children black, gp red. Node is gp now
+                    red[p] = red[uncle] = 0
+                    red[gp] = 1
+                    node = gp
+                    continue
+                if left[p] == node: # Node is p now. Rotate it to the right
+                    node = p
+                    self.right_rotate(node)
+                    p = parent[node]
+                # Make parent black, gp red. Rotate gp to the left
+                red[p] = 0
+                red[gp] = 1
+                self.left_rotate(gp)
+        red[self.root] = 0
+
+    def add(self, key, value, replace):
+
+        ''' Insert pair. Existing key gets value if replace is set. Returns True if pair was inserted '''
+
+        keys, left, right = self.key_pool, self.left, self.right
+        parent = 0
+        cur = self.root
+        while cur: # Find place to insert
+            current = keys[cur]
+            if current == key: # If pair with passed key already exists
+                if replace:
+                    self.value_pool[cur] = value
+                return False
+            parent = cur
+            cur = left[cur] if current > key else right[cur]
+        node = self.new_node(key, value, parent)
+        if not parent: # Tree was empty
+            self.root = node
+        elif keys[parent] > key:
+            left[parent] = node
+        else:
+            right[parent] = node
+        self.count += 1
+        self.insert_balance(node)
+        return True
+
+    def insert(self, key, value):
+
+        ''' Insertion of [key, value] pair '''
+
+        if not self.add(key, value, False):
+            raise Exception(f"Pair with key={key} already exists")
+
+    def upsert(self, key, value):
+
+        ''' Insert [key, value] pair or set value of existing key. Returns True if pair was inserted '''
+
+        return self.add(key, value, True)
+
+    def transplant(self, old, new):
+
+        ''' Put subtree new in place of subtree old. Parent of nil may be set here, remove_balance reads it '''
+
+        parent = self.parent[old]
+        if not parent:
+            self.root = new
+        elif self.left[parent] == old:
+            self.left[parent] = new
+        else:
+            self.right[parent] = new
+        self.parent[new] = parent
+
+    def remove_balance(self, node):
+
+        ''' Balance tree after deleting an element with color black '''
+
+        left, right, parent, red = self.left, self.right, self.parent, self.red
+        while node != self.root and not red[node]: # While node is not root of the tree and node's color is black
+            p = parent[node]
+            if node == left[p]: # If node is left child
+                w = right[p] # Brother of node
+                if red[w]: # Make brother black, parent red. Rotate parent to the left and get new brother of node
+                    red[w] = 0
+                    red[p] = 1
+                    self.left_rotate(p)
+                    w = right[p]
+                if not red[left[w]] and not red[right[w]]: # Make brother red. Change current node to its parent
+                    red[w] = 1
+                    node = p
+                    continue
+                if not red[right[w]]: # Make brother's left child black, brother red. Rotate brother to the right
+                    red[left[w]] = 0
+                    red[w] = 1
+                    self.right_rotate(w)
+                    w = right[p]
+                # Brother gets parent's color. Parent and brother's right child become black. Rotate parent to the left
+                red[w] = red[p]
+                red[p] = 0
+                red[right[w]] = 0
+                self.left_rotate(p)
+            else: # If node is right child
+                w = left[p] # Brother of node
+                if red[w]: # Make brother black, parent red. Rotate parent to the right and get new brother of node
+                    red[w] = 0
+                    red[p] = 1
+                    self.right_rotate(p)
+                    w = left[p]
+                if not red[left[w]] and not red[right[w]]: # Make brother red. Change current node to its parent
+                    red[w] = 1
+                    node = p
+                    continue
+                if not red[left[w]]: # Make brother's right child black, brother red. Rotate brother to the left
+                    red[right[w]] = 0
+                    red[w] = 1
+                    self.left_rotate(w)
+                    w = left[p]
+                # Brother gets parent's color. Parent and brother's left child become black. Rotate parent to the right
+                red[w] = red[p]
+                red[p] = 0
+                red[left[w]] = 0
+                self.right_rotate(p)
+            node = self.root
+        red[node] = 0
+
+    def remove_node(self, node):
+
+        ''' Deleting node of the tree '''
+
+        left, right, parent, red = self.left, self.right, self.parent, self.red
+        removed_red = red[node] # Color of the node that leaves its place
+        if not left[node]:
+            child = right[node]
+            self.transplant(node, child)
+        elif not right[node]:
+            child = left[node]
+            self.transplant(node, child)
+        else: # Successor takes place of the node
+            successor = right[node]
+            while left[successor]:
+                successor = left[successor]
+            removed_red = red[successor]
+            child = right[successor]
+            if parent[successor] == node:
+                parent[child] = successor
+            else:
+                self.transplant(successor, child)
+                right[successor] = right[node]
+                parent[right[successor]] = successor
+            self.transplant(node, successor)
+            left[successor] = left[node]
+            parent[left[successor]] = successor
+            red[successor] = red[node]
+        if not removed_red:
+            self.remove_balance(child)
+        parent[0] = 0 # Restore nil
+        red[0] = 0
+        if self.value_dtype is None:
+            self.value_pool[node] = None # Don't keep deleted value alive
+        self.free.append(node)
+        self.count -= 1
+
+    def find_node(self, key):
+
+        ''' Index of node with key or 0 if it's absent '''
+
+        keys, left, right = self.key_pool, self.left, self.right
+        cur = self.root
+        while cur:
+            current = keys[cur]
+            if current == key:
+                return cur
+            cur = left[cur] if current > key else right[cur]
+        return 0
+
+    def remove(self, key):
+
+        ''' Deleting pair by key '''
+
+        if not self.count: # If tree is empty
+            raise Exception("Map is empty")
+        node = self.find_node(key)
+        if not node: # If node is not found
+            raise Exception(f"Pair with key={key} doesn't exist")
+        self.remove_node(node)
+
+    def find(self, key):
+
+        ''' Find value by key. Returns None if key is absent '''
+
+        if not self.count: # If tree is empty
+            raise Exception("Map is empty")
+        node = self.find_node(key)
+        if not node: # If element is not found return None
+            return None
+        return self.value_pool[node]
+
+    def clear(self):
+
+        ''' Clear tree and release its arrays '''
+
+        self.reset()
+
+    def nodes(self, reverse=False):
+
+        ''' Lazy in-order traversal of node indexes '''
+
+        first, second = (self.right, self.left) if reverse else (self.left, self.right)
+        stack = []
+        node = self.root
+        while stack or node:
+            if node: # Go down to the smallest (biggest) node of subtree
+                stack.append(node)
+                node = first[node]
+            else: # Visit node and traverse its other subtree
+                node = stack.pop()
+                yield node
+                node = second[node]
+
+    def range_nodes(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Lazy traversal of node indexes with keys between lo and hi. None bound means unbounded '''
+
+        keys = self.key_pool
+        above_lo = lambda node: lo is None or keys[node] > lo or inclusive[0] and keys[node] == lo # Key is not below lower bound
+        below_hi = lambda node: hi is None or keys[node] < hi or inclusive[1] and keys[node] == hi # Key is not above upper bound
+        start, stop = (below_hi, above_lo) if reverse else (above_lo, below_hi)
+        first, second = (self.right, self.left) if reverse else (self.left, self.right)
+        stack = []
+        node = self.root
+        while node: # Stack holds ancestors in range that are visited after the first node
+            if start(node):
+                stack.append(node)
+                node = first[node]
+            else:
+                node = second[node]
+        while stack:
+            node = stack.pop()
+            if not stop(node): # Out of range
+                return
+            yield node
+            node = second[node]
+            while node: # Go down to the next node
+                stack.append(node)
+                node = first[node]
+
+    def irange(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterate over keys between lo and hi '''
+
+        keys = self.key_pool
+        for node in self.range_nodes(lo, hi, inclusive, reverse):
+            yield keys[node]
+
+    def irange_items(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+
+        ''' Iterate over (key, value) pairs with keys between lo and hi '''
+
+        keys, values = self.key_pool, self.value_pool
+        for node in self.range_nodes(lo, hi, inclusive, reverse):
+            yield keys[node], values[node]
+
+    def keys_array(self):
+
+        ''' Keys in ascending order as NumPy array, or as array.array without NumPy. The array is built with one copy '''
+
+        result = array.array(self.key_pool.typecode, map(self.key_pool.__getitem__, self.nodes()))
+        return numpy.frombuffer(result, dtype=self.dtype) if numpy is not None else result
+
+    def values_array(self):
+
+        ''' Values in key order as NumPy array, or as array.array (list without value_dtype) without NumPy '''
+
+        values = map(self.value_pool.__getitem__, self.nodes())
+        if self.value_dtype is None:
+            return numpy.array(list(values), dtype=object) if numpy is not None else list(values)
+        result = array.array(self.value_pool.typecode, values)
+        return numpy.frombuffer(result, dtype=self.value_dtype) if numpy is not None else result
+
+    @staticmethod
+    def batch_lists(keys, values=None):
+
+        ''' Keys and values as lists of Python scalars. Accepts NumPy arrays and iterable of pairs '''
+
+        if values is None:
+            pairs = list(keys)
+            return [pair[0] for pair in pairs], [pair[1] for pair in pairs]
+        keys = keys.tolist() if hasattr(keys, 'tolist') else list(keys)
+        values = values.tolist() if hasattr(values, 'tolist') else list(values)
+        return keys, values
+
+    @staticmethod
+    def sort_order(keys):
+
+        ''' Indexes of keys in stable ascending order '''
+
+        if numpy is not None and len(keys) > 1:
+            return numpy.argsort(numpy.asarray(keys), kind='stable').tolist()
+        return sorted(range(len(keys)), key=keys.__getitem__)
+
+    def build(self, keys, values, lo, hi, parent, depth, red_depth):
+
+        ''' Build balanced subtree from sorted keys[lo:hi] without rotations '''
+
+        if lo == hi:
+            return 0
+        mid = (lo + hi) // 2
+        node = self.new_node(keys[mid], values[mid], parent)
+        self.red[node] = depth == red_depth and depth > 0 # Root is always black
+        self.left[node] = self.build(keys, values, lo, mid, node, depth + 1, red_depth)
+        self.right[node] = self.build(keys, values, mid + 1, hi, node, depth + 1, red_depth)
+        return node
+
+    def rebuild(self, keys, values):
+
+        ''' Replace contents with strictly increasing keys and their values in O(n) '''
+
+        array.array(self.key_pool.typecode, keys) # Check that keys and values fit before the tree is dropped
+        if self.value_dtype is not None:
+            array.array(self.value_pool.typecode, values)
+        self.reset()
+        # Every level above the deepest one is full, so only nodes on the deepest level are red
+        self.root = self.build(keys, values, 0, len(keys), 0, 0, len(keys).bit_length() - 1)
+        self.count = len(keys)
+
+    def insert_many(self, keys, values=None):
+
+        ''' Insert many pairs. Returns list of flags: True if pair was inserted, False if key already exists.
+            Batch is sorted once. Batch at least as big as the tree is merged with it and the tree is rebuilt in O(n + m) '''
+
+        keys, values = self.batch_lists(keys, values)
+        result = [False] * len(keys)
+        order = self.sort_order(keys)
+        if len(keys) < self.count: # Small batch, insert in key order
+            for index in order:
+                result[index] = self.add(keys[index], values[index], False)
+            return result
+        new_keys, new_values = [], []
+        existing = self.nodes()
+        node = next(existing, 0)
+        for index in order: # Merge sorted tree with sorted batch
+            key = keys[index]
+            while node and self.key_pool[node] < key:
+                new_keys.append(self.key_pool[node])
+                new_values.append(self.value_pool[node])
+                node = next(existing, 0)
+            if node and self.key_pool[node] == key or new_keys and new_keys[-1] == key: # Key is in tree or earlier in batch
+                continue
+            new_keys.append(key)
+            new_values.append(values[index])
+            result[index] = True
+        while node:
+            new_keys.append(self.key_pool[node])
+            new_values.append(self.value_pool[node])
+            node = next(existing, 0)
+        self.rebuild(new_keys, new_values)
+        return result
+
+    def find_many(self, keys, default=None):
+
+        ''' Find values of many keys. Missing keys get default value. With NumPy big batches are searched in sorted keys with searchsorted '''
+
+        if not hasattr(keys, 'tolist'):
+            keys = list(keys)
+        if numpy is not None and len(keys) * 8 >= self.count and self.count:
+            nodes = array.array('i', self.nodes())
+            sorted_keys = self.keys_array()
+            batch = numpy.asarray(keys)
+            positions = numpy.minimum(numpy.searchsorted(sorted_keys, batch), self.count - 1)
+            found = sorted_keys[positions] == batch
+            return [self.value_pool[nodes[position]] if hit else default for position, hit in zip(positions.tolist(), found.tolist())]
+        result = []
+        for key in (keys.tolist() if hasattr(keys, 'tolist') else keys):
+            node = self.find_node(key)
+            result.append(self.value_pool[node] if node else default)
+        return result
+
+    def min(self):
+
+        ''' (key, value) pair with the smallest key '''
+
+        if not self.count: # If tree is empty
+            raise Exception("Map is empty")
+        node = next(self.nodes())
+        return self.key_pool[node], self.value_pool[node]
+
+    def max(self):
+
+        ''' (key, value) pair with the biggest key '''
+
+        if not self.count: # If tree is empty
+            raise Exception("Map is empty")
+        node = next(self.nodes(reverse=True))
+        return self.key_pool[node], self.value_pool[node]
+
+    def empty(self):
+
+        ''' Check if tree is empty '''
+
+        return not self.count
+
+    def __getitem__(self, key):
+
+        ''' Get value by key using [] operator '''
+
+        return self.find(key)
+
+    def __setitem__(self, key, value):
+
+        ''' Set value of existing key using [] operator '''
+
+        if not self.count: # If tree is empty
+            raise Exception("Map is empty")
+        node = self.find_node(key)
+        if not node: # Is element is not found
+            raise Exception(f"Map doesn't have a pair with key={key}")
+        self.value_pool[node] = value
+
+    def __delitem__(self, key):
+
+        ''' Delete pair by key using del operator '''
+
+        self.remove(key)
+
+    def __contains__(self, key):
+
+        ''' Check if tree has a pair with key using in operator '''
+
+        return self.find_node(key) != 0
+
+    def __len__(self):
+
+        ''' Number of pairs in the tree '''
+
+        return self.count
+
+    def __iter__(self):
+
+        ''' Iterate over keys in ascending order '''
+
+        keys = self.key_pool
+        for node in self.nodes():
+            yield keys[node]
+
+    def __reversed__(self):
+
+        ''' Iterate over keys in descending order '''
+
+        keys = self.key_pool
+        for node in self.nodes(reverse=True):
+            yield keys[node]
+
+    def keys(self, reverse=False):
+
+        ''' Iterate over keys in key order '''
+
+        keys = self.key_pool
+        for node in self.nodes(reverse):
+            yield keys[node]
+
+    def values(self, reverse=False):
+
+        ''' Iterate over values in key order '''
+
+        values = self.value_pool
+        for node in self.nodes(reverse):
+            yield values[node]
+
+    def items(self, reverse=False):
+
+        ''' Iterate over (key, value) pairs in key order '''
+
+        keys, values = self.key_pool, self.value_pool
+        for node in self.nodes(reverse):
+            yield keys[node], values[node]
@@ -0,0 +1,228 @@
+import argparse, itertools, json, platform, random, sys, time, tracemalloc, RBTree
+
+# Benchmark suite for RBTree operations over several key patterns.
+#
+#   python benchmarks.py                            run the suite at default sizes
+#   python benchmarks.py 1000 100000 --ops find     selected sizes and operations
+#   python benchmarks.py --json baseline.json       save results as a baseline
+#   python benchmarks.py --compare baseline.json    fail if ops/s dropped more than --threshold
+#   python benchmarks.py --memory                   bytes per entry at 1e5, 1e6, 1e7 keys
+
+
+def pattern_keys(pattern, n, rnd):
+    # Sequence of n keys from range(n). Zipf and sliding window sequences repeat keys
+    if pattern == 'random':
+        keys = list(range(n))
+        rnd.shuffle(keys)
+        return keys
+    if pattern == 'sorted':
+        return list(range(n))
+    if pattern == 'reverse':
+        return list(range(n - 1, -1, -1))
+    if pattern == 'zipf': # Few hot keys get most of accesses
+        ranks = list(range(n))
+        rnd.shuffle(ranks)
+        weights = list(itertools.accumulate(1 / (rank + 1) ** 1.1 for rank in range(n)))
+        return rnd.choices(ranks, cum_weights=weights, k=n)
+    if pattern == 'sliding': # Accesses follow a window moving over the key space
+        window = max(1, n // 100)
+        return [max(0, i - rnd.randrange(window)) for i in range(n)]
+    raise ValueError(f"Unknown pattern {pattern}")
+
+
+def distinct(keys):
+    # Keys in order of first occurrence
+    return list(dict.fromkeys(keys))
+
+
+def timed_each(func, keys):
+    # Latency of func(key) for every key in nanoseconds
+    clock = time.perf_counter_ns
+    latencies = []
+    for key in keys:
+        start = clock()
+        func(key)
+        latencies.append(clock() - start)
+    return latencies
+
+
+def timed_call(func):
+    # Latency of one call in nanoseconds
+    start = time.perf_counter_ns()
+    func()
+    return [time.perf_counter_ns() - start]
+
+
+def sorted_tree(n):
+    return RBTree.RBTree.from_sorted((key, key) for key in range(n))
+
+
+def pattern_tree(keys):
+    tree = RBTree.RBTree()
+    for key in distinct(keys):
+        tree.insert(key, key)
+    return tree
+
+
+# Every operation gets pattern keys and returns (latencies in ns, number of operations done)
+def op_insert(keys):
+    tree = RBTree.RBTree()
+    keys = distinct(keys)
+    return timed_each(lambda key: tree.insert(key, key), keys), len(keys)
+
+
+def op_find(keys):
+    tree = sorted_tree(len(keys))
+    return timed_each(tree.find, keys), len(keys)
+
+
+def op_setitem(keys):
+    tree = sorted_tree(len(keys))
+    return timed_each(lambda key: tree.__setitem__(key, key), keys), len(keys)
+
+
+def op_remove(keys):
+    tree = sorted_tree(len(keys))
+    keys = distinct(keys)
+    return timed_each(tree.remove, keys), len(keys)
+
+
+def op_iterate(keys):
+    tree = pattern_tree(keys)
+    return timed_call(lambda: sum(1 for _ in tree.items())), len(tree)
+
+
+def op_clear(keys):
+    tree = pattern_tree(keys)
+    return timed_call(tree.clear), 1
+
+
+def op_from_sorted(keys):
+    pairs = [(key, key) for key in sorted(distinct(keys))]
+    return timed_call(lambda: RBTree.RBTree.from_sorted(pairs)), len(pairs)
+
+
+def op_insert_many(keys):
+    tree = RBTree.RBTree()
+    return timed_call(lambda: tree.insert_many(keys, keys)), len(keys)
+
+
+def op_find_many(keys):
+    tree = sorted_tree(len(keys))
+    return timed_call(lambda: tree.find_many(keys)), len(keys)
+
+
+def op_copy(keys):
+    tree = pattern_tree(keys)
+    return timed_call(tree.copy), len(tree)
+
+
+OPERATIONS = {
+    'insert': op_insert,
+    'find': op_find,
+    'setitem': op_setitem,
+    'remove': op_remove,
+    'iterate': op_iterate,
+    'clear': op_clear,
+    'from_sorted': op_from_sorted,
+    'insert_many': op_insert_many,
+    'find_many': op_find_many,
+    'copy': op_copy,
+}
+PATTERNS = ['random', 'sorted', 'reverse', 'zipf', 'sliding']
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def measure(op, pattern, n, repeat, seed):
+    # Best throughput of several runs, latency percentiles of that run and peak memory of a separate traced run
+    keys = pattern_keys(pattern, n, random.Random(seed))
+    best = None
+    for _ in range(repeat):
+        latencies, count = OPERATIONS[op](keys)
+        total = sum(latencies) / 1e9
+        if best is None or total < best[0]:
+            best = (total, latencies, count)
+    total, latencies, count = best
+    tracemalloc.start()
+    OPERATIONS[op](keys)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'op': op,
+        'pattern': pattern,
+        'n': n,
+        'ops_per_sec': count / total if total else float('inf'),
+        'p50_us': percentile(latencies, 0.5) / 1e3,
+        'p99_us': percentile(latencies, 0.99) / 1e3,
+        'peak_kib': peak / 1024,
+    }
+
+
+def run_suite(sizes, ops, patterns, repeat, seed):
+    results = []
+    print(f"{'op':<12}{'pattern':<9}{'n':>9}{'ops/s':>14}{'p50 us':>10}{'p99 us':>10}{'peak KiB':>11}")
+    for n in sizes:
+        for op in ops:
+            for pattern in patterns:
+                result = measure(op, pattern, n, repeat, seed)
+                results.append(result)
+                print(f"{op:<12}{pattern:<9}{n:>9}{result['ops_per_sec']:>14,.0f}{result['p50_us']:>10.2f}{result['p99_us']:>10.2f}{result['peak_kib']:>11,.0f}")
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Print changes against baseline results. Returns number of throughput regressions beyond threshold
+    previous = {(r['op'], r['pattern'], r['n']): r for r in baseline['results']}
+    regressions = 0
+    for result in results:
+        old = previous.get((result['op'], result['pattern'], result['n']))
+        if old is None:
+            continue
+        change = result['ops_per_sec'] / old['ops_per_sec'] - 1
+        regressed = change < -threshold
+        regressions += regressed
+        print(f"{result['op']:<12}{result['pattern']:<9}{result['n']:>9}  ops/s {change:+7.1%}  p99 {old['p99_us']:.2f} -> {result['p99_us']:.2f} us{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def bench_memory(n):
+    # Bytes allocated per entry by tree nodes. Keys and values are created before measuring
+    pairs = [(i, i) for i in range(n)]
+    tracemalloc.start()
+    tree = RBTree.RBTree.from_sorted(pairs)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"memory n={n}: {size / n:.1f} bytes per entry")
+    return tree
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="RBTree benchmarks")
+    parser.add_argument('sizes', nargs='*', type=int, help="numbers of keys (default 1000 10000 100000)")
+    parser.add_argument('--ops', nargs='+', choices=list(OPERATIONS), default=list(OPERATIONS), help="operations to run")
+    parser.add_argument('--patterns', nargs='+', choices=PATTERNS, default=PATTERNS, help="key patterns to run")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement, the fastest one is reported")
+    parser.add_argument('--seed', type=int, default=0, help="seed of key patterns")
+    parser.add_argument('--json', metavar='PATH', help="save results as JSON baseline")
+    parser.add_argument('--compare', metavar='PATH', help="compare with JSON baseline and fail on regressions")
+    parser.add_argument('--threshold', type=float, default=0.1, help="allowed ops/s drop for --compare (default 0.1 = 10%%)")
+    parser.add_argument('--memory', action='store_true', help="report bytes per entry (default sizes 1e5, 1e6, 1e7)")
+    args = parser.parse_args()
+    if args.memory:
+        for n in args.sizes or [10 ** 5, 10 ** 6, 10 ** 7]:
+            bench_memory(n)
+        sys.exit(0)
+    results = run_suite(args.sizes or [1000, 10000, 100000], args.ops, args.patterns, args.repeat, args.seed)
+    if args.json:
+        with open(args.json, 'w') as file:
+            meta = {'python': platform.python_version(), 'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            json.dump({'meta': meta, 'results': results}, file, indent=1)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
@@ -1,4 +1,22 @@
-import unittest, RBTree
+import unittest, random, copy, collections, threading, asyncio, os, tempfile, RBTree, AggregateRBTree, PersistentRBTree, ConcurrentRBTree, AsyncRBTree, RBTreeFile, PagedRBTree, DurableRBTree, TypedRBTree, KeyedRBTree, MultiRBTree, IntervalRBTree, ExpiringRBTree, CachedRBTree, HashedRBTree
+
+
+def black_height(tree, node=None):
+    # Check red-black invariants of the subtree and return its black height
+    if node is None:
+        node = tree.root
+    if node == tree.nil:
+        return 1
+    if node.left != tree.nil:
+        assert node.left.parent == node and node.left.key < node.key
+    if node.right != tree.nil:
+        assert node.right.parent == node and node.right.key > node.key
+    if node.red:
+        assert not node.left.red and not node.right.red
+    assert node.size == node.left.size + node.right.size + (len(node.value) if isinstance(tree, MultiRBTree.MultiRBTree) else 1) # Multimap counts values
+    left = black_height(tree, node.left)
+    assert left == black_height(tree, node.right)
+    return left + (0 if node.red else 1)
 
 
 class TestMap(unittest.TestCase):
@@ -288,4 +306,1439 @@ class TestMap(unittest.TestCase):
         try:
             self.Map[100] = 'Z'
         except Exception as e:
-            self.assertEqual(str(e), "Map doesn't have a pair with key=100")
\ No newline at end of file
+            self.assertEqual(str(e), "Map doesn't have a pair with key=100")
+
+
+class TestBulkLoad(unittest.TestCase):
+
+    def test_from_sorted(self):
+        # Tree built from sorted pairs is a valid red-black tree for every size
+        for n in range(0, 70):
+            tree = RBTree.RBTree.from_sorted((i, str(i)) for i in range(n))
+            if n:
+                self.assertFalse(tree.root.red)
+                self.assertIsNone(tree.root.parent)
+                black_height(tree)
+            else:
+                self.assertTrue(tree.empty())
+            self.assertListEqual(sorted(tree.get_keys()), list(range(n)))
+            for i in range(n):
+                self.assertEqual(tree.find(i), str(i))
+
+    def test_from_sorted_then_insert_remove(self):
+        # Tree built from sorted pairs supports regular insertion and deletion
+        tree = RBTree.RBTree.from_sorted((i, i) for i in range(0, 40, 2))
+        tree.insert(5, 5)
+        tree.remove(10)
+        self.assertEqual(tree.find(5), 5)
+        self.assertIsNone(tree.find(10))
+
+    def test_from_sorted_unsorted_exception(self):
+        # Building from unsorted or duplicated keys causes exception
+        with self.assertRaises(Exception) as cm:
+            RBTree.RBTree.from_sorted([(1, 'A'), (3, 'B'), (2, 'C')])
+        self.assertEqual(str(cm.exception), "Keys are not sorted: key=2 after key=3")
+        with self.assertRaises(Exception):
+            RBTree.RBTree.from_sorted([(1, 'A'), (1, 'B')])
+
+    def test_from_unsorted(self):
+        # Pairs are sorted and last pair wins for equal keys
+        pairs = [(5, 'A'), (1, 'B'), (3, 'C'), (1, 'D'), (5, 'E')]
+        tree = RBTree.RBTree.from_unsorted(pairs)
+        black_height(tree)
+        self.assertListEqual(sorted(tree.get_keys()), [1, 3, 5])
+        self.assertEqual(tree.find(1), 'D')
+        self.assertEqual(tree.find(5), 'E')
+
+
+class TestInsert(unittest.TestCase):
+
+    def test_insert_random_keys(self):
+        # Tree stays valid after every insertion of random, ascending and descending keys
+        keys = list(range(300))
+        random.Random(1).shuffle(keys)
+        for stream in (keys, sorted(keys), sorted(keys, reverse=True)):
+            tree = RBTree.RBTree()
+            for key in stream:
+                tree.insert(key, -key)
+                black_height(tree)
+            for key in stream:
+                self.assertEqual(tree.find(key), -key)
+
+    def test_upsert(self):
+        # upsert inserts missing keys and sets value of existing ones
+        tree = RBTree.RBTree()
+        self.assertTrue(tree.upsert(8, 'A'))
+        self.assertTrue(tree.insert_or_assign(5, 'B'))
+        self.assertFalse(tree.upsert(8, 'C'))
+        self.assertEqual(tree.find(8), 'C')
+        self.assertEqual(tree.find(5), 'B')
+        for key in range(20):
+            tree.upsert(key, key)
+        black_height(tree)
+        self.assertEqual(tree.find(8), 8)
+
+    def test_node_slots(self):
+        # Nodes don't carry per-instance __dict__
+        tree = RBTree.RBTree()
+        tree.insert(1, 'A')
+        self.assertFalse(hasattr(tree.root, '__dict__'))
+        with self.assertRaises(AttributeError):
+            tree.root.color = 'red'
+
+
+class TestMapping(unittest.TestCase):
+
+    def setUp(self):
+        self.Map = RBTree.RBTree()
+        for key, value in [(8, 'A'), (18, 'B'), (5, 'C'), (15, 'D'), (17, 'E'), (25, 'F'), (40, 'G')]:
+            self.Map.insert(key, value)
+
+    def test_iter_in_order(self):
+        # Iteration yields keys in ascending order
+        self.assertListEqual(list(self.Map), [5, 8, 15, 17, 18, 25, 40])
+        self.assertListEqual(list(self.Map.keys()), [5, 8, 15, 17, 18, 25, 40])
+        self.assertListEqual(list(self.Map.values()), ['C', 'A', 'D', 'E', 'B', 'F', 'G'])
+        self.assertListEqual(list(self.Map.items())[:2], [(5, 'C'), (8, 'A')])
+
+    def test_reversed(self):
+        # Reversed iteration yields keys in descending order
+        self.assertListEqual(list(reversed(self.Map)), [40, 25, 18, 17, 15, 8, 5])
+        self.assertListEqual(list(self.Map.values(reverse=True)), ['G', 'F', 'B', 'E', 'D', 'A', 'C'])
+
+    def test_iter_empty(self):
+        # Empty tree yields nothing
+        empty = RBTree.RBTree()
+        self.assertListEqual(list(empty), [])
+        self.assertListEqual(list(reversed(empty)), [])
+        self.assertEqual(len(empty), 0)
+        self.assertNotIn(1, empty)
+
+    def test_len_contains_delitem(self):
+        # len, in and del operators
+        self.assertEqual(len(self.Map), 7)
+        self.assertIn(17, self.Map)
+        self.assertNotIn(16, self.Map)
+        del self.Map[17]
+        self.assertNotIn(17, self.Map)
+        self.assertEqual(len(self.Map), 6)
+
+    def test_successor_predecessor(self):
+        # Walking parent pointers visits nodes in key order
+        node = self.Map.minimum(self.Map.root)
+        keys = []
+        while node != self.Map.nil:
+            keys.append(node.key)
+            node = self.Map.successor(node)
+        self.assertListEqual(keys, [5, 8, 15, 17, 18, 25, 40])
+        node = self.Map.maximum(self.Map.root)
+        self.assertEqual(self.Map.predecessor(node).key, 25)
+
+    def test_random_remove(self):
+        # Tree stays valid and ordered after random insertions and deletions
+        rnd = random.Random(2)
+        tree = RBTree.RBTree()
+        expected = {}
+        for _ in range(2000):
+            key = rnd.randrange(200)
+            if key in expected:
+                del tree[key]
+                del expected[key]
+            else:
+                tree.insert(key, str(key))
+                expected[key] = str(key)
+            black_height(tree)
+        self.assertListEqual(list(tree.items()), sorted(expected.items()))
+
+    def test_floor_ceiling(self):
+        # Nearest pairs below and above key
+        self.assertEqual(self.Map.floor(16), (15, 'D'))
+        self.assertEqual(self.Map.floor(15), (15, 'D'))
+        self.assertEqual(self.Map.lower(15), (8, 'A'))
+        self.assertEqual(self.Map.ceiling(16), (17, 'E'))
+        self.assertEqual(self.Map.ceiling(17), (17, 'E'))
+        self.assertEqual(self.Map.higher(17), (18, 'B'))
+        self.assertIsNone(self.Map.floor(4))
+        self.assertIsNone(self.Map.higher(40))
+
+    def test_min_max_pop(self):
+        # Smallest and biggest pairs
+        self.assertEqual(self.Map.min(), (5, 'C'))
+        self.assertEqual(self.Map.max(), (40, 'G'))
+        self.assertEqual(self.Map.pop_min(), (5, 'C'))
+        self.assertEqual(self.Map.pop_max(), (40, 'G'))
+        self.assertListEqual(list(self.Map), [8, 15, 17, 18, 25])
+        black_height(self.Map)
+        with self.assertRaises(Exception):
+            RBTree.RBTree().pop_min()
+
+    def test_irange(self):
+        # Keys between bounds with inclusive flags and reverse order
+        self.assertListEqual(list(self.Map.irange(8, 18)), [8, 15, 17])
+        self.assertListEqual(list(self.Map.irange(8, 18, inclusive=(False, True))), [15, 17, 18])
+        self.assertListEqual(list(self.Map.irange(9, 18, reverse=True)), [17, 15])
+        self.assertListEqual(list(self.Map.irange(hi=8)), [5])
+        self.assertListEqual(list(self.Map.irange(lo=25)), [25, 40])
+        self.assertListEqual(list(self.Map.irange(50, 60)), [])
+        self.assertListEqual(list(self.Map.irange_items(17, 20)), [(17, 'E'), (18, 'B')])
+        self.assertListEqual(list(RBTree.RBTree().irange(1, 2)), [])
+
+    def test_rank_select(self):
+        # Positions of keys in key order
+        self.assertEqual(self.Map.rank(5), 0)
+        self.assertEqual(self.Map.rank(16), 3)
+        self.assertEqual(self.Map.rank(17), 3)
+        self.assertEqual(self.Map.rank(17, inclusive=True), 4)
+        self.assertEqual(self.Map.bisect_left(17), 3)
+        self.assertEqual(self.Map.bisect_right(17), 4)
+        self.assertEqual(self.Map.select(0), (5, 'C'))
+        self.assertEqual(self.Map.select(3), (17, 'E'))
+        self.assertEqual(self.Map.select(-1), (40, 'G'))
+        with self.assertRaises(Exception) as cm:
+            self.Map.select(7)
+        self.assertEqual(str(cm.exception), "Index 7 is out of range")
+
+    def test_select_slice(self):
+        # Positional slicing in both directions
+        self.assertListEqual(self.Map.select(slice(1, 3)), [(8, 'A'), (15, 'D')])
+        self.assertListEqual([key for key, _ in self.Map.select(slice(None, None, 2))], [5, 15, 18, 40])
+        self.assertListEqual([key for key, _ in self.Map.select(slice(None, None, -3))], [40, 17, 5])
+        self.assertListEqual(self.Map.select(slice(5, 2)), [])
+
+    def test_count_range(self):
+        # Number of keys between bounds
+        self.assertEqual(self.Map.count_range(8, 18), 3)
+        self.assertEqual(self.Map.count_range(8, 18, inclusive=(False, True)), 3)
+        self.assertEqual(self.Map.count_range(8, 18, inclusive=(True, True)), 4)
+        self.assertEqual(self.Map.count_range(hi=17), 3)
+        self.assertEqual(self.Map.count_range(lo=17), 4)
+        self.assertEqual(self.Map.count_range(30, 20), 0)
+        self.assertEqual(RBTree.RBTree().count_range(1, 2), 0)
+
+
+
+def check_aggregates(tree, node=None):
+    # Check aggregate of every subtree and return it
+    if node is None:
+        node = tree.root
+    if node == tree.nil:
+        return tree.identity
+    agg = tree.combine(tree.combine(check_aggregates(tree, node.left), node.value), check_aggregates(tree, node.right))
+    assert node.agg == agg
+    return agg
+
+
+class TestAggregate(unittest.TestCase):
+
+    def test_sum_range(self):
+        # Sum of values in key ranges matches brute force after insertions and deletions
+        rnd = random.Random(3)
+        tree = AggregateRBTree.AggregateRBTree()
+        expected = {}
+        for _ in range(1000):
+            key = rnd.randrange(100)
+            if key in expected and rnd.random() < 0.5:
+                tree.remove(key)
+                del expected[key]
+            else:
+                tree.upsert(key, rnd.randrange(1000))
+                expected[key] = tree.find(key)
+        black_height(tree)
+        check_aggregates(tree)
+        for lo, hi in [(10, 50), (0, 100), (42, 43), (60, 20), (None, 30), (70, None)]:
+            result = sum(v for k, v in expected.items() if (lo is None or k >= lo) and (hi is None or k < hi))
+            self.assertEqual(tree.reduce_range(lo, hi), result)
+        self.assertEqual(tree.reduce(), sum(expected.values()))
+
+    def test_non_commutative(self):
+        # Aggregate keeps key order for non-commutative combine
+        tree = AggregateRBTree.AggregateRBTree.from_unsorted([(k, chr(ord('a') + k)) for k in range(20)][::-1], identity='')
+        check_aggregates(tree)
+        self.assertEqual(tree.reduce(), 'abcdefghijklmnopqrst')
+        self.assertEqual(tree.reduce_range(3, 7), 'defg')
+        self.assertEqual(tree.reduce_range(3, 7, inclusive=(False, True)), 'efgh')
+        self.assertEqual(tree.reduce_range(30, 40), '')
+
+    def test_set_item_repairs_aggregates(self):
+        # Changing value updates aggregates along the parent chain
+        tree = AggregateRBTree.AggregateRBTree(max, float('-inf'))
+        for key in range(50):
+            tree.insert(key, key)
+        tree[10] = 1000
+        check_aggregates(tree)
+        self.assertEqual(tree.reduce_range(5, 15), 1000)
+        self.assertEqual(tree.reduce_range(20, 30), 29)
+        tree.insert_or_assign(10, 0)
+        self.assertEqual(tree.reduce_range(5, 15), 14)
+        self.assertEqual(AggregateRBTree.AggregateRBTree(max, float('-inf')).reduce_range(1, 2), float('-inf'))
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_seek_from_any_finger(self):
+        # Search from any node finds the same node as search from the root
+        tree = RBTree.RBTree.from_sorted((k, k) for k in range(0, 100, 3))
+        fingers = list(tree.nodes())
+        for finger in fingers:
+            for key in range(-2, 102):
+                node, parent = tree.seek(key, finger)
+                self.assertIs(node, tree.find_node(key))
+                if node == tree.nil: # Parent is the node to attach key to
+                    self.assertIs(getattr(parent, 'left' if parent.key > key else 'right'), tree.nil)
+
+    def test_insert_many(self):
+        # Sorted and unsorted batches report duplicates instead of raising
+        tree = RBTree.RBTree()
+        self.assertListEqual(tree.insert_many([(1, 'A'), (3, 'B'), (3, 'C'), (5, 'D')]), [True, True, False, True])
+        self.assertListEqual(tree.insert_many([4, 2, 1], ['E', 'F', 'G']), [True, True, False])
+        self.assertListEqual(tree.insert_many(range(10, 0, -1), range(10)), [True] * 5 + [False] * 5)
+        black_height(tree)
+        self.assertListEqual(list(tree.items())[:6], [(1, 'A'), (2, 'F'), (3, 'B'), (4, 'E'), (5, 'D'), (6, 4)])
+
+    def test_insert_many_append(self):
+        # Sorted batches beyond the biggest or smallest key keep tree valid
+        tree = RBTree.RBTree.from_sorted((k, k) for k in range(50, 60))
+        self.assertTrue(all(tree.insert_many((k, k) for k in range(55, 200))[5:]))
+        self.assertTrue(all(tree.insert_many((k, k) for k in range(49, -1, -1))))
+        black_height(tree)
+        self.assertListEqual(list(tree), list(range(200)))
+
+    def test_remove_many(self):
+        # Deletion reports missing keys and keeps tree valid
+        tree = RBTree.RBTree.from_sorted((k, k) for k in range(200))
+        keys = list(range(0, 220, 2))
+        self.assertListEqual(tree.remove_many(keys), [True] * 100 + [False] * 10)
+        black_height(tree)
+        self.assertListEqual(list(tree), list(range(1, 200, 2)))
+        keys = list(range(1, 200, 4))
+        random.Random(4).shuffle(keys)
+        self.assertTrue(all(tree.remove_many(keys)))
+        black_height(tree)
+        self.assertListEqual(list(tree), list(range(3, 200, 4)))
+
+    def test_find_update_many(self):
+        # Batch lookup with default and batch update
+        tree = AggregateRBTree.AggregateRBTree.from_sorted((k, k) for k in range(10))
+        self.assertListEqual(tree.find_many([8, 2, 11], default=-1), [8, 2, -1])
+        self.assertListEqual(tree.find_many([1, 5, 20]), [1, 5, None])
+        self.assertListEqual(tree.update_many([(2, 20), (4, 40), (12, 0)]), [True, True, False])
+        check_aggregates(tree)
+        self.assertEqual(tree.reduce(), 45 + 18 + 36)
+
+
+class TestSetAlgebra(unittest.TestCase):
+
+    def random_tree(self, rnd, size, tree_type=RBTree.RBTree):
+        pairs = {rnd.randrange(3 * size + 1): rnd.randrange(1000) for _ in range(size)}
+        tree = tree_type()
+        for key, value in pairs.items():
+            tree.insert(key, value)
+        return tree, pairs
+
+    def check(self, tree, expected):
+        if not tree.empty():
+            self.assertIsNone(tree.root.parent)
+            self.assertFalse(tree.root.red)
+            black_height(tree)
+        self.assertListEqual(list(tree.items()), sorted(expected.items()))
+        self.assertEqual(len(tree), len(expected))
+
+    def test_black_root(self):
+        # Halves of split and results of set operations have black roots, so next insertions keep the tree valid
+        left, right = RBTree.RBTree.from_sorted((k, k) for k in (1, 2, 3)).split(2)
+        self.check(left, {1: 1})
+        self.check(right, {2: 2, 3: 3})
+        left.insert(0, 0)
+        self.check(left, {0: 0, 1: 1})
+        rnd = random.Random(9)
+        for operation in ('union', 'intersection', 'difference', 'symmetric_difference'):
+            for _ in range(30):
+                a, pairs_a = self.random_tree(rnd, rnd.randrange(1, 20))
+                b, pairs_b = self.random_tree(rnd, rnd.randrange(1, 20))
+                getattr(a, operation)(b)
+                if not a.empty():
+                    self.assertFalse(a.root.red)
+                for key in range(-3, 0):
+                    a.insert(key, key)
+                black_height(a)
+
+    def test_split(self):
+        # Split at every key keeps both halves valid
+        rnd = random.Random(5)
+        for size in (0, 1, 2, 10, 60):
+            for key in range(-1, 3 * size + 2, 3):
+                tree, pairs = self.random_tree(rnd, size)
+                left, right = tree.split(key)
+                self.check(left, {k: v for k, v in pairs.items() if k < key})
+                self.check(right, {k: v for k, v in pairs.items() if k >= key})
+                self.assertTrue(tree.empty())
+
+    def test_join(self):
+        # Join trees of different black heights around a middle pair
+        rnd = random.Random(6)
+        for left_size, right_size in [(0, 0), (0, 5), (30, 0), (1, 40), (50, 3), (25, 25)]:
+            left = RBTree.RBTree.from_sorted((k, k) for k in range(left_size))
+            right = RBTree.RBTree()
+            for key in rnd.sample(range(1000, 2000), right_size):
+                right.insert(key, key)
+            expected = dict(left.items())
+            expected.update(right.items())
+            expected[500] = 'mid'
+            tree = RBTree.RBTree.join(left, 500, 'mid', right)
+            self.check(tree, expected)
+            self.assertTrue(left.empty() and right.empty())
+            tree.insert(501, 0)
+            tree.remove(500)
+            black_height(tree)
+
+    def test_join_exception(self):
+        # Keys must be ordered around the middle key
+        left = RBTree.RBTree.from_sorted([(1, 'A'), (5, 'B')])
+        right = RBTree.RBTree.from_sorted([(9, 'C')])
+        with self.assertRaises(Exception) as cm:
+            RBTree.RBTree.join(left, 4, 'D', right)
+        self.assertEqual(str(cm.exception), "Keys of left tree must be less than key=4 and keys of right tree greater")
+
+    def test_set_operations(self):
+        # Set operations match dictionary results for trees of different sizes
+        rnd = random.Random(7)
+        for size_a, size_b in [(0, 10), (10, 0), (1, 1), (20, 20), (100, 7), (5, 120)]:
+            for operation in ('union', 'intersection', 'difference', 'symmetric_difference'):
+                a, pairs_a = self.random_tree(rnd, size_a)
+                b, pairs_b = self.random_tree(rnd, size_b)
+                if operation == 'union':
+                    a.union(b, merge=lambda value, other: value + other)
+                    expected = dict(pairs_a)
+                    for key, value in pairs_b.items():
+                        expected[key] = expected[key] + value if key in expected else value
+                elif operation == 'intersection':
+                    a.intersection(b, merge=lambda value, other: value - other)
+                    expected = {k: v - pairs_b[k] for k, v in pairs_a.items() if k in pairs_b}
+                elif operation == 'difference':
+                    a.difference(b)
+                    expected = {k: v for k, v in pairs_a.items() if k not in pairs_b}
+                else:
+                    a.symmetric_difference(b)
+                    expected = {k: v for k, v in pairs_a.items() if k not in pairs_b}
+                    expected.update((k, v) for k, v in pairs_b.items() if k not in pairs_a)
+                self.check(a, expected)
+                self.assertTrue(b.empty())
+
+    def test_set_operations_keep_aggregates(self):
+        # Aggregates stay valid after split and union
+        rnd = random.Random(8)
+        a, pairs_a = self.random_tree(rnd, 80, AggregateRBTree.AggregateRBTree)
+        b, pairs_b = self.random_tree(rnd, 30, AggregateRBTree.AggregateRBTree)
+        a.union(b)
+        pairs_a.update(pairs_b)
+        check_aggregates(a)
+        self.assertEqual(a.reduce(), sum(pairs_a.values()))
+        left, right = a.split(100)
+        check_aggregates(left)
+        check_aggregates(right)
+        self.assertEqual(left.reduce() + right.reduce(), sum(pairs_a.values()))
+
+
+class TestCopy(unittest.TestCase):
+
+    def setUp(self):
+        self.Map = RBTree.RBTree()
+        for key in range(30):
+            self.Map.insert(key, [key])
+
+    def test_clear_and_reuse(self):
+        # Cleared tree is empty and can be filled again
+        self.Map.clear()
+        self.assertTrue(self.Map.empty())
+        self.assertEqual(len(self.Map), 0)
+        self.assertListEqual(list(self.Map), [])
+        self.Map.insert(5, 'A')
+        self.Map.insert(3, 'B')
+        black_height(self.Map)
+        self.assertListEqual(list(self.Map), [3, 5])
+
+    def test_copy(self):
+        # Copy has the same shape and is independent from the tree
+        tree = self.Map.copy()
+        black_height(tree)
+        self.assertListEqual(tree.get_keys(), self.Map.get_keys())
+        tree.insert(100, 'A')
+        tree.remove(0)
+        self.assertIn(0, self.Map)
+        self.assertNotIn(100, self.Map)
+        self.assertIs(tree[5], self.Map[5]) # Values are shared
+        self.assertListEqual(list(copy.copy(self.Map)), list(self.Map))
+        self.assertTrue(RBTree.RBTree().copy().empty())
+
+    def test_deepcopy(self):
+        # Deep copy copies values too
+        tree = copy.deepcopy(self.Map)
+        black_height(tree)
+        self.assertListEqual(list(tree.items()), list(self.Map.items()))
+        tree[5].append(0)
+        self.assertListEqual(self.Map[5], [5])
+
+    def test_copy_aggregate(self):
+        # Copy of aggregate tree keeps aggregates and settings
+        tree = AggregateRBTree.AggregateRBTree(max, -1)
+        for key in range(20):
+            tree.insert(key, key * 2)
+        clone = copy.deepcopy(tree)
+        check_aggregates(clone)
+        self.assertEqual(clone.reduce_range(3, 8), 14)
+
+
+class TestStats(unittest.TestCase):
+
+    def test_disabled(self):
+        # Stats are off by default and tree keeps its own class
+        tree = RBTree.RBTree()
+        self.assertIsNone(tree.stats())
+        tree.enable_stats()
+        tree.disable_stats()
+        self.assertIs(type(tree), RBTree.RBTree)
+        self.assertIsNone(tree.stats())
+
+    def test_counters(self):
+        # Sorted inserts rotate, counting methods keep the tree valid
+        records = []
+        tree = RBTree.RBTree()
+        tree.enable_stats(lambda op, record: records.append((op, record)))
+        for key in range(100):
+            tree.insert(key, key)
+        for key in range(0, 100, 2):
+            tree.remove(key)
+        black_height(tree)
+        self.assertIn(5, tree)
+        stats = tree.stats()
+        self.assertEqual(stats['ops'], {'insert': 100, 'remove': 50, 'contains': 1})
+        self.assertGreater(stats['rotations'], 0)
+        self.assertGreater(stats['recolors'], 0)
+        self.assertEqual(sum(record['rotations'] for op, record in records), stats['rotations'])
+        self.assertEqual(sum(stats['histograms']['insert']['path'].values()), 100)
+        self.assertLessEqual(max(stats['histograms']['contains']['path']), 2 * black_height(tree))
+
+    def test_aggregate(self):
+        # Stats work with subclasses
+        tree = AggregateRBTree.AggregateRBTree()
+        tree.enable_stats()
+        for key in range(50):
+            tree.upsert(key, key)
+        tree[10] = 100
+        check_aggregates(tree)
+        self.assertEqual(tree.stats()['ops'], {'upsert': 50, 'setitem': 1})
+        self.assertEqual(type(tree).__name__, 'StatsAggregateRBTree')
+        tree.disable_stats()
+        self.assertIs(type(tree), AggregateRBTree.AggregateRBTree)
+
+    def test_same_shape(self):
+        # Counting balancing mirrors the tree's own, so shapes match and every flip is counted
+        rnd = random.Random(12)
+        plain = RBTree.RBTree()
+        tree = RBTree.RBTree()
+        tree.enable_stats()
+        for step in range(1500):
+            key = rnd.randrange(200)
+            before = {node: node.red for node in tree.nodes()}
+            recolors = tree.stats()['recolors']
+            if key in plain:
+                plain.remove(key)
+                tree.remove(key)
+            else:
+                plain.insert(key, step)
+                tree.insert(key, step)
+                if before:
+                    before[tree.find_node(key)] = True # New node is red until balancing
+            survivors = set(tree.nodes())
+            changed = sum(node.red != red for node, red in before.items() if node in survivors)
+            self.assertGreaterEqual(tree.stats()['recolors'] - recolors, changed) # Node can flip twice
+            self.assertListEqual([(node.key, node.red) for node in tree.nodes()], [(node.key, node.red) for node in plain.nodes()])
+        self.assertGreater(tree.stats()['iterations'], 0)
+
+    def test_exact_counts(self):
+        # Rotation case and red uncle case of insertion
+        records = []
+        tree = RBTree.RBTree()
+        tree.enable_stats(lambda op, record: records.append(record))
+        for key in range(4):
+            tree.insert(key, key)
+        self.assertDictEqual(records[2], {'rotations': 1, 'recolors': 2, 'iterations': 1, 'path': 3})
+        self.assertDictEqual(records[3], {'rotations': 0, 'recolors': 4, 'iterations': 1, 'path': 3})
+
+    def test_copies_and_subclasses(self):
+        # Copies count their own operations, subclasses keep their own lookups
+        tree = RBTree.RBTree.from_sorted((k, k) for k in range(10))
+        tree.enable_stats()
+        clone = tree.copy()
+        clone.insert(10, 10)
+        left, right = clone.split(5)
+        right.insert(11, 11)
+        self.assertEqual(tree.stats()['ops'], {})
+        self.assertEqual(clone.stats()['ops'], {'insert': 1})
+        self.assertEqual(right.stats()['ops'], {'insert': 1})
+        hashed = HashedRBTree.HashedRBTree.from_sorted((k, k) for k in range(10))
+        hashed.enable_stats()
+        hashed.index['x'] = hashed.root # Tree walk would compare 'x' with int keys
+        self.assertEqual(hashed.find('x'), hashed.root.value)
+        self.assertEqual(hashed.stats()['ops'], {'find': 1})
+        self.assertEqual(hashed.stats()['histograms']['find']['path'], {1: 1}) # One probe of the index
+
+
+def persistent_black_height(node):
+    # Check invariants of persistent subtree and return its black height
+    if node is None:
+        return 1
+    if node.red:
+        assert not PersistentRBTree.is_red(node.left) and not PersistentRBTree.is_red(node.right), "Red node has red child"
+    assert node.left is None or node.left.key < node.key, "Keys are not ordered"
+    assert node.right is None or node.right.key > node.key, "Keys are not ordered"
+    assert node.size == PersistentRBTree.size(node.left) + PersistentRBTree.size(node.right) + 1, "Wrong size"
+    height = persistent_black_height(node.left)
+    assert height == persistent_black_height(node.right), "Black heights differ"
+    return height + (not node.red)
+
+
+class TestPersistent(unittest.TestCase):
+
+    def test_random(self):
+        # Random changes keep the tree valid and equal to dict
+        rnd = random.Random(3)
+        tree = PersistentRBTree.PersistentRBTree()
+        expected = {}
+        for step in range(2000):
+            key = rnd.randrange(300)
+            if rnd.random() < 0.6:
+                tree.upsert(key, step)
+                expected[key] = step
+            elif key in expected:
+                del tree[key]
+                del expected[key]
+            self.assertFalse(PersistentRBTree.is_red(tree.root))
+        persistent_black_height(tree.root)
+        self.assertListEqual(list(tree.items()), sorted(expected.items()))
+        self.assertEqual(len(tree), len(expected))
+
+    def test_snapshot(self):
+        # Snapshot shares nodes and doesn't see later changes
+        tree = PersistentRBTree.PersistentRBTree.from_sorted((key, key) for key in range(100))
+        snapshot = tree.snapshot()
+        self.assertIs(snapshot.root, tree.root)
+        items = iter(tree.items())
+        for key in range(0, 100, 3):
+            tree.remove(key)
+        tree.insert(500, 'A')
+        tree[1] = 'B'
+        persistent_black_height(tree.root)
+        persistent_black_height(snapshot.root)
+        self.assertListEqual(list(snapshot.items()), [(key, key) for key in range(100)])
+        self.assertListEqual(list(items), [(key, key) for key in range(100)]) # Iterator keeps version it started with
+        self.assertEqual(tree[1], 'B')
+        self.assertNotIn(3, tree)
+        snapshot.insert(-1, 'C')
+        self.assertNotIn(-1, tree)
+
+    def test_errors_and_ranges(self):
+        # Same errors and ranges as RBTree
+        tree = PersistentRBTree.PersistentRBTree()
+        self.assertRaises(Exception, tree.remove, 1)
+        self.assertRaises(Exception, tree.find, 1)
+        tree = PersistentRBTree.PersistentRBTree.from_unsorted([(5, 'A'), (1, 'B'), (5, 'C'), (9, 'D')])
+        self.assertRaises(Exception, tree.insert, 1, 'E')
+        self.assertRaises(Exception, tree.remove, 2)
+        self.assertRaises(Exception, tree.__setitem__, 2, 'E')
+        self.assertEqual(tree[5], 'C')
+        self.assertIsNone(tree[2])
+        self.assertIsNone(tree.find(2))
+        self.assertListEqual(list(tree.irange(1, 9)), [1, 5])
+        self.assertListEqual(list(tree.irange(1, 9, (False, True), reverse=True)), [9, 5])
+        self.assertListEqual(list(reversed(tree)), [9, 5, 1])
+        self.assertTupleEqual(tree.min(), (1, 'B'))
+        self.assertTupleEqual(tree.max(), (9, 'D'))
+
+
+class TestConcurrent(unittest.TestCase):
+
+    def stress(self, tree, check):
+        # Writers insert and remove keys in pairs, readers check that every commit is a valid tree with even size
+        errors = []
+        done = threading.Event()
+
+        def writer(offset):
+            rnd = random.Random(offset)
+            keys = []
+            for _ in range(300):
+                with tree.batch() as batch:
+                    if keys and rnd.random() < 0.4:
+                        for _ in range(2):
+                            batch.remove(keys.pop(rnd.randrange(len(keys))))
+                    else:
+                        for _ in range(2):
+                            key = offset + len(keys) + rnd.random()
+                            batch.insert(key, key)
+                            keys.append(key)
+
+        def reader():
+            try:
+                while not done.is_set():
+                    with tree.read() as view:
+                        if len(view):
+                            check(view)
+                        self.assertEqual(len(view) % 2, 0)
+                        keys = list(view)
+                    self.assertListEqual(keys, sorted(keys))
+            except Exception as error:
+                errors.append(error)
+
+        writers = [threading.Thread(target=writer, args=(offset,)) for offset in (0, 10 ** 6)]
+        readers = [threading.Thread(target=reader) for _ in range(3)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+        self.assertListEqual(errors, [])
+        with tree.read() as view:
+            check(view)
+
+    def test_locked(self):
+        # Readers hold read lock while writers commit
+        self.stress(ConcurrentRBTree.ConcurrentRBTree(), black_height)
+
+    def test_snapshot_reads(self):
+        # Readers use committed snapshots without locks
+        self.stress(ConcurrentRBTree.ConcurrentRBTree(snapshot_reads=True), lambda view: persistent_black_height(view.root))
+
+    def test_rollback(self):
+        # Failed batch is not committed with snapshot reads
+        tree = ConcurrentRBTree.ConcurrentRBTree(snapshot_reads=True)
+        tree.update([(1, 'A'), (2, 'B')])
+        snapshot = tree.snapshot()
+        with self.assertRaises(Exception):
+            with tree.batch() as batch:
+                batch.insert(3, 'C')
+                batch.insert(1, 'D')
+        self.assertListEqual(list(tree.items()), [(1, 'A'), (2, 'B')])
+        tree[2] = 'E'
+        del tree[1]
+        self.assertListEqual(list(tree.items()), [(2, 'E')])
+        self.assertListEqual(list(snapshot.items()), [(1, 'A'), (2, 'B')])
+        self.assertEqual(tree.get(1, 'F'), 'F')
+        self.assertRaises(Exception, ConcurrentRBTree.ConcurrentRBTree().snapshot)
+
+    def test_find_modes(self):
+        # Lookups behave the same with and without snapshot reads
+        for snapshot_reads in (False, True):
+            tree = ConcurrentRBTree.ConcurrentRBTree(snapshot_reads=snapshot_reads)
+            self.assertRaises(Exception, tree.find, 1)
+            tree.update([(1, 'A')])
+            self.assertEqual(tree[1], 'A')
+            self.assertIsNone(tree.find(2))
+            self.assertIsNone(tree[2])
+            self.assertEqual(tree.get(1, 'B'), 'A')
+            self.assertEqual(tree.get(2, 'B'), 'B')
+
+
+class TestAsync(unittest.IsolatedAsyncioTestCase):
+
+    async def test_iteration_yields(self):
+        # Iteration gives control to other tasks between chunks and sees changes made there
+        tree = AsyncRBTree.AsyncRBTree(chunk=10)
+        await tree.insert_many(range(0, 100, 2), range(50))
+        black_height(tree.tree)
+        ticks = 0
+
+        async def writer():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await tree.upsert(1000 + ticks, 0)
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(writer())
+        keys = [key async for key in tree]
+        task.cancel()
+        self.assertGreater(ticks, 1)
+        self.assertListEqual(keys[:50], list(range(0, 100, 2)))
+        self.assertListEqual(keys, sorted(keys))
+        self.assertListEqual([value async for value in tree.values(10, 20, (False, True), reverse=True)], [10, 9, 8, 7, 6])
+
+    async def test_bulk(self):
+        # Bulk operations keep the tree valid and get_keys keeps RBTree order
+        tree = AsyncRBTree.AsyncRBTree(chunk=7)
+        await tree.load((key, str(key)) for key in reversed(range(100)))
+        self.assertEqual(tree.find(5), '5')
+        self.assertEqual(tree.get(500, 'A'), 'A')
+        await tree.remove_many(range(0, 100, 3))
+        black_height(tree.tree)
+        self.assertNotIn(3, tree)
+        self.assertEqual(len(tree), 66)
+        self.assertListEqual(await tree.get_keys(), tree.tree.get_keys())
+        clone = await tree.copy()
+        await tree.set(1, 'B')
+        await tree.remove(1)
+        self.assertEqual(clone.find(1), '1')
+        await tree.clear()
+        self.assertListEqual(await tree.get_values(), [])
+
+
+class TestFile(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'tree.rbt')
+
+    def test_dump_load(self):
+        # Loaded tree is valid and equal to dumped one for every codec
+        for pairs in ([(key, key * 0.5) for key in range(-50, 50)], [(str(key), bytes([key])) for key in range(100)], [((key, 'A'), [key]) for key in range(20)], []):
+            tree = RBTree.RBTree.from_unsorted(pairs)
+            tree.dump(self.path)
+            loaded = RBTree.RBTree.load(self.path)
+            self.assertListEqual(list(loaded.items()), sorted(pairs))
+            if pairs:
+                black_height(loaded)
+        tree = AggregateRBTree.AggregateRBTree.load(self.path, combine=max, identity=-1)
+        self.assertEqual(tree.reduce(), -1)
+
+    def test_mapped(self):
+        # Mapped file answers queries like the tree
+        tree = RBTree.RBTree.from_sorted((key, str(key)) for key in range(0, 100, 2))
+        tree.dump(self.path)
+        with RBTreeFile.MappedRBTree(self.path) as mapped:
+            self.assertEqual(len(mapped), 50)
+            self.assertEqual(mapped.find(10), '10')
+            self.assertEqual(mapped.get(11, 'A'), 'A')
+            self.assertIsNone(mapped.find(11))
+            self.assertIsNone(mapped[11])
+            self.assertNotIn(11, mapped)
+            for key in (-1, 0, 11, 98, 99):
+                self.assertEqual(mapped.floor(key), tree.floor(key))
+                self.assertEqual(mapped.ceiling(key), tree.ceiling(key))
+                self.assertEqual(mapped.lower(key), tree.lower(key))
+                self.assertEqual(mapped.higher(key), tree.higher(key))
+            self.assertListEqual(list(mapped.irange_items(10, 20, (False, True), reverse=True)), list(tree.irange_items(10, 20, (False, True), reverse=True)))
+            self.assertListEqual(list(mapped), list(tree))
+            self.assertTupleEqual(mapped.max(), (98, '98'))
+
+    def test_bad_file(self):
+        # Files of other formats are rejected
+        with open(self.path, 'wb') as file:
+            file.write(b'0' * 100)
+        self.assertRaises(Exception, RBTree.RBTree.load, self.path)
+
+
+class TestPaged(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'tree.pages')
+
+    def test_random_small_cache(self):
+        # Tree algorithms work on pages when most of them are evicted
+        rnd = random.Random(5)
+        expected = {}
+        with PagedRBTree.PagedRBTree(self.path, capacity=8) as tree:
+            for step in range(1500):
+                key = rnd.randrange(300)
+                if rnd.random() < 0.6:
+                    tree.upsert(key, str(step))
+                    expected[key] = str(step)
+                elif key in expected:
+                    tree.remove(key)
+                    del expected[key]
+            black_height(tree)
+            self.assertListEqual(list(tree.items()), sorted(expected.items()))
+            stats = tree.cache_stats()
+            self.assertGreater(stats['misses'], 0)
+            self.assertGreater(stats['evictions'], 0)
+            self.assertEqual(stats['cached'], 8)
+        with PagedRBTree.PagedRBTree(self.path) as tree: # Reopened file has the same tree
+            black_height(tree)
+            self.assertListEqual(list(tree.items()), sorted(expected.items()))
+
+    def test_pages_reused(self):
+        # Pages of removed nodes are reused and big pairs are rejected
+        with PagedRBTree.PagedRBTree.from_sorted(((key, key) for key in range(100)), path=self.path, page_size=64) as tree:
+            pages = tree.cache_stats()['pages']
+            for key in range(50):
+                tree.remove(key)
+            for key in range(100, 150):
+                tree.insert(key, key)
+            black_height(tree)
+            self.assertEqual(tree.cache_stats()['pages'], pages)
+            self.assertRaises(Exception, tree.insert, 1000, 'A' * 100)
+            self.assertNotIn(1000, tree)
+            self.assertRaises(Exception, tree.__setitem__, 100, 'A' * 100)
+            self.assertEqual(tree[100], 100)
+
+    def test_unsupported(self):
+        # Operations that would mix files or leave orphan pages fail before changing the tree
+        other_path = self.path + '.other'
+        self.addCleanup(os.remove, other_path)
+        with PagedRBTree.PagedRBTree.from_sorted(((key, key) for key in range(10)), path=self.path) as tree:
+            with PagedRBTree.PagedRBTree.from_sorted(((key, key) for key in range(5, 15)), path=other_path) as other:
+                for operation in (tree.union, tree.intersection, tree.difference, tree.symmetric_difference):
+                    self.assertRaises(Exception, operation, other)
+                self.assertRaises(Exception, tree.split, 5)
+                self.assertRaises(Exception, tree.copy)
+                self.assertRaises(Exception, copy.copy, tree)
+                self.assertListEqual(list(tree), list(range(10)))
+                self.assertListEqual(list(other), list(range(5, 15)))
+
+
+class TestDurable(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def fill(self, tree, expected, steps, seed):
+        rnd = random.Random(seed)
+        for step in range(steps):
+            key = rnd.randrange(100)
+            if key not in expected:
+                tree.insert(key, step)
+            elif rnd.random() < 0.5:
+                tree[key] = step
+            else:
+                del tree[key]
+                del expected[key]
+                continue
+            expected[key] = step
+
+    def test_replay(self):
+        # Reopened tree replays the log, torn last record is dropped
+        expected = {}
+        with DurableRBTree.DurableRBTree(self.directory, sync_every=10) as tree:
+            self.fill(tree, expected, 300, 1)
+            self.assertRaises(Exception, tree.insert, next(iter(expected)), 0) # Failed change is not logged
+        with open(os.path.join(self.directory, 'wal-0.log'), 'ab') as log:
+            log.write(b'\x10\x00\x00\x00garbage')
+        with DurableRBTree.DurableRBTree(self.directory) as tree:
+            self.assertListEqual(list(tree.items()), sorted(expected.items()))
+            tree.upsert(1000, 'A')
+        with DurableRBTree.DurableRBTree(self.directory) as tree:
+            self.assertEqual(tree[1000], 'A')
+            self.assertRaises(Exception, tree.insert, 1001, lambda: 0) # Pair that can't be logged is not inserted
+            self.assertNotIn(1001, tree)
+        tree = DurableRBTree.DurableRBTree(self.directory)
+        tree.close()
+        self.assertRaises(Exception, tree.insert, 1002, 'B') # Change that can't be logged is not made
+        self.assertNotIn(1002, tree)
+
+    def test_compaction(self):
+        # Compaction replaces log with snapshot, changes made during it are kept
+        expected = {}
+        with DurableRBTree.DurableRBTree(self.directory, compact_bytes=2000) as tree:
+            self.fill(tree, expected, 500, 2)
+        self.assertEqual(sorted(os.listdir(self.directory))[0][:4], 'snap')
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        with DurableRBTree.DurableRBTree(self.directory) as tree:
+            self.assertListEqual(list(tree.items()), sorted(expected.items()))
+            black_height(tree.tree)
+            tree.clear()
+            tree.compact(background=False)
+        with DurableRBTree.DurableRBTree(self.directory) as tree:
+            self.assertEqual(len(tree), 0)
+
+
+def typed_black_height(tree, node=None):
+    # Check red-black invariants of typed subtree and return its black height
+    if node is None:
+        node = tree.root
+        assert not tree.red[node] and not tree.parent[node], "Root must be black and have no parent"
+    if not node:
+        return 1
+    for child in (tree.left[node], tree.right[node]):
+        if child:
+            assert tree.parent[child] == node, "Wrong parent"
+            assert not (tree.red[node] and tree.red[child]), "Red node has red child"
+    assert not tree.left[node] or tree.key_pool[tree.left[node]] < tree.key_pool[node], "Keys are not ordered"
+    assert not tree.right[node] or tree.key_pool[tree.right[node]] > tree.key_pool[node], "Keys are not ordered"
+    height = typed_black_height(tree, tree.left[node])
+    assert height == typed_black_height(tree, tree.right[node]), "Black heights differ"
+    return height + (not tree.red[node])
+
+
+class TestTyped(unittest.TestCase):
+
+    def test_random(self):
+        # Random changes keep the tree valid, deleted slots are reused
+        rnd = random.Random(7)
+        tree = TypedRBTree.TypedRBTree('int64', 'float64')
+        expected = {}
+        for step in range(2000):
+            key = rnd.randrange(-300, 300)
+            if rnd.random() < 0.6:
+                tree.upsert(key, step / 2)
+                expected[key] = step / 2
+            elif key in expected:
+                del tree[key]
+                del expected[key]
+        typed_black_height(tree)
+        self.assertListEqual(list(tree.items()), sorted(expected.items()))
+        self.assertEqual(len(tree.key_pool), len(expected) + len(tree.free) + 1)
+        self.assertListEqual(list(tree.keys(reverse=True)), sorted(expected, reverse=True)) # Pools don't hide mapping methods
+        self.assertListEqual(list(tree.values()), [expected[key] for key in sorted(expected)])
+        self.assertListEqual(list(tree.keys_array()), sorted(expected))
+        self.assertListEqual(list(tree.values_array()), [expected[key] for key in sorted(expected)])
+        self.assertListEqual(list(tree.irange(-10, 10, reverse=True)), [key for key in sorted(expected, reverse=True) if -10 <= key < 10])
+
+    def test_bulk(self):
+        # Big batch is merged and rebuilt, small batch is inserted, both keep first pair of equal keys
+        tree = TypedRBTree.TypedRBTree('float64')
+        self.assertListEqual(tree.insert_many([3.0, 1.0, 2.0, 1.0], ['A', 'B', 'C', 'D']), [True, True, True, False])
+        self.assertListEqual(tree.insert_many([(2.0, 'E'), (0.5, 'F'), (5.0, 'G'), (0.5, 'H')]), [False, True, True, False])
+        typed_black_height(tree)
+        self.assertListEqual(tree.insert_many([4.0], ['I']), [True])
+        self.assertListEqual(list(tree.items()), [(0.5, 'F'), (1.0, 'B'), (2.0, 'C'), (3.0, 'A'), (4.0, 'I'), (5.0, 'G')])
+        self.assertListEqual(tree.find_many([1.0, 1.5, 5.0], 'Z'), ['B', 'Z', 'G'])
+        self.assertTupleEqual(tree.max(), (5.0, 'G'))
+
+    def test_errors(self):
+        # Keys must fit dtype, failed insert doesn't change the tree
+        tree = TypedRBTree.TypedRBTree('int64', 'int32')
+        tree.insert(1, 1)
+        self.assertRaises(Exception, tree.insert, 1, 2)
+        self.assertRaises(Exception, tree.insert, 2 ** 70, 2)
+        self.assertRaises(Exception, tree.insert, 2, 'A')
+        self.assertRaises(Exception, tree.insert_many, [3, 4], [1, 'A'])
+        self.assertRaises(Exception, tree.remove, 2)
+        self.assertIsNone(tree[2])
+        self.assertRaises(Exception, TypedRBTree.TypedRBTree, 'str')
+        self.assertListEqual(list(tree.items()), [(1, 1)])
+        typed_black_height(tree)
+
+
+class TestKeyed(unittest.TestCase):
+
+    def test_key(self):
+        # Sort key is computed once per pair and keeps user keys
+        calls = []
+
+        def length(word):
+            calls.append(word)
+            return len(word)
+
+        tree = KeyedRBTree.KeyedRBTree(key=length)
+        for word in ('ccc', 'a', 'dddd', 'bb'):
+            tree.insert(word, word.upper())
+        self.assertEqual(len(calls), 4)
+        self.assertListEqual(list(tree.items()), [('a', 'A'), ('bb', 'BB'), ('ccc', 'CCC'), ('dddd', 'DDDD')])
+        black_height(tree.tree)
+        self.assertEqual(tree['xx'], 'BB') # Same sort key is the same map key
+        self.assertRaises(Exception, tree.insert, 'yy', 0)
+        self.assertIsNone(tree['xxxxx'])
+        tree['zz'] = 'Z'
+        self.assertTupleEqual(tree.floor('12345'), ('dddd', 'DDDD'))
+        self.assertListEqual(list(tree.irange('1', '123', (False, True))), ['zz', 'ccc'])
+        del tree['a']
+        self.assertNotIn('b', tree)
+
+    def test_cmp_reverse(self):
+        # Comparator and reverse flag change map order
+        tree = KeyedRBTree.KeyedRBTree.from_unsorted([(key, str(key)) for key in range(10)], cmp=lambda a, b: (a > b) - (a < b), reverse=True)
+        self.assertListEqual(list(tree), list(range(9, -1, -1)))
+        self.assertListEqual(list(reversed(tree)), list(range(10)))
+        self.assertTupleEqual(tree.min(), (9, '9'))
+        self.assertTupleEqual(tree.floor(5), (5, '5'))
+        self.assertTupleEqual(tree.lower(5), (6, '6'))
+        self.assertTupleEqual(tree.higher(5), (4, '4'))
+        self.assertIsNone(tree.higher(0))
+        self.assertListEqual(list(tree.irange(7, 3)), [7, 6, 5, 4])
+        self.assertListEqual(list(tree.irange(7, 3, reverse=True)), [4, 5, 6, 7])
+        self.assertTupleEqual(tree.pop_max(), (0, '0'))
+        self.assertListEqual(tree.insert_many([(0, 'A'), (1, 'B')]), [True, False])
+        self.assertRaises(Exception, KeyedRBTree.KeyedRBTree, len, max)
+
+
+def check_buckets(tree, node=None):
+    # Check that subtree sizes count values and return size of subtree
+    if node is None:
+        node = tree.root
+    if node == tree.nil:
+        return 0
+    size = check_buckets(tree, node.left) + check_buckets(tree, node.right) + len(node.value)
+    assert node.value and node.size == size, "Wrong size"
+    return size
+
+
+class TestMulti(unittest.TestCase):
+
+    def test_random(self):
+        # Random adds and removes keep buckets in insertion order
+        rnd = random.Random(11)
+        tree = MultiRBTree.MultiRBTree()
+        expected = {}
+        for step in range(2000):
+            key = rnd.randrange(50)
+            action = rnd.random()
+            if action < 0.6:
+                tree.insert(key, step)
+                expected.setdefault(key, []).append(step)
+            elif key in expected and action < 0.9:
+                self.assertEqual(tree.remove_one(key), expected[key].pop(0))
+                if not expected[key]:
+                    del expected[key]
+            elif key in expected:
+                self.assertListEqual(tree.remove_all(key), expected.pop(key))
+        black_height(tree)
+        check_buckets(tree)
+        pairs = [(key, value) for key in sorted(expected) for value in expected[key]]
+        self.assertListEqual(list(tree.items()), pairs)
+        self.assertListEqual(list(tree.items(reverse=True)), pairs[::-1])
+        self.assertEqual(len(tree), len(pairs))
+        self.assertListEqual(tree.select(slice(5, 20, 3)), pairs[5:20:3])
+        self.assertEqual(tree.rank(25), sum(1 for key, value in pairs if key < 25))
+
+    def test_buckets(self):
+        # Duplicates are counted and ranges yield every value
+        tree = MultiRBTree.MultiRBTree.from_unsorted([(2, 'A'), (1, 'B'), (2, 'C'), (3, 'D'), (2, 'E')])
+        check_buckets(tree)
+        self.assertEqual(tree.count(2), 3)
+        self.assertEqual(tree.count(5), 0)
+        self.assertListEqual(tree.get_all(2), ['A', 'C', 'E'])
+        self.assertEqual(tree.find(2), 'A')
+        self.assertListEqual(list(tree.irange_items(2, 3, (True, True))), [(2, 'A'), (2, 'C'), (2, 'E'), (3, 'D')])
+        self.assertEqual(tree.count_range(2, 3), 3)
+        self.assertTupleEqual(tree.select(-2), (2, 'E'))
+        clone = tree.copy()
+        clone.insert(2, 'F')
+        self.assertEqual(tree.count(2), 3)
+        tree[2] = 'G'
+        self.assertFalse(tree.upsert(1, 'H'))
+        self.assertTrue(tree.upsert(0, 'I'))
+        check_buckets(tree)
+        self.assertListEqual(list(tree.values()), ['I', 'H', 'G', 'D'])
+        self.assertListEqual(tree.find_many([2, 4], 'Z'), ['G', 'Z'])
+        self.assertRaises(Exception, tree.remove_one, 4)
+
+    def test_pairs(self):
+        # Lookups return single values like find and select, missing keys give None, buckets can't be changed from outside
+        tree = MultiRBTree.MultiRBTree.from_unsorted([(1, 'a'), (1, 'b'), (3, 'c'), (3, 'd')])
+        self.assertIsNone(tree.find(2))
+        self.assertIsNone(tree[2])
+        self.assertTupleEqual(tree.min(), (1, 'a'))
+        self.assertTupleEqual(tree.max(), (3, 'd'))
+        self.assertTupleEqual(tree.floor(2), (1, 'a'))
+        self.assertTupleEqual(tree.ceiling(2), (3, 'c'))
+        self.assertIsNone(tree.higher(3))
+        tree.get_all(1).append('x')
+        tree.get_values()[0].append('x')
+        self.assertEqual(tree.count(1), 2)
+        self.assertTupleEqual(tree.pop_max(), (3, 'd'))
+        self.assertTupleEqual(tree.pop_min(), (1, 'a'))
+        self.assertTupleEqual(tree.pop_min(), (1, 'b'))
+        self.assertListEqual(list(tree.items()), [(3, 'c')])
+        check_buckets(tree)
+
+
+def check_ends(tree, node=None):
+    # Check the biggest end of every subtree and return it
+    if node is None:
+        node = tree.root
+    if node == tree.nil:
+        return None
+    high = max(end for end in (node.key[1], check_ends(tree, node.left), check_ends(tree, node.right)) if end is not None)
+    assert node.high == high
+    return high
+
+
+class TestInterval(unittest.TestCase):
+
+    def test_random(self):
+        # Overlap and stab queries match brute force after insertions and deletions
+        rnd = random.Random(22)
+        tree = IntervalRBTree.IntervalRBTree()
+        intervals = {}
+        for i in range(600):
+            start = rnd.randrange(200)
+            key = (start, start + rnd.randrange(30))
+            if key in intervals and rnd.random() < 0.7:
+                tree.remove(key)
+                del intervals[key]
+            elif key not in intervals:
+                tree.insert(key, i)
+                intervals[key] = i
+            if i % 50 == 0:
+                black_height(tree)
+                check_ends(tree)
+        black_height(tree)
+        check_ends(tree)
+        for _ in range(100):
+            lo = rnd.randrange(-10, 240)
+            hi = lo + rnd.randrange(20)
+            expected = sorted((key, value) for key, value in intervals.items() if key[0] <= hi and key[1] >= lo)
+            self.assertListEqual(list(tree.overlap_items(lo, hi)), expected)
+            self.assertListEqual(list(tree.stab(lo)), sorted(key for key in intervals if key[0] <= lo <= key[1]))
+        self.assertEqual(tree.max_end(), max(key[1] for key in intervals))
+
+    def test_bulk(self):
+        # Sorted intervals are loaded in O(n) with valid ends, bad intervals are rejected
+        tree = IntervalRBTree.IntervalRBTree.from_sorted(((k, k + 5), str(k)) for k in range(0, 100, 2))
+        black_height(tree)
+        check_ends(tree)
+        self.assertListEqual(list(tree.stab(11)), [(6, 11), (8, 13), (10, 15)])
+        self.assertListEqual(list(tree.overlap(200, 300)), [])
+        self.assertListEqual(list(IntervalRBTree.IntervalRBTree().stab(1)), [])
+        self.assertRaises(Exception, tree.insert, (5, 1), None)
+        tree.remove((6, 11))
+        check_ends(tree)
+        self.assertListEqual(list(tree.stab(11)), [(8, 13), (10, 15)])
+
+
+class TestExpiring(unittest.TestCase):
+
+    def test_expire(self):
+        # expire deletes exactly the pairs with passed deadlines and reports them in deadline order
+        rnd = random.Random(23)
+        now = [0.0]
+        expired = []
+        tree = ExpiringRBTree.ExpiringRBTree(ttl=10, clock=lambda: now[0], on_expire=lambda key, value: expired.append(key))
+        deadlines = {}
+        for i in range(500):
+            key = rnd.randrange(300)
+            ttl = rnd.choice([None, 1, 5, 20])
+            tree.upsert(key, i, ttl)
+            deadlines[key] = now[0] + (10 if ttl is None else ttl)
+            now[0] += 0.1
+        tree.insert(1000, 'forever', float('inf'))
+        for step in (3, 10, 30, 60):
+            now[0] = step
+            expected = sorted((deadline, key) for key, deadline in deadlines.items() if deadline <= step)
+            expired.clear()
+            self.assertListEqual([key for key, value in tree.expire()], [key for deadline, key in expected])
+            self.assertListEqual(expired, [key for deadline, key in expected])
+            for deadline, key in expected:
+                del deadlines[key]
+            self.assertListEqual(list(tree), sorted(deadlines) + [1000])
+            black_height(tree.tree)
+        self.assertEqual(tree[1000], 'forever')
+        self.assertEqual(tree.next_deadline(), min(deadlines.values()))
+
+    def test_touch(self):
+        # Touched and assigned pairs keep living, removed pairs leave the deadline tree
+        now = [0]
+        tree = ExpiringRBTree.ExpiringRBTree(clock=lambda: now[0])
+        tree.insert('a', 1, 5)
+        tree.insert('b', 2, 5)
+        tree.insert('c', 3)
+        self.assertRaises(Exception, tree.insert, 'a', 0)
+        now[0] = 4
+        tree.touch('a', 5)
+        tree['b'] = 20
+        tree.remove('c')
+        self.assertEqual(tree.deadline('a'), 9)
+        self.assertIsNone(tree.find('c'))
+        self.assertIsNone(tree['c'])
+        self.assertEqual(tree.next_deadline(), 5)
+        self.assertListEqual(tree.expire(5), [('b', 20)])
+        self.assertListEqual(tree.expire(8), [])
+        self.assertListEqual(tree.expire(9), [('a', 1)])
+        self.assertEqual(len(tree), 0)
+        self.assertEqual(len(tree.deadlines), 0)
+
+    def test_sweeper(self):
+        # Background sweeper deletes expired pairs by itself
+        with ExpiringRBTree.ExpiringRBTree(ttl=0, sweep_interval=0.01) as tree:
+            for key in range(100):
+                tree.insert(key, key)
+            for _ in range(500):
+                if len(tree) == 0:
+                    break
+                threading.Event().wait(0.01)
+            self.assertEqual(len(tree), 0)
+
+    def test_iterate_while_sweeping(self):
+        # Iteration sees a consistent set of keys while the sweeper deletes pairs
+        with ExpiringRBTree.ExpiringRBTree(sweep_interval=0.001) as tree:
+            for key in range(2000):
+                tree.insert(key, key, ttl=random.random() / 20)
+            while len(tree):
+                keys = list(tree)
+                self.assertListEqual(keys, sorted(set(keys)))
+                self.assertTrue(all(key == value for key, value in tree.items()))
+
+
+def check_recency(tree):
+    # Check that recency list links every node once in both directions
+    forward = list(tree.recency())
+    assert forward == list(tree.recency(reverse=True))[::-1]
+    assert sorted(forward) == list(tree.items())
+    assert tree.total == sum(1 if tree.weight is None else tree.weight(key, value) for key, value in forward)
+    return forward
+
+
+class TestCached(unittest.TestCase):
+
+    def test_lru(self):
+        # LRU cache evicts the same keys as OrderedDict model
+        rnd = random.Random(24)
+        tree = CachedRBTree.CachedRBTree(50)
+        model = collections.OrderedDict()
+        for i in range(3000):
+            key = rnd.randrange(120)
+            op = rnd.random()
+            if op < 0.4:
+                tree.upsert(key, i)
+                model[key] = i
+                model.move_to_end(key)
+                if len(model) > 50:
+                    model.popitem(last=False)
+            elif op < 0.8:
+                self.assertEqual(tree.get(key), model.get(key))
+                if key in model:
+                    model.move_to_end(key)
+            elif key in model:
+                tree.remove(key)
+                del model[key]
+            if i % 100 == 0:
+                black_height(tree)
+                self.assertListEqual(check_recency(tree), list(model.items()))
+        self.assertListEqual(check_recency(tree), list(model.items()))
+        stats = tree.cache_stats()
+        self.assertEqual(stats['size'], len(model))
+        self.assertGreater(stats['evictions'], 0)
+        self.assertGreater(stats['hits'], 0)
+        self.assertGreater(stats['misses'], 0)
+
+    def test_lfu(self):
+        # LFU cache evicts the least used key, the oldest one among equally used
+        tree = CachedRBTree.CachedRBTree(3, 'lfu')
+        tree.insert_many([(k, str(k)) for k in range(3)])
+        tree.find(0)
+        tree.find(0)
+        tree.find(2)
+        tree.insert(3, '3')
+        self.assertListEqual(list(tree.keys()), [0, 2, 3])
+        tree.insert(4, '4')
+        self.assertListEqual(list(tree.keys()), [0, 2, 4])
+        tree.remove(0)
+        check_recency(tree)
+        self.assertListEqual([node.key for node in tree.index.values()], [4, 2])
+        tree = CachedRBTree.CachedRBTree(3, 'lfu')
+        tree.insert_many([(k, k) for k in range(3)])
+        for key in range(3):
+            tree.find(key)
+        tree.insert(99, 99) # New pair is not evicted by itself
+        self.assertListEqual(list(tree.keys()), [1, 2, 99])
+        tree.upsert(100, 100) # Unused 99 goes first
+        self.assertListEqual(list(tree.keys()), [1, 2, 100])
+        tree = CachedRBTree.CachedRBTree.from_sorted(((k, k) for k in range(10)), capacity=4, policy='lfu')
+        self.assertEqual(len(tree), 4)
+        check_recency(tree)
+
+    def test_size(self):
+        # Size policy evicts the heaviest pairs until the rest fits
+        tree = CachedRBTree.CachedRBTree(10, 'size', weight=lambda key, value: len(value))
+        for key, value in [('a', 'xx'), ('b', 'xxxxx'), ('c', 'x'), ('d', 'xxx')]:
+            tree.insert(key, value)
+        self.assertListEqual(list(tree.keys()), ['a', 'c', 'd'])
+        tree['a'] = 'xxxxxxx'
+        self.assertListEqual(list(tree.keys()), ['c', 'd'])
+        self.assertEqual(tree.total, 4)
+        self.assertRaises(Exception, tree.insert, 'e', 'x' * 11)
+        clone = copy.deepcopy(tree)
+        self.assertListEqual(check_recency(clone), check_recency(tree))
+        self.assertListEqual(list(CachedRBTree.CachedRBTree(1).recency()), [])
+
+    def test_unsupported(self):
+        # Operations that would share or mix recency lists fail before changing the caches
+        a = CachedRBTree.CachedRBTree(20)
+        b = CachedRBTree.CachedRBTree(20)
+        a.insert_many([(k, k) for k in range(10)])
+        b.insert_many([(k, k) for k in range(10, 20)])
+        for operation in (a.union, a.intersection, a.difference, a.symmetric_difference):
+            self.assertRaises(Exception, operation, b)
+        self.assertRaises(Exception, a.split, 5)
+        self.assertRaises(Exception, CachedRBTree.CachedRBTree.join, a, 50, 50, b)
+        self.assertListEqual(check_recency(a), [(k, k) for k in range(10)])
+        self.assertListEqual(check_recency(b), [(k, k) for k in range(10, 20)])
+
+
+def check_index(tree):
+    # Check that index maps every key to its node and nothing else
+    assert tree.index == {node.key: node for node in tree.nodes()}
+
+
+class TestHashed(unittest.TestCase):
+
+    def test_random(self):
+        # Index follows insertions, deletions of nodes with two children and root, and bulk operations
+        rnd = random.Random(25)
+        tree = HashedRBTree.HashedRBTree()
+        pairs = {}
+        for i in range(2000):
+            key = rnd.randrange(300)
+            op = rnd.random()
+            if op < 0.4:
+                self.assertEqual(tree.upsert(key, i), key not in pairs)
+                pairs[key] = i
+            elif op < 0.5 and pairs:
+                self.assertEqual(tree.pop_min(), min(pairs.items()))
+                del pairs[min(pairs)]
+            elif key in pairs:
+                del tree[key]
+                del pairs[key]
+            else:
+                self.assertRaises(Exception, tree.remove, key)
+            if i % 100 == 0 and pairs:
+                black_height(tree)
+                check_index(tree)
+        check_index(tree)
+        keys = [rnd.randrange(300) for _ in range(50)]
+        self.assertListEqual(tree.find_many(keys, -1), [pairs.get(key, -1) for key in keys])
+        expected = []
+        for key in keys[:25]: # Repeated key is found only once
+            expected.append(pairs.pop(key, None) is not None)
+        self.assertListEqual(tree.remove_many(keys[:25]), expected)
+        tree.insert_many([(k, k) for k in range(300, 320)])
+        pairs.update((k, k) for k in range(300, 320))
+        self.assertListEqual(tree.update_many([(300, 'a'), (999, 'b')]), [True, False])
+        pairs[300] = 'a'
+        check_index(tree)
+        self.assertListEqual(list(tree.items()), sorted(pairs.items()))
+        tree.clear()
+        self.assertEqual(tree.index, {})
+        self.assertNotIn(300, tree)
+
+    def test_copy_split(self):
+        # Copies, halves of split, joins and set operations get their own valid indexes
+        tree = HashedRBTree.HashedRBTree.from_sorted((k, k) for k in range(100))
+        check_index(tree)
+        clone = tree.copy()
+        deep = copy.deepcopy(tree)
+        clone.remove(5)
+        self.assertIn(5, tree)
+        self.assertIn(5, deep)
+        check_index(clone)
+        check_index(deep)
+        left, right = tree.split(50)
+        check_index(left)
+        check_index(right)
+        self.assertNotIn(50, left)
+        self.assertEqual(right[50], 50)
+        joined = HashedRBTree.HashedRBTree.join(left, 100, 100, HashedRBTree.HashedRBTree.from_sorted((k, k) for k in range(101, 110)))
+        check_index(joined)
+        joined.union(right)
+        joined.difference(HashedRBTree.HashedRBTree.from_sorted((k, None) for k in range(0, 110, 2)))
+        check_index(joined)
+        self.assertListEqual(list(joined), list(range(1, 110, 2)))
+
+    def test_set_operations(self):
+        # Set operations keep the index valid without rebuilding it
+        rnd = random.Random(26)
+        for operation, expected in (('union', set.union), ('intersection', set.intersection), ('difference', set.difference), ('symmetric_difference', set.symmetric_difference)):
+            for _ in range(20):
+                a = set(rnd.sample(range(200), rnd.randrange(100)))
+                b = set(rnd.sample(range(200), rnd.randrange(100)))
+                tree = HashedRBTree.HashedRBTree.from_sorted((k, 'a') for k in sorted(a))
+                other = HashedRBTree.HashedRBTree.from_sorted((k, 'b') for k in sorted(b))
+                getattr(tree, operation)(other)
+                check_index(tree)
+                self.assertListEqual(list(tree), sorted(expected(a, b)))
+                self.assertEqual(other.index, {})